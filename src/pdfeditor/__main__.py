@@ -1,7 +1,21 @@
+import argparse
 from pdf_editor import PdfEditor
+from profiling import Profiler, set_profiler, PROFILE_ENV_VAR
 
 def main():
-    with PdfEditor() as pdf_editor_app:
+    parser = argparse.ArgumentParser(prog="pdfeditor")
+    parser.add_argument("--profile", metavar="PATH",
+        help=("Record metrics of each operation and export them to PATH on exit "
+              "(JSON lines, or a cProfile dump if PATH ends in '.prof'). "
+              f"Can also be set with the {PROFILE_ENV_VAR} environment variable."))
+    parser.add_argument("--max-memory", metavar="MB", type=int,
+        help="Evict parsed pdfs that were not used recently once they take about MB megabytes of memory.")
+    args = parser.parse_args()
+    if args.profile:
+        set_profiler(Profiler(args.profile))
+
+    max_memory = args.max_memory * 1024 * 1024 if args.max_memory else None
+    with PdfEditor(max_memory) as pdf_editor_app:
         pdf_editor_app.run()
 
     
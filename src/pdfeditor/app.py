@@ -1,3 +1,5 @@
+from profiling import get_profiler
+
 # Set indexing base, e.g., zero-based indexing, one-based indexing, etc...
 OFFSET = 1
         
@@ -82,7 +84,11 @@ class Action:
         self.func = func
 
     def execute(self, *args, **kwargs):
-        return self.func(*args, **kwargs)
+        profiler = get_profiler()
+        if not profiler.enabled:
+            return self.func(*args, **kwargs)
+        with profiler.operation("action", label=self.label):
+            return self.func(*args, **kwargs)
 
 
 class Loop:
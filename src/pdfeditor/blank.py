@@ -0,0 +1,173 @@
+import os, re
+from concurrent.futures import ProcessPoolExecutor
+from pypdf.generic import ArrayObject
+from pool import get_source_pool, worker_options
+
+try:
+    import PIL
+except ImportError:
+    # Without Pillow, images that need a codec (JPEG, JBIG2, ...) are never judged blank.
+    PIL = None
+
+BLANK, NOT_BLANK, AMBIGUOUS = ("blank", "not blank", "ambiguous")
+
+# Operators that put text or vector marks on a page.
+MARK_OPERATORS = {b"Tj", b"TJ", b"'", b'"', b"f", b"F", b"f*", b"B", b"B*", b"b", b"b*",
+                  b"S", b"s", b"sh", b"BI"}
+# Images storing more than this many compressed bytes per pixel surely show something.
+MAX_BLANK_BYTES_PER_PIXEL = 0.05
+# Channel values at or above this level count as white.
+WHITE_LEVEL = 230
+# Largest fraction of non-white samples in an image that still counts as blank.
+MAX_INK_FRACTION = 0.005
+CODEC_FILTERS = {"/DCTDecode", "/JPXDecode", "/CCITTFaxDecode", "/JBIG2Decode"}
+
+_STRINGS = re.compile(rb"\((?:\\.|[^\\)])*\)|<[0-9A-Fa-f\s]*>")
+_NAMES = re.compile(rb"/[^\s/\[\]()<>{}%]*")
+_OPERATORS = re.compile(rb"[A-Za-z'\"][A-Za-z*'\"0-9]*")
+
+
+def page_content(page):
+    """Return the decoded content of ``page``, with all of its content streams joined."""
+    contents = page.get("/Contents")
+    if contents is None:
+        return b""
+    contents = contents.get_object()
+    streams = contents if isinstance(contents, ArrayObject) else [contents]
+    return b"\n".join(stream.get_object().get_data() for stream in streams)
+
+
+def content_operators(content):
+    """Return the operators of ``content``, ignoring strings and names that could look like operators."""
+    content = _NAMES.sub(b" ", _STRINGS.sub(b" ", content))
+    return _OPERATORS.findall(content)
+
+
+def classify_page(page):
+    """
+    Judge whether ``page`` is blank from its structure alone, without decoding images.
+
+    Returns:
+        A tuple in the format: (verdict, images). ``verdict`` is one of ``BLANK``,
+        ``NOT_BLANK`` or ``AMBIGUOUS``; ``images`` lists the names of the image
+        XObjects to check when the verdict is ``AMBIGUOUS``.
+    """
+    content = page_content(page)
+    operators = content_operators(content)
+    if any(op in MARK_OPERATORS for op in operators):
+        return NOT_BLANK, []
+    if b"Do" not in operators:
+        return BLANK, []
+
+    content = _STRINGS.sub(b" ", content)
+    names = [name.decode("latin-1") for name in re.findall(rb"(/[^\s/\[\]()<>{}%]*)\s*Do\b", content)]
+    xobjects = page.get("/Resources", {}).get("/XObject", {})
+    for name in names:
+        xobject = xobjects.get(name)
+        if xobject is None:
+            continue
+        xobject = xobject.get_object()
+        if xobject.get("/Subtype") != "/Image":
+            return NOT_BLANK, []
+        pixels = max(1, xobject.get("/Width", 1) * xobject.get("/Height", 1))
+        if len(xobject._data) / pixels > MAX_BLANK_BYTES_PER_PIXEL:
+            return NOT_BLANK, []
+
+    return AMBIGUOUS, names
+
+
+def image_is_blank(xobject):
+    """Decode an image XObject and return whether nearly all of it is white."""
+    filters = xobject.get("/Filter", [])
+    filters = [filters] if not isinstance(filters, ArrayObject) else list(filters)
+    if xobject.get("/ImageMask"):
+        return False
+
+    if CODEC_FILTERS.intersection(filters):
+        return _pil_image_is_blank(xobject)
+
+    bits = xobject.get("/BitsPerComponent", 8)
+    color_space = xobject.get("/ColorSpace")
+    color_space = color_space.get_object() if color_space is not None else None
+    inverted = list(xobject.get("/Decode", [0, 1]))[:2] == [1, 0]
+    data = xobject.get_data()
+    if not data:
+        return True
+
+    if bits == 1:
+        ones = int.from_bytes(data, "big").bit_count()
+        ink = ones if inverted else len(data)*8 - ones
+        # Rows are padded to whole bytes, which can only overstate the ink.
+        return ink / (xobject["/Width"] * xobject["/Height"]) <= MAX_INK_FRACTION
+
+    if bits == 8 and color_space in ("/DeviceGray", "/DeviceRGB", "/DeviceCMYK"):
+        white_bytes = bytes(range(WHITE_LEVEL, 256))
+        if (color_space == "/DeviceCMYK") != inverted:
+            white_bytes = bytes(range(0, 256 - WHITE_LEVEL))
+        ink = len(data.translate(None, white_bytes))
+        return ink / len(data) <= MAX_INK_FRACTION
+
+    return _pil_image_is_blank(xobject)
+
+
+def _pil_image_is_blank(xobject):
+    if PIL is None:
+        return False
+    try:
+        histogram = xobject.decode_as_image().convert("L").histogram()
+    except Exception:
+        return False
+    return sum(histogram[:WHITE_LEVEL]) / max(1, sum(histogram)) <= MAX_INK_FRACTION
+
+
+def page_is_blank(page, images=None):
+    """Return whether ``page`` is blank, decoding its images only if its structure is ambiguous."""
+    if images is None:
+        verdict, images = classify_page(page)
+        if verdict != AMBIGUOUS:
+            return verdict == BLANK
+
+    xobjects = page["/Resources"]["/XObject"]
+    return all(image_is_blank(xobjects[name].get_object()) for name in images if name in xobjects)
+
+
+def check_source_pages(path, indices):
+    """Return a dict of whether specified pages of the pdf at ``path`` are blank, keyed by page index."""
+    reader = get_source_pool().get(path)[0]
+    return {i: page_is_blank(reader.pages[i]) for i in indices}
+
+
+def check_sources(jobs, max_workers=None):
+    """
+    Run ``check_source_pages`` for several pdfs concurrently on a process pool.
+
+    Large sources are split into chunks so a single big scan also uses every worker.
+
+    Args:
+        jobs: A dict of lists of page indices keyed by path.
+        max_workers: Maximum number of processes. Defaults to None.
+            If None, one process per CPU is used.
+
+    Returns:
+        A dict of whether each page is blank keyed by ``(path, index)``.
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    chunks = []
+    for path, indices in jobs.items():
+        indices = sorted(indices)
+        size = max(1, -(-len(indices) // max_workers))
+        chunks += [(path, indices[i:i+size]) for i in range(0, len(indices), size)]
+
+    results = {}
+    if max_workers <= 1 or len(chunks) <= 1:
+        for path, indices in chunks:
+            results.update({(path, i): blank for i, blank in check_source_pages(path, indices).items()})
+        return results
+
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(chunks)), **worker_options()) as executor:
+        futures = [(path, executor.submit(check_source_pages, path, indices)) for path, indices in chunks]
+        for path, future in futures:
+            results.update({(path, i): blank for i, blank in future.result().items()})
+    return results
@@ -0,0 +1,149 @@
+import hashlib, os
+from concurrent.futures import ProcessPoolExecutor
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+from impose import visible_box
+from pool import get_source_pool, worker_options
+
+# Keys that only link an object into its document and say nothing about how it looks.
+IGNORED_KEYS = {"/Parent", "/Length", "/StructParents", "/Annots"}
+# Keys of annotations that link them to their page, other annotations or the structure tree.
+ANNOTATION_LINKS = {"/P", "/Parent", "/Popup", "/IRT", "/StructParent"}
+
+
+def content_digest(page, memo=None):
+    """
+    Return a digest of how ``page`` draws: its decoded content, the resources it uses and its annotations.
+
+    Resources and annotations are hashed by value, so identical pages from
+    different files get the same digest, while pages that differ only in a
+    form field, comment or highlight do not. ``memo`` caches digests of shared
+    objects between calls.
+    """
+    if memo is None:
+        memo = {}
+    digest = hashlib.blake2b(digest_size=16)
+
+    contents = page.get("/Contents")
+    contents = contents.get_object() if contents is not None else None
+    streams = contents if isinstance(contents, ArrayObject) else [contents] if contents is not None else []
+    for stream in streams:
+        digest.update(stream.get_object().get_data())
+
+    digest.update(b"\0R")
+    digest.update(_object_digest(page.get("/Resources"), memo))
+    annots = page.get("/Annots")
+    for annot in annots.get_object() if annots is not None else []:
+        annot = annot.get_object()
+        digest.update(b"\0A")
+        for key in sorted(annot.keys()):
+            if key not in ANNOTATION_LINKS:
+                digest.update(key.encode())
+                digest.update(_object_digest(annot.raw_get(key), memo))
+    return digest.digest()
+
+
+def geometry_digest(page):
+    """Return a digest of the visible box and rotation of ``page``."""
+    box = visible_box(page)
+    unit = float(page.get("/UserUnit", 1))
+    geometry = (round(float(box.width) * unit, 3), round(float(box.height) * unit, 3), page.get("/Rotate", 0) % 360)
+    return repr(geometry).encode()
+
+
+def page_fingerprint(content, geometry):
+    """Combine a content digest and a geometry digest into a page fingerprint."""
+    return hashlib.blake2b(content + b"\0G" + geometry, digest_size=16).hexdigest()
+
+
+def value_digest(obj, memo=None):
+    """
+    Return a digest of ``obj`` by value, following its references.
+
+    Unlike ``content_digest`` only /Parent is left out, so anything that is
+    written differently gets a different digest. ``memo`` caches digests of
+    shared objects between calls; do not share it with ``content_digest``.
+    """
+    return _object_digest(obj, {} if memo is None else memo, {"/Parent"})
+
+
+def _object_digest(obj, memo, ignored=IGNORED_KEYS):
+    key = None
+    if isinstance(obj, IndirectObject):
+        key = (id(obj.pdf), obj.idnum, obj.generation)
+        if key in memo:
+            return memo[key]
+        # Guard against reference cycles, e.g. a resource pointing back to its page.
+        memo[key] = b"cycle"
+        obj = obj.get_object()
+
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(obj, StreamObject):
+        digest.update(b"S")
+        digest.update(obj._data)
+    if isinstance(obj, DictionaryObject):
+        digest.update(b"D")
+        for k in sorted(obj.keys()):
+            if k in ignored:
+                continue
+            digest.update(k.encode())
+            digest.update(_object_digest(obj.raw_get(k), memo, ignored))
+    elif isinstance(obj, ArrayObject):
+        digest.update(b"A")
+        for item in obj:
+            digest.update(_object_digest(item, memo, ignored))
+    elif not isinstance(obj, StreamObject):
+        digest.update(type(obj).__name__.encode())
+        digest.update(repr(obj).encode())
+
+    if key is not None:
+        memo[key] = digest.digest()
+    return digest.digest()
+
+
+def fingerprint_source(path, indices):
+    """
+    Return ``(content, geometry)`` digests of specified pages of the pdf at ``path``.
+
+    Returns:
+        A dict keyed by page index.
+    """
+    reader = get_source_pool().get(path)[0]
+    memo = {}
+    return {i: (content_digest(reader.pages[i], memo), geometry_digest(reader.pages[i]))
+            for i in indices}
+
+
+def fingerprint_sources(jobs, max_workers=None):
+    """
+    Run ``fingerprint_source`` for several pdfs concurrently on a process pool.
+
+    Large sources are split into chunks so a single big packet also uses every worker.
+
+    Args:
+        jobs: A dict of lists of page indices keyed by path.
+        max_workers: Maximum number of processes. Defaults to None.
+            If None, one process per CPU is used.
+
+    Returns:
+        A dict of ``fingerprint_source`` results keyed by path.
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    chunks = []
+    for path, indices in jobs.items():
+        indices = sorted(indices)
+        size = max(1, -(-len(indices) // max_workers))
+        chunks += [(path, indices[i:i+size]) for i in range(0, len(indices), size)]
+
+    results = {path: {} for path in jobs}
+    if max_workers <= 1 or len(chunks) <= 1:
+        for path, indices in chunks:
+            results[path].update(fingerprint_source(path, indices))
+        return results
+
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(chunks)), **worker_options()) as executor:
+        futures = [(path, executor.submit(fingerprint_source, path, indices)) for path, indices in chunks]
+        for path, future in futures:
+            results[path].update(future.result())
+    return results
@@ -0,0 +1,159 @@
+from pypdf import PageObject, Transformation
+from pypdf.generic import (ArrayObject, DecodedStreamObject, DictionaryObject, EncodedStreamObject,
+                           FloatObject, NameObject, RectangleObject)
+
+LEFT, BOTTOM, RIGHT, TOP = (0, 1, 2, 3)
+STREAM_KEYS = ("/Filter", "/DecodeParms")
+
+# Matrices that map a page's box, moved to the origin, into its displayed orientation.
+# Keyed by /Rotate, each takes the box's (width, height).
+ROTATION_MATRICES = {
+    0: lambda w, h: (1, 0, 0, 1, 0, 0),
+    90: lambda w, h: (0, -1, 1, 0, 0, w),
+    180: lambda w, h: (-1, 0, 0, -1, w, h),
+    270: lambda w, h: (0, 1, -1, 0, h, 0),
+}
+
+
+def grid_cells(sheet_size, rows, cols, margin=(0, 0, 0, 0), gap=0):
+    """
+    Return the cells of a grid on a sheet, left to right then top to bottom.
+
+    Args:
+        sheet_size: A tuple of sheet dimensions in the format: (width, height).
+        rows: Number of rows.
+        cols: Number of columns.
+        margin: A tuple of blank space around the grid in the format:
+            (left, bottom, right, top).
+        gap: Blank space between neighbouring cells.
+
+    Returns:
+        A list of ``rows*cols`` tuples in the format: (x, y, width, height).
+    """
+    assert rows > 0 and cols > 0
+    width = (sheet_size[0] - margin[LEFT] - margin[RIGHT] - gap*(cols-1)) / cols
+    height = (sheet_size[1] - margin[BOTTOM] - margin[TOP] - gap*(rows-1)) / rows
+    if width <= 0 or height <= 0:
+        raise ValueError("margin and gap leave no room on the sheet")
+
+    cells = []
+    for row in range(rows):
+        y = sheet_size[1] - margin[TOP] - (row+1)*height - row*gap
+        for col in range(cols):
+            x = margin[LEFT] + col*(width + gap)
+            cells.append((x, y, width, height))
+    return cells
+
+
+def booklet_order(num_pages):
+    """
+    Return page indices of a saddle-stitch booklet, two per sheet side.
+
+    The page count is padded to a multiple of 4 with None (blank) entries.
+    Each pair is one side of a sheet in the format: (left, right), and sides
+    alternate front/back, so folding the printed stack gives pages in order.
+
+    >>> booklet_order(4)
+    [(3, 0), (1, 2)]
+    """
+    padded = num_pages + (-num_pages % 4)
+
+    def page(i):
+        return i if i < num_pages else None
+
+    sides = []
+    for i in range(padded // 4):
+        sides.append((page(padded-1 - 2*i), page(2*i)))
+        sides.append((page(2*i + 1), page(padded-2 - 2*i)))
+    return sides
+
+
+def visible_box(page):
+    """Return the part of ``page`` a viewer shows: its crop box clipped to its media box."""
+    media = page.mediabox
+    # Reading ``cropbox`` of a page without one would add one to it.
+    crop = page.cropbox if "/CropBox" in page else media
+    return RectangleObject((
+        max(media.left, crop.left), max(media.bottom, crop.bottom),
+        min(media.right, crop.right), min(media.top, crop.top)))
+
+
+def page_to_xobject(page):
+    """
+    Return a form XObject that draws ``page``'s visible box.
+
+    A single encoded content stream is reused as-is, so the page's content is
+    neither decoded nor re-encoded. Resources are referenced, not copied.
+    """
+    contents = page.get("/Contents")
+    contents = contents.get_object() if contents is not None else None
+    if isinstance(contents, ArrayObject):
+        streams = [stream.get_object() for stream in contents]
+    else:
+        streams = [contents] if contents is not None else []
+
+    if len(streams) == 1 and isinstance(streams[0], EncodedStreamObject):
+        xobject = EncodedStreamObject()
+        xobject._data = streams[0]._data
+        for key in STREAM_KEYS:
+            if key in streams[0]:
+                xobject[NameObject(key)] = streams[0][key]
+    else:
+        xobject = DecodedStreamObject()
+        xobject.set_data(b"\n".join(stream.get_data() for stream in streams))
+
+    xobject[NameObject("/Type")] = NameObject("/XObject")
+    xobject[NameObject("/Subtype")] = NameObject("/Form")
+    xobject[NameObject("/BBox")] = visible_box(page)
+    xobject[NameObject("/Resources")] = page.get("/Resources", DictionaryObject())
+    return xobject
+
+
+def placement(page, cell):
+    """
+    Return the ``cm`` matrix that fits ``page``'s visible box, upright and centered, into ``cell``.
+
+    Args:
+        page: A PageObject object.
+        cell: A tuple in the format: (x, y, width, height).
+    """
+    box = visible_box(page)
+    width, height = float(box.width), float(box.height)
+    rotation = page.get("/Rotate", 0) % 360
+    shown = (height, width) if rotation in (90, 270) else (width, height)
+    factor = min(cell[2] / shown[0], cell[3] / shown[1])
+
+    ctm = (Transformation()
+        .translate(-float(box.left), -float(box.bottom))
+        .transform(Transformation(ROTATION_MATRICES[rotation](width, height)))
+        .scale(factor)
+        .translate(cell[0] + (cell[2] - factor*shown[0]) / 2,
+                   cell[1] + (cell[3] - factor*shown[1]) / 2))
+    return ctm.ctm
+
+
+def make_sheet(doc, sheet_size, placements):
+    """
+    Return a new page of ``doc`` that draws form XObjects at given positions.
+
+    Args:
+        doc: A PdfWriter object that owns the new page and its content stream.
+        sheet_size: A tuple of sheet dimensions in the format: (width, height).
+        placements: A list of tuples in the format: (xobject_reference, ctm).
+    """
+    xobjects = DictionaryObject()
+    operators = []
+    for i, (reference, ctm) in enumerate(placements):
+        name = f"/P{i}"
+        xobjects[NameObject(name)] = reference
+        matrix = " ".join(f"{FloatObject(value)}" for value in ctm)
+        operators.append(f"q {matrix} cm {name} Do Q")
+
+    content = DecodedStreamObject()
+    content.set_data("\n".join(operators).encode())
+
+    sheet = PageObject.create_blank_page(doc, *sheet_size)
+    sheet[NameObject("/Resources")] = DictionaryObject({NameObject("/XObject"): xobjects})
+    sheet[NameObject("/Contents")] = doc._add_object(content)
+    doc._add_object(sheet)
+    return sheet
@@ -0,0 +1,240 @@
+import copy, os
+from io import BytesIO
+from pypdf.generic import (ArrayObject, ByteStringObject, DictionaryObject, IndirectObject, NameObject,
+                           NumberObject, StreamObject)
+from shard import pdf_version
+
+# Page attributes a page may inherit from its ancestors in the page tree.
+INHERITED_KEYS = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+
+def write_increment(reader, pages, stream, startxref=None, size=None, navigation=None):
+    """
+    Append an incremental update to ``stream`` so the document of ``reader`` shows ``pages``.
+
+    Only the page tree root, pages whose dictionaries were edited and objects
+    new to the edit are written, followed by a cross-reference section that
+    points back at the previous one. The update is written at the end of
+    ``stream``, which must already hold the bytes of the document.
+
+    Args:
+        reader: The PdfReader object of the document being updated.
+        pages: A list of PageObject objects of ``reader``, or edited copies of them.
+        stream: A seekable binary stream.
+        startxref: Offset of the newest cross-reference section of the document.
+            Defaults to None. If None, the one ``reader`` was parsed from is used.
+        size: The /Size of the newest trailer of the document. Defaults to None.
+            If None, the one ``reader`` was parsed from is used.
+        navigation: A Navigation object of ``pages`` whose outline and named
+            destinations replace those of the document. Defaults to None.
+            If None, the document catalog is left as it is.
+
+    Returns:
+        A tuple in the format: (startxref, size), describing the document after
+        the update, to pass when appending another update.
+
+    Raises:
+        ValueError: If the document is encrypted or a page appears more than once.
+    """
+    if reader.is_encrypted:
+        raise ValueError("incremental saves of encrypted pdfs are not supported")
+    numbers = [page.indirect_reference.idnum for page in pages]
+    if len(set(numbers)) != len(numbers):
+        raise ValueError("incremental saves cannot repeat a page")
+
+    if startxref is None:
+        startxref = reader._startxref
+    if size is None:
+        size = reader.trailer["/Size"]
+
+    update = _Update(reader, size)
+    tree_reference = reader.root_object.raw_get("/Pages")
+    tree = DictionaryObject(tree_reference.get_object())
+    tree[NameObject("/Kids")] = ArrayObject(page.indirect_reference for page in pages)
+    tree[NameObject("/Count")] = NumberObject(len(pages))
+    update.replace(tree_reference, tree)
+    # A header cannot be changed by an update, so a newer version is declared in the catalog.
+    declared = max(reader.pdf_header[5:], str(reader.root_object.get("/Version", "")).lstrip("/"))
+    version = pdf_version(pages, [declared])
+    if navigation is not None or version != declared:
+        catalog = DictionaryObject(reader.root_object)
+        if navigation is not None:
+            _replace_navigation(update, catalog, navigation, [page.indirect_reference for page in pages])
+        if version != declared:
+            catalog[NameObject("/Version")] = NameObject(f"/{version}")
+        update.replace(reader.trailer.raw_get("/Root"), catalog)
+
+    for page in pages:
+        original = page.indirect_reference.get_object()
+        parent = original.raw_get("/Parent")
+        moved = parent.idnum != tree_reference.idnum
+        if not moved and not _edited(page, original):
+            continue
+
+        new_page = DictionaryObject(page)
+        new_page[NameObject("/Parent")] = tree_reference
+        if moved:
+            # The page leaves its intermediate nodes behind, so it must own what it inherited from them.
+            while parent is not None and parent.idnum != tree_reference.idnum:
+                node = parent.get_object()
+                for key in INHERITED_KEYS:
+                    if key in node and key not in new_page:
+                        new_page[NameObject(key)] = node.raw_get(key)
+                parent = node.raw_get("/Parent") if "/Parent" in node else None
+        update.replace(page.indirect_reference, new_page)
+
+    trailer = DictionaryObject({
+        NameObject("/Size"): NumberObject(update.size),
+        NameObject("/Root"): reader.trailer.raw_get("/Root"),
+        NameObject("/Prev"): NumberObject(startxref),
+    })
+    if "/Info" in reader.trailer:
+        trailer[NameObject("/Info")] = reader.trailer.raw_get("/Info")
+    if "/ID" in reader.trailer:
+        file_id = reader.trailer["/ID"]
+        trailer[NameObject("/ID")] = ArrayObject([file_id[0], ByteStringObject(os.urandom(16))])
+
+    # Everything is read from ``reader`` by now, which may share ``stream``.
+    start = stream.seek(0, os.SEEK_END) + 1
+    body = BytesIO()
+    offsets = {}
+    for reference, obj in update.objects:
+        offsets[reference.idnum] = (start + body.tell(), reference.generation)
+        body.write(f"{reference.idnum} {reference.generation} obj\n".encode())
+        obj.write_to_stream(body)
+        body.write(b"\nendobj\n")
+
+    xref_offset = start + body.tell()
+    body.write(_xref(offsets))
+    body.write(b"trailer\n")
+    trailer.write_to_stream(body)
+    body.write(f"\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+    stream.write(b"\n" + body.getvalue())
+    return xref_offset, update.size
+
+
+class _Update:
+    """Objects of an incremental update, in the order they are written."""
+
+    def __init__(self, reader, size):
+        self.reader = reader
+        self.size = size
+        self.objects = []
+        self._imported = {}
+
+
+    def replace(self, reference, obj):
+        """Write ``obj`` in place of the object at ``reference``."""
+        self.objects.append((reference, self._lift_streams(_copy(obj))))
+
+
+    def add(self, obj):
+        """Write ``obj`` as a new object and return a reference to it."""
+        reference = IndirectObject(self.size, 0, None)
+        self.size += 1
+        self.objects.append((reference, self._lift_streams(_copy(obj))))
+        return reference
+
+
+    def _lift_streams(self, obj):
+        """
+        Move streams held directly in ``obj``, e.g. rewritten content, into objects of their own.
+
+        Objects of other documents that ``obj`` refers to are copied into the update.
+        """
+        if isinstance(obj, DictionaryObject):
+            for key, value in list(obj.items()):
+                obj[key] = self._lift_direct(value)
+        elif isinstance(obj, ArrayObject):
+            for i, value in enumerate(obj):
+                obj[i] = self._lift_direct(value)
+        return obj
+
+
+    def _lift_direct(self, value):
+        if isinstance(value, StreamObject):
+            return self.add(value)
+        if isinstance(value, IndirectObject):
+            # References without a document are to objects of this update.
+            return value if value.pdf is self.reader or value.pdf is None else self._import(value)
+        return self._lift_streams(value)
+
+
+    def _import(self, reference):
+        """Write a copy of an object of another document, e.g. a shared stamp, once and return a reference to it."""
+        key = (id(reference.pdf), reference.idnum)
+        if key not in self._imported:
+            new_reference = self._imported[key] = IndirectObject(self.size, 0, None)
+            self.size += 1
+            self.objects.append((new_reference, self._lift_streams(_copy(reference.get_object()))))
+        return self._imported[key]
+
+
+def _replace_navigation(update, catalog, navigation, page_references):
+    """Replace the outline and named destinations of ``catalog`` with those of ``navigation``."""
+    added = []
+
+    def add(obj):
+        # Navigation changes objects after adding them, so they are only copied into the update at the end.
+        reference = IndirectObject(update.size, 0, None)
+        update.size += 1
+        added.append((reference, obj))
+        return reference
+
+    entries = DictionaryObject()
+    navigation.write(entries, add, page_references)
+    for key in ("/Outlines", "/Dests"):
+        catalog.pop(NameObject(key), None)
+    names = DictionaryObject(catalog["/Names"]) if "/Names" in catalog else DictionaryObject()
+    names.pop(NameObject("/Dests"), None)
+    if "/Names" in entries:
+        names[NameObject("/Dests")] = entries["/Names"].raw_get("/Dests")
+    if names:
+        catalog[NameObject("/Names")] = names
+    else:
+        catalog.pop(NameObject("/Names"), None)
+    if "/Outlines" in entries:
+        catalog[NameObject("/Outlines")] = entries.raw_get("/Outlines")
+    for reference, obj in added:
+        update.replace(reference, obj)
+
+
+def _copy(obj):
+    """Return a copy of ``obj`` that shares no dictionaries or arrays with it."""
+    if isinstance(obj, DictionaryObject):
+        new_obj = copy.copy(obj)
+        for key, value in obj.items():
+            new_obj[key] = _copy(value)
+        return new_obj
+    if isinstance(obj, ArrayObject):
+        return ArrayObject(_copy(item) for item in obj)
+    return obj
+
+
+def _edited(page, original):
+    """Whether the dictionary of ``page`` differs from that of ``original``."""
+    if page is original:
+        return False
+    keys = set(page.keys()) | set(original.keys())
+    for key in keys:
+        if key not in page or key not in original:
+            return True
+        value, original_value = page.raw_get(key), original.raw_get(key)
+        if value is not original_value and value != original_value:
+            return True
+    return False
+
+
+def _xref(offsets):
+    """Return a cross-reference table of ``offsets``, a dict of ``(offset, generation)`` keyed by number."""
+    lines = ["xref\n"]
+    numbers = sorted(offsets)
+    start = 0
+    while start < len(numbers):
+        end = start + 1
+        while end < len(numbers) and numbers[end] == numbers[end - 1] + 1:
+            end += 1
+        lines.append(f"{numbers[start]} {end - start}\n")
+        lines += [f"{offsets[num][0]:010} {offsets[num][1]:05} n \n" for num in numbers[start:end]]
+        start = end
+    return "".join(lines).encode()
@@ -0,0 +1,186 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError, as_completed
+from pool import password_for, worker_options
+from xref_cache import XrefCache, XrefReader
+
+class SourceInfo:
+    """
+    Result of parsing and validating a source pdf.
+
+    Attributes:
+        path: The path of the pdf.
+        num_pages: Number of pages in the pdf. None if the pdf failed to parse.
+        metadata: A dict of the pdf's document information as strings.
+        size: Size of the file in bytes.
+        mtime_ns: Modification time of the file when it was parsed.
+        error: A message describing why the pdf could not be read. None if it was read successfully.
+        xref_repaired: Whether the pdf's cross-reference table was rebuilt by scanning the file.
+        xref_restored: Whether the pdf's cross-reference table was taken from the cache of rebuilt ones.
+    """
+
+    def __init__(self, path, num_pages=None, metadata=None, size=None, mtime_ns=None, error=None,
+                 xref_repaired=False, xref_restored=False):
+        self.path = path
+        self.num_pages = num_pages
+        self.metadata = metadata or {}
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.error = error
+        self.xref_repaired = xref_repaired
+        self.xref_restored = xref_restored
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        if self.ok:
+            return f"SourceInfo({self.path!r}, num_pages={self.num_pages})"
+        return f"SourceInfo({self.path!r}, error={self.error!r})"
+
+
+def inspect_pdf(path):
+    """
+    Parse ``path`` and check every page can be read.
+
+    Errors are returned in the SourceInfo rather than raised, so one broken file
+    does not stop the others from being read.
+    """
+    try:
+        stat = os.stat(path)
+        reader = XrefReader(path, password=password_for(path), xrefs=XrefCache())
+        for page in reader.pages:
+            page.mediabox
+        metadata = {key: str(value) for key, value in (reader.metadata or {}).items()}
+        return SourceInfo(path, len(reader.pages), metadata, stat.st_size, stat.st_mtime_ns,
+                          xref_repaired=reader.xref_repaired, xref_restored=reader.xref_restored)
+    except Exception as e:
+        return SourceInfo(path, error=f"{type(e).__name__}: {e}")
+
+
+class Prefetch:
+    """
+    Parses and validates pdfs in the background as soon as it is created.
+
+    Files are submitted in order, so earlier files are ready first. With more
+    than one worker the files are read on a process pool, otherwise on a single
+    background thread.
+
+    Attributes:
+        paths: A list of paths of pdfs being read.
+        futures: A list of Future objects of SourceInfo objects in the same order as ``paths``.
+        on_result: A callable called with each SourceInfo the first time it is waited for.
+    """
+
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, paths, max_workers=None, on_result=None):
+        """
+        Initializes Prefetch object and starts reading ``paths``.
+
+        Args:
+            paths: A list of paths of pdfs.
+            max_workers: Maximum number of processes. Defaults to None.
+                If None, one process per CPU is used.
+            on_result: A callable taking a SourceInfo. Defaults to None.
+        """
+        self.paths = list(paths)
+        self.on_result = on_result
+        self._reported = set()
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        max_workers = max(1, min(max_workers, len(self.paths)))
+
+        if max_workers == 1:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        else:
+            self.executor = ProcessPoolExecutor(max_workers=max_workers, **worker_options())
+        self.futures = [self.executor.submit(inspect_pdf, path) for path in self.paths]
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def result(self, index, cancel=None):
+        """
+        Wait for and return the SourceInfo of the pdf at specified index of ``paths``.
+
+        Raises:
+            OperationCanceled: If ``cancel`` is cancelled while waiting.
+        """
+        future = self.futures[index]
+        while True:
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            try:
+                return self._report(index, future.result(timeout=self.POLL_INTERVAL))
+            except TimeoutError:
+                continue
+
+
+    def results(self, progress=None, cancel=None):
+        """
+        Wait for and return the SourceInfo objects of every pdf in the same order as ``paths``.
+
+        Args:
+            progress: A callable taking ``(done, total)`` called after each file. Defaults to None.
+            cancel: A CancelToken object checked while waiting. Defaults to None.
+
+        Raises:
+            OperationCanceled: If ``cancel`` is cancelled before all files are read.
+        """
+        total = len(self.futures)
+        pending = set(self.futures)
+        while pending:
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            try:
+                for future in as_completed(pending, timeout=self.POLL_INTERVAL):
+                    pending.discard(future)
+                    if progress is not None:
+                        progress(total - len(pending), total)
+                    if cancel is not None:
+                        cancel.raise_if_cancelled()
+            except TimeoutError:
+                continue
+        return [self._report(i, future.result()) for i, future in enumerate(self.futures)]
+
+
+    def _report(self, index, info):
+        if self.on_result is not None and index not in self._reported:
+            self._reported.add(index)
+            self.on_result(info)
+        return info
+
+
+    def close(self):
+        """Stop reading files that have not started yet."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def inspect_pdfs(paths, max_workers=None, progress=None, cancel=None):
+    """
+    Parse and validate several pdfs concurrently on a process pool.
+
+    Args:
+        paths: A list of paths of pdfs.
+        max_workers: Maximum number of processes. Defaults to None.
+            If None, one process per CPU is used.
+        progress: A callable taking ``(done, total)`` called after each file. Defaults to None.
+        cancel: A CancelToken object checked after each file. Defaults to None.
+
+    Returns:
+        A list of SourceInfo objects in the same order as ``paths``.
+
+    Raises:
+        OperationCanceled: If ``cancel`` is cancelled before all files are read.
+    """
+    if cancel is not None:
+        cancel.raise_if_cancelled()
+    with Prefetch(paths, max_workers) as prefetch:
+        return prefetch.results(progress, cancel)
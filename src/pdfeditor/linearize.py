@@ -0,0 +1,389 @@
+from io import BytesIO
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject
+
+# Catalog entries a viewer needs before it can show the first page.
+OPEN_DOCUMENT_KEYS = ("/ViewerPreferences", "/PageMode", "/Threads", "/OpenAction", "/AcroForm")
+# Width reserved for numbers that are only known once the whole file is laid out.
+FIELD_WIDTH = 10
+
+
+def write_linearized(writer, stream):
+    """
+    Write ``writer`` to ``stream`` as a linearized ("fast web view") pdf.
+
+    The first page and everything it needs come first, behind a linearization
+    dictionary, a first-page cross-reference section and the primary hint
+    stream, so viewers can show page 1 before the rest of the file arrives.
+    Objects not reachable from the catalog or document information are dropped.
+
+    Args:
+        writer: A PdfWriter object with at least one page.
+        stream: A writable binary stream.
+    """
+    if writer._ID is None:
+        writer.generate_file_identifiers()
+
+    layout = _Layout(writer)
+    layout.renumber()
+    bodies = {num: _serialize(num, obj) for num, obj in layout.objects.items()}
+    stream.write(layout.assemble(bodies, writer._ID))
+
+
+class _Layout:
+    """Splits the objects of a PdfWriter into the parts of a linearized file."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.pages = [page.indirect_reference.idnum for page in writer.pages]
+        self.root = writer.root_object.indirect_reference.idnum
+        self.info = writer._info.indirect_reference.idnum if writer._info is not None else None
+        self.users = {}
+        self._find_users()
+        self._split()
+
+
+    def _get(self, idnum):
+        return self.writer._objects[idnum - 1]
+
+
+    def _find_users(self):
+        """Record which pages, catalog entries and trailer entries use each object."""
+        pages = set(self.pages)
+        for i, idnum in enumerate(self.pages):
+            self._visit(("page", i), IndirectObject(idnum, 0, self.writer), pages)
+
+        self.users.setdefault(self.root, set()).add(("root",))
+        root = self._get(self.root)
+        for key in root:
+            self._visit(("root", key), root.raw_get(key), pages)
+        if self.info is not None:
+            self._visit(("trailer", "/Info"), IndirectObject(self.info, 0, self.writer), pages)
+
+
+    def _visit(self, user, start, pages):
+        own_page = self.pages[user[1]] if user[0] == "page" else None
+        pending = [start]
+        while pending:
+            obj = pending.pop()
+            if isinstance(obj, IndirectObject):
+                idnum = obj.idnum
+                # Pages are only used by themselves, never by whatever links to them.
+                if idnum in pages and idnum != own_page:
+                    continue
+                if self._get(idnum) is None or user in self.users.get(idnum, ()):
+                    continue
+                self.users.setdefault(idnum, set()).add(user)
+                obj = self._get(idnum)
+
+            if isinstance(obj, DictionaryObject):
+                is_page = obj.get("/Type") == "/Page"
+                pending += [value for key, value in obj.items()
+                            if not (is_page and key == "/Parent")]
+            elif isinstance(obj, ArrayObject):
+                pending += list(obj)
+
+
+    def _split(self):
+        """Assign each used object to part 4, 6, 7, 8 or 9 of the linearized file."""
+        open_document = {("root",), ("trailer", "/Encrypt")} | {("root", key) for key in OPEN_DOCUMENT_KEYS}
+        first_page = ("page", 0)
+
+        self.part4 = [self.root]
+        self.part6 = [self.pages[0]]
+        self.part7 = [[idnum] for idnum in self.pages[1:]]
+        self.part8 = []
+        self.part9 = []
+        self.outlines = []
+        page_numbers = {idnum: i for i, idnum in enumerate(self.pages)}
+        outline_root = self._get(self.root).raw_get("/Outlines") if "/Outlines" in self._get(self.root) else None
+
+        for idnum in sorted(self.users):
+            users = self.users[idnum]
+            if idnum == self.root or idnum in page_numbers:
+                continue
+            page_users = [user[1] for user in users if user[0] == "page"]
+            if users & open_document:
+                self.part4.append(idnum)
+            elif first_page in users:
+                self.part6.append(idnum)
+            elif len(page_users) == 1 and len(users) == 1:
+                self.part7[page_users[0] - 1].append(idnum)
+            elif page_users:
+                self.part8.append(idnum)
+            elif users == {("root", "/Outlines")}:
+                self.outlines.append(idnum)
+            else:
+                self.part9.append(idnum)
+
+        # Outline items are one group, led by the outline dictionary, that the outline hint table describes.
+        if isinstance(outline_root, IndirectObject) and outline_root.idnum in self.outlines:
+            self.outlines.remove(outline_root.idnum)
+            self.outlines.insert(0, outline_root.idnum)
+        else:
+            self.part9 += self.outlines
+            self.outlines = []
+        self.part9 = self.outlines + self.part9
+
+
+    def renumber(self):
+        """
+        Renumber objects so each part is numbered consecutively in file order.
+
+        Objects after the first page are numbered from 1 and the first-page
+        section follows them, starting with the linearization dictionary.
+        """
+        main = [idnum for group in self.part7 for idnum in group] + self.part8 + self.part9
+        first = self.part4 + self.part6
+        self.main_count = len(main)
+        self.lin_num = len(main) + 1
+        self.hint_num = self.lin_num + len(self.part4) + 1
+
+        self.numbers = {idnum: i for i, idnum in enumerate(main, 1)}
+        for i, idnum in enumerate(self.part4, self.lin_num + 1):
+            self.numbers[idnum] = i
+        for i, idnum in enumerate(self.part6, self.hint_num + 1):
+            self.numbers[idnum] = i
+        self.total = self.hint_num + len(self.part6) + 1
+
+        self.objects = {self.numbers[idnum]: self._get(idnum) for idnum in main + first}
+
+        seen = set()
+        for obj in self.objects.values():
+            _renumber_references(obj, self.numbers, seen)
+
+
+    def assemble(self, bodies, file_id):
+        """Return the bytes of the whole linearized file given the serialized objects."""
+        n = self.numbers
+        header = self.writer.pdf_header.encode() + b"\n%\xE2\xE3\xCF\xD3\n"
+        part4 = [n[idnum] for idnum in self.part4]
+        part6 = [n[idnum] for idnum in self.part6]
+        groups = [[n[idnum] for idnum in group] for group in self.part7]
+        part8 = [n[idnum] for idnum in self.part8]
+        part9 = [n[idnum] for idnum in self.part9]
+        outlines = [n[idnum] for idnum in self.outlines]
+        page_nums = [n[idnum] for idnum in self.pages]
+
+        lengths = {num: len(body) for num, body in bodies.items()}
+        shared = part6 + part8
+        shared_index = {num: i for i, num in enumerate(shared)}
+        page_shared = [[] for _ in self.pages]
+        for idnum in self.part8 + self.part6[1:]:
+            for user in self.users[idnum]:
+                if user[0] == "page" and user[1] > 0:
+                    page_shared[user[1]].append(shared_index[n[idnum]])
+        for refs in page_shared:
+            refs.sort()
+        page_objects = [part6] + groups
+
+        # Hint data only depends on offsets through fixed-width fields, so its
+        # size can be known before anything is placed.
+        hint_data, shared_offset, outline_offset = _hint_tables(page_objects, page_shared, shared, part8,
+                                                                outlines, lengths, {})
+        hint = _hint_stream(self.hint_num, hint_data, shared_offset, outline_offset)
+
+        lin_size = len(self._lin_dict(0, 0, 0, 0, 0, 0))
+        first_xref_size = len(_xref(self.lin_num, [0] * (self.total - self.lin_num)))
+        trailer_size = len(self._first_trailer(0, file_id))
+
+        offsets = {}
+        position = len(header)
+        offsets[self.lin_num] = position
+        position += lin_size
+        first_xref_offset = position
+        position += first_xref_size + trailer_size
+        for num in part4:
+            offsets[num] = position
+            position += lengths[num]
+        hint_offset = position
+        position += len(hint)
+        for num in part6:
+            offsets[num] = position
+            position += lengths[num]
+        end_of_first_page = position
+        for num in [num for group in groups for num in group] + part8 + part9:
+            offsets[num] = position
+            position += lengths[num]
+        main_xref_offset = position
+        main_xref = _xref(0, [offsets[num] for num in range(1, self.main_count + 1)])
+        main_trailer = (f"trailer\n<< /Size {self.main_count + 1} >>\n"
+                        f"startxref\n{first_xref_offset}\n%%EOF\n").encode()
+        file_length = main_xref_offset + len(main_xref) + len(main_trailer)
+        # /T points at the end of line before the main table's first entry.
+        first_entry = main_xref_offset + main_xref.index(b"\n", len(b"xref\n"))
+
+        # Hint tables ignore the hint stream itself when giving offsets.
+        hint_offsets = {num: offset - len(hint) if offset > hint_offset else offset
+                        for num, offset in offsets.items()}
+        hint_data, shared_offset, outline_offset = _hint_tables(page_objects, page_shared, shared, part8,
+                                                                outlines, lengths, hint_offsets)
+        hint = _hint_stream(self.hint_num, hint_data, shared_offset, outline_offset)
+        offsets[self.hint_num] = hint_offset
+
+        lin_dict = self._lin_dict(file_length, hint_offset, len(hint), page_nums[0],
+                                  end_of_first_page, first_entry)
+        first_xref = _xref(self.lin_num, [offsets[num] for num in range(self.lin_num, self.total)])
+
+        output = BytesIO()
+        output.write(header)
+        output.write(lin_dict)
+        output.write(first_xref)
+        output.write(self._first_trailer(main_xref_offset, file_id))
+        for num in part4:
+            output.write(bodies[num])
+        output.write(hint)
+        for num in part6 + [num for group in groups for num in group] + part8 + part9:
+            output.write(bodies[num])
+        output.write(main_xref)
+        output.write(main_trailer)
+        return output.getvalue()
+
+
+    def _lin_dict(self, file_length, hint_offset, hint_length, first_page, end_of_first_page, first_entry):
+        fields = [_field(value) for value in (file_length, hint_offset, hint_length, first_page,
+                                              end_of_first_page, first_entry)]
+        return (f"{self.lin_num} 0 obj\n<< /Linearized 1 /L {fields[0]} /H [ {fields[1]} {fields[2]} ] "
+                f"/O {fields[3]} /E {fields[4]} /N {len(self.pages)} /T {fields[5]} >>\nendobj\n").encode()
+
+
+    def _first_trailer(self, main_xref_offset, file_id):
+        entries = f"/Size {self.total} /Root {self.numbers[self.root]} 0 R "
+        if self.info is not None:
+            entries += f"/Info {self.numbers[self.info]} 0 R "
+        id_stream = BytesIO()
+        file_id.write_to_stream(id_stream)
+        return (f"trailer\n<< {entries}/ID ".encode() + id_stream.getvalue()
+                + f" /Prev {_field(main_xref_offset)} >>\nstartxref\n0\n%%EOF\n".encode())
+
+
+def _field(value):
+    return str(value).ljust(FIELD_WIDTH)
+
+
+def _xref(first, offsets):
+    """Return a cross-reference section for objects numbered from ``first`` at given offsets."""
+    lines = [f"xref\n{first} {len(offsets) + (first == 0)}\n"]
+    if first == 0:
+        lines.append("0000000000 65535 f \n")
+    lines += [f"{offset:010} 00000 n \n" for offset in offsets]
+    return "".join(lines).encode()
+
+
+def _hint_stream(num, data, shared_offset, outline_offset=None):
+    outline = f"/O {outline_offset} " if outline_offset is not None else ""
+    return (f"{num} 0 obj\n<< /Length {len(data)} /S {shared_offset} {outline}>>\nstream\n".encode()
+            + data + b"\nendstream\nendobj\n")
+
+
+def _hint_tables(page_objects, page_shared, shared, part8, outlines, lengths, offsets):
+    """
+    Return the page offset, shared object and outline hint tables and the offsets of the latter two.
+
+    The outline table is left out, and its offset is None, if ``outlines`` is empty.
+
+    Args:
+        page_objects: A list per page of the numbers of objects stored with that page.
+        page_shared: A list per page of indices into ``shared`` of shared objects the page uses.
+        shared: Numbers of objects in the shared object hint table, first page's first.
+        part8: Numbers of shared objects stored after all pages.
+        outlines: Numbers of the outline objects, stored together, outline dictionary first.
+        lengths: A dict of byte lengths of objects keyed by number.
+        offsets: A dict of hint-table offsets of objects keyed by number.
+            Missing offsets are written as 0.
+    """
+    bits = _BitWriter()
+
+    counts = [len(objects) for objects in page_objects]
+    page_lengths = [sum(lengths[num] for num in objects) for objects in page_objects]
+    min_count, min_length = min(counts), min(page_lengths)
+    count_bits = (max(counts) - min_count).bit_length()
+    length_bits = (max(page_lengths) - min_length).bit_length()
+    shared_count_bits = max(len(refs) for refs in page_shared).bit_length()
+    shared_id_bits = max(len(shared) - 1, 0).bit_length()
+
+    for value, width in ((min_count, 32), (offsets.get(page_objects[0][0], 0), 32), (count_bits, 16),
+                         (min_length, 32), (length_bits, 16), (0, 32), (0, 16),
+                         (min_length, 32), (length_bits, 16), (shared_count_bits, 16),
+                         (shared_id_bits, 16), (0, 16), (4, 16)):
+        bits.write(value, width)
+
+    bits.write_rows([count - min_count for count in counts], count_bits)
+    bits.write_rows([length - min_length for length in page_lengths], length_bits)
+    bits.write_rows([len(refs) for refs in page_shared], shared_count_bits)
+    bits.write_rows([ref for refs in page_shared for ref in refs], shared_id_bits)
+    # Numerators of fractional shared object positions and content stream
+    # offsets are all written with 0 bits.
+    bits.write_rows([length - min_length for length in page_lengths], length_bits)
+    shared_offset = len(bits.data)
+
+    group_lengths = [lengths[num] for num in shared]
+    min_group = min(group_lengths)
+    group_bits = (max(group_lengths) - min_group).bit_length()
+    first_shared = part8[0] if part8 else 0
+    for value, width in ((first_shared, 32), (offsets.get(first_shared, 0), 32),
+                         (len(shared) - len(part8), 32), (len(shared), 32), (0, 16),
+                         (min_group, 32), (group_bits, 16)):
+        bits.write(value, width)
+    bits.write_rows([length - min_group for length in group_lengths], group_bits)
+    bits.write_rows([0] * len(shared), 1)
+
+    outline_offset = None
+    if outlines:
+        outline_offset = len(bits.data)
+        for value in (outlines[0], offsets.get(outlines[0], 0), len(outlines),
+                      sum(lengths[num] for num in outlines)):
+            bits.write(value, 32)
+    return bits.data, shared_offset, outline_offset
+
+
+class _BitWriter:
+    """Packs unsigned integers into bytes, most significant bit first."""
+
+    def __init__(self):
+        self.data = bytearray()
+        self._value = 0
+        self._bits = 0
+
+    def write(self, value, width):
+        if width == 0:
+            return
+        self._value = (self._value << width) | value
+        self._bits += width
+        while self._bits >= 8:
+            self._bits -= 8
+            self.data.append((self._value >> self._bits) & 0xFF)
+        self._value &= (1 << self._bits) - 1
+
+    def write_rows(self, values, width):
+        """Write each of ``values``, then pad to a byte boundary as every hint table row must be."""
+        for value in values:
+            self.write(value, width)
+        self.flush()
+
+    def flush(self):
+        if self._bits:
+            self.write(0, 8 - self._bits)
+
+
+def _renumber_references(obj, numbers, seen):
+    """Point every reference inside ``obj`` at its object's new number."""
+    pending = [obj]
+    while pending:
+        obj = pending.pop()
+        if isinstance(obj, IndirectObject):
+            if id(obj) not in seen:
+                seen.add(id(obj))
+                obj.idnum = numbers.get(obj.idnum, obj.idnum)
+                obj.generation = 0
+        elif isinstance(obj, DictionaryObject):
+            pending += list(obj.values())
+        elif isinstance(obj, ArrayObject):
+            pending += obj
+
+
+def _serialize(num, obj):
+    body = BytesIO()
+    body.write(f"{num} 0 obj\n".encode())
+    obj.write_to_stream(body)
+    body.write(b"\nendobj\n")
+    return body.getvalue()
@@ -0,0 +1,246 @@
+import os
+from pypdf import PdfWriter
+from pypdf.generic import (ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject,
+                           TextStringObject)
+
+# Prefix of the named destinations that internal links are pointed at.
+LINK_PREFIX = "link"
+
+
+class Navigation:
+    """
+    Outlines, named destinations and internal links of source pdfs, remapped onto the pages of an output pdf.
+
+    Destinations are looked up in one table of source pages built up front, so
+    remapping takes time linear in the number of pages, outline items and links.
+    Links are pointed at named destinations, so pages can be written before the
+    pages they link to have object numbers.
+
+    Attributes:
+        annots: A dict of the remapped /Annots of output pages with internal links, keyed by position.
+        destinations: A dict of destinations in the format: (position, view), keyed by name.
+        outline: A list of _Item objects of the top-level outline items.
+    """
+
+    def __init__(self, entries):
+        """
+        Args:
+            entries: A list with an item per output page in the format:
+                (path, reader, source_index, page), or None for pages not read
+                from a source pdf. ``page`` is the PageObject object to write.
+        """
+        self.annots = {}
+        self.destinations = {}
+        self.outline = []
+        self._doc = PdfWriter()
+        self._positions = {}
+        self._page_indices = {}
+        self._source_names = {}
+        self._link_names = {}
+
+        sources = {}
+        for position, entry in enumerate(entries):
+            if entry is not None:
+                path, reader, source_index, _ = entry
+                self._positions.setdefault((id(reader), source_index), position)
+                sources.setdefault(id(reader), (path, reader, position))
+
+        for path, reader, _ in sources.values():
+            names = self._source_names[id(reader)] = {}
+            for name, dest in reader.named_destinations.items():
+                target = self._target(reader, dest.dest_array)
+                if target is not None:
+                    names[name] = target
+                    self.destinations.setdefault(str(name).lstrip("/"), target)
+
+        outlines = [(path, self._items(reader, reader.outline), position)
+                    for path, reader, position in sources.values()]
+        if any(items for _, items, _ in outlines):
+            if len(outlines) == 1:
+                self.outline = outlines[0][1]
+            else:
+                self.outline = [_Item(os.path.splitext(os.path.basename(path))[0], (position, [NameObject("/Fit")]),
+                                      items)
+                                for path, items, position in outlines]
+
+        for position, entry in enumerate(entries):
+            if entry is not None and "/Annots" in entry[3]:
+                self._remap_links(position, entry[1], entry[3])
+
+
+    def __bool__(self):
+        return bool(self.annots or self.destinations or self.outline)
+
+
+    def write(self, catalog, add, page_references):
+        """
+        Add the outline and named destinations to an output pdf.
+
+        Args:
+            catalog: The DictionaryObject object of the output's document catalog.
+            add: A callable that adds an object to the output and returns a reference to it.
+                Objects may be changed after they are added.
+            page_references: A list of references to the output's pages.
+        """
+        if self.destinations:
+            names = ArrayObject()
+            for name in sorted(self.destinations):
+                position, view = self.destinations[name]
+                names.append(TextStringObject(name))
+                names.append(ArrayObject([page_references[position], *view]))
+            dests = add(DictionaryObject({NameObject("/Names"): names}))
+            catalog[NameObject("/Names")] = DictionaryObject({NameObject("/Dests"): dests})
+
+        if self.outline:
+            root = DictionaryObject({NameObject("/Type"): NameObject("/Outlines")})
+            reference = add(root)
+            count = _add_items(self.outline, root, reference, add, page_references)
+            root[NameObject("/Count")] = NumberObject(count)
+            catalog[NameObject("/Outlines")] = reference
+
+
+    def _target(self, reader, dest):
+        """Return the ``(position, view)`` of an explicit destination of ``reader``, or None if its page is not kept."""
+        if not isinstance(dest, ArrayObject) or not dest:
+            return None
+        page = dest[0]
+        if isinstance(page, IndirectObject):
+            source_index = self._page_index(reader, page.idnum)
+        elif isinstance(page, int):
+            # Destinations of other documents, and some of pypdf's own, number their page instead.
+            source_index = page
+        else:
+            return None
+        position = self._positions.get((id(reader), source_index))
+        if position is None:
+            return None
+        return position, list(dest[1:])
+
+
+    def _page_index(self, reader, idnum):
+        if id(reader) not in self._page_indices:
+            self._page_indices[id(reader)] = {page.indirect_reference.idnum: i for i, page in enumerate(reader.pages)}
+        return self._page_indices[id(reader)].get(idnum)
+
+
+    def _items(self, reader, outline):
+        """Return _Item objects of the entries of ``outline``, a list as in ``PdfReader.outline``."""
+        items = []
+        for entry in outline:
+            if isinstance(entry, list):
+                if items:
+                    items[-1].children = self._items(reader, entry)
+                continue
+            item = _Item(entry.title, self._target(reader, entry.dest_array), open=entry.get("/%is_open%", True))
+            for key in ("/C", "/F"):
+                if key in entry:
+                    item.style[NameObject(key)] = entry[key]
+            items.append(item)
+
+        kept = []
+        for item in items:
+            if item.target is None and item.children:
+                # Items whose page was removed point at their first kept child.
+                item.target = item.children[0].target
+            if item.target is not None:
+                kept.append(item)
+        return kept
+
+
+    def _remap_links(self, position, reader, page):
+        """Point the links of ``page`` at named destinations, dropping those whose page is not kept."""
+        annots = page["/Annots"]
+        new_annots = ArrayObject()
+        changed = False
+        for reference in annots:
+            annot = reference.get_object()
+            dest = _link_dest(annot)
+            if dest is None:
+                new_annots.append(reference)
+                continue
+
+            changed = True
+            if isinstance(dest, ArrayObject):
+                target = self._target(reader, dest)
+            else:
+                target = self._source_names[id(reader)].get(dest)
+            if target is None:
+                continue
+
+            new_annot = DictionaryObject(annot)
+            new_annot.pop(NameObject("/A"), None)
+            new_annot[NameObject("/Dest")] = TextStringObject(self._link_name(dest, target))
+            new_annots.append(self._doc._add_object(new_annot))
+
+        if changed:
+            self.annots[position] = new_annots
+
+
+    def _link_name(self, dest, target):
+        """Return the name of a destination of ``target``, reusing the link's own name where it still means the same."""
+        if not isinstance(dest, ArrayObject):
+            name = str(dest).lstrip("/")
+            if self.destinations.get(name) == target:
+                return name
+
+        key = (target[0], repr(target[1]))
+        if key not in self._link_names:
+            name = f"{LINK_PREFIX}{len(self._link_names)}"
+            while name in self.destinations:
+                name += "_"
+            self._link_names[key] = name
+            self.destinations[name] = target
+        return self._link_names[key]
+
+
+class _Item:
+    """An outline item of an output pdf."""
+
+    def __init__(self, title, target, children=None, open=True):
+        self.title = title
+        self.target = target
+        self.children = children or []
+        self.open = open
+        self.style = {}
+
+
+def _link_dest(annot):
+    """Return the destination of an internal link annotation: an explicit destination or a name, or None."""
+    if annot.get("/Subtype") != "/Link":
+        return None
+    if "/Dest" in annot:
+        dest = annot["/Dest"]
+    elif "/A" in annot and annot["/A"].get("/S") == "/GoTo":
+        dest = annot["/A"].get("/D")
+    else:
+        return None
+    if isinstance(dest, DictionaryObject):
+        dest = dest.get("/D")
+    return dest if isinstance(dest, (ArrayObject, str)) else None
+
+
+def _add_items(items, parent, parent_reference, add, page_references):
+    """Add outline items of ``items`` under ``parent`` and return how many items an open ``parent`` shows."""
+    objects = [DictionaryObject() for _ in items]
+    references = [add(obj) for obj in objects]
+    visible = len(items)
+    for i, (item, obj) in enumerate(zip(items, objects)):
+        position, view = item.target
+        obj[NameObject("/Title")] = TextStringObject(item.title)
+        obj[NameObject("/Parent")] = parent_reference
+        obj[NameObject("/Dest")] = ArrayObject([page_references[position], *view])
+        obj.update(item.style)
+        if i > 0:
+            obj[NameObject("/Prev")] = references[i - 1]
+        if i < len(items) - 1:
+            obj[NameObject("/Next")] = references[i + 1]
+        if item.children:
+            count = _add_items(item.children, obj, references[i], add, page_references)
+            obj[NameObject("/Count")] = NumberObject(count if item.open else -count)
+            if item.open:
+                visible += count
+
+    if items:
+        parent[NameObject("/First")] = references[0]
+        parent[NameObject("/Last")] = references[-1]
+    return visible
@@ -1,26 +1,81 @@
-import os, tempfile
-from pypdf import PdfReader, PdfWriter
+import gc, os, shutil, tempfile
+from io import BytesIO
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pypdf import PdfReader, PdfWriter, PageObject
+from pypdf.generic import (ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject, IndirectObject, NameObject,
+                           RectangleObject, StreamObject)
+from profiling import get_profiler, profiled
+from progress import track
+from ingest import Prefetch, inspect_pdfs
+from blank import AMBIGUOUS, BLANK, check_sources, classify_page, page_is_blank
+from fingerprint import content_digest, fingerprint_sources, geometry_digest, page_fingerprint, value_digest
+from impose import booklet_order, grid_cells, make_sheet, page_to_xobject, placement, visible_box
+from linearize import write_linearized
+from incremental import write_increment
+from shard import SHARD_PAGES, open_page, set_version, write_sharded
+from split import write_parts, write_source_parts
+from stamp import Stamper
+from outline import Navigation
+from pool import get_source_pool, worker_options
 
 LEFT, BOTTOM, RIGHT, TOP = (0, 1, 2, 3)
+BOX_KEYS = ("/MediaBox", "/CropBox", "/BleedBox", "/TrimBox", "/ArtBox")
+# Estimated bytes of memory each object or page parsed by a reader takes, on top of twice the size of its file.
+OBJECT_MEMORY = 2000
+# Encrypted sources at least this large have their streams decrypted in bulk on a process pool when first parsed.
+BULK_DECRYPT_BYTES = 16 * 1024 * 1024
+IMPOSED_PATH = "Imposed Sheet"
 
 class PdfManager:
     """
     Manager that combines and edits pdfs.
 
+    Each manager is one editing session, to be used by one thread at a time.
+    Sessions share parsed sources through a SourcePool, which several threads
+    may read at once; edits only ever change the session's own page copies.
+
     Attributes:
         pages: A list of PageObject objects representing the pages of a pdf.
-        reader: A PdfReader object used to add pdf pages and get information.
-        writer: A PdfWriter object used to preview edits and write final pdf file.
+            Pages that have not been used yet are PageRef objects, which are
+            parsed on first use by ``get_page``.
+        source_infos: A dict of SourceInfo objects of ingested pdfs keyed by path.
+        reader: The PdfReader object most recently used to add pdf pages and get information.
+        readers: A dict of open PdfReader objects keyed by path, least recently
+            used first. Each source is parsed once and its pages are copied into ``pages``.
+        sources: The SourcePool object that readers are taken from.
+        profiler: A Profiler object that records metrics of each operation.
+        cache: A ResultCache object that ``save_as`` and ``split_to`` reuse earlier results from, or None.
+        max_memory: Estimated bytes of memory that parsed sources may take, or None for no limit.
     """
 
-    def __init__(self, pdf_paths=[]):
+    def __init__(self, pdf_paths=[], profiler=None, cache=None, max_memory=None, sources=None):
         """
         Initializes PdfManager object and fills ``pages`` based on ``pdf_paths``.
 
         Args:
             pdf_paths: A path to a pdf file with pages to be added to ``pages``.
+            profiler: A Profiler object. Defaults to None.
+                If None, the process-wide profiler is used.
+            cache: A ResultCache object. Defaults to None.
+                If None, every save is written anew.
+            max_memory: Estimated bytes of memory that parsed sources may take. Defaults to None.
+                If None, sources stay parsed until ``reset``. See ``_limit_memory``.
+            sources: A SourcePool object. Defaults to None.
+                If None, the process-wide pool is used, so sessions share the sources they have in common.
         """
+        self.profiler = profiler or get_profiler()
+        self.sources = sources or get_source_pool()
+        self.cache = cache
+        self.max_memory = max_memory
+        self._memory_floor = 0
         self.reader = None
+        self.readers = {}
+        self._reader_stats = {}
+        self.source_infos = {}
+        self._sheet_docs = []
+        self._edit_doc = None
+        self._fingerprints = {}
+        self._increments = {}
         self.pages = []
         self.pages_original = []
         for path in pdf_paths:
@@ -51,18 +106,213 @@ class PdfManager:
     def reset(self):
         self.pages = []
         self.pages_original = []
-        if self.reader is not None:
-            self.reader.close()
+        # Readers may be shared with other sessions, so they are left to the pool rather than closed.
+        self.readers = {}
+        self._reader_stats = {}
+        self.source_infos = {}
+        for doc in self._sheet_docs:
+            doc.close()
+        self._sheet_docs = []
+        self._edit_doc = None
+        self._fingerprints = {}
+        self._increments = {}
+        self._memory_floor = 0
+        self.reader = None
+
+
+    def _get_reader(self, path, password=None):
+        """
+        Return the pooled PdfReader of ``path``, parsing it if missing or changed on disk.
+
+        Args:
+            path: A path to a pdf file.
+            password: The password of an encrypted pdf. Defaults to None.
+                If None, the password the file was last opened with is used.
+        """
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+
+        if path in self.readers and self._reader_stats.get(path) == key and password is None:
+            self.profiler.count("reader_cache_hits")
+            self.readers[path] = self.readers.pop(path)
+        else:
+            self.profiler.count("reader_cache_misses")
+            if path in self.readers:
+                # The file changed on disk, so anything derived from it is stale.
+                self._fingerprints = {k: v for k, v in self._fingerprints.items() if k[0] != path}
+                self._increments.pop(path, None)
+            self.readers.pop(path, None)
+            self.readers[path], parsed = self.sources.get(path, stat, password)
+            self.profiler.count("bytes_read" if parsed else "shared_bytes", stat.st_size)
+            if parsed:
+                self.profiler.count("xref_repairs", self.readers[path].xref_repaired)
+                self.profiler.count("xref_restores", self.readers[path].xref_restored)
+            if parsed and self.readers[path].is_encrypted and stat.st_size >= BULK_DECRYPT_BYTES \
+                    and (os.cpu_count() or 1) > 1:
+                self.profiler.count("streams_decrypted", self.sources.decrypt_streams(path))
+            self._reader_stats[path] = key
+            self._limit_memory(keep=path)
+
+        self.reader = self.readers[path]
+        return self.reader
+
+
+    def _limit_memory(self, keep=None):
+        """
+        Evict the least recently used sources until parsed sources take at most ``max_memory``.
+
+        Evicting a source turns its parsed pages back into PageRef objects that
+        keep their own edited entries (e.g. boxes and rotation) as overrides, to
+        be parsed again on next use. Sources with pages whose edits refer to other
+        objects (e.g. stamps or content scales) cannot be evicted. When memory
+        stays over the limit, it is only checked again once it grew by a quarter.
+
+        Args:
+            keep: The path of a source that is in use and must stay. Defaults to None.
+        """
+        if self.max_memory is None:
+            return
+        usage = {path: 2 * self._reader_stats[path][1]
+                 + OBJECT_MEMORY * (len(reader.resolved_objects) + len(reader.flattened_pages or ()))
+                 for path, reader in self.readers.items()}
+        total = sum(usage.values())
+        if total <= max(self.max_memory, self._memory_floor):
+            return
+
+        evicted = False
+        for path in list(self.readers):
+            if total <= self.max_memory:
+                break
+            if path != keep and path not in self._increments and self._evict_reader(path):
+                total -= usage[path]
+                evicted = True
+        if evicted:
+            # Parsed objects refer to each other, so they are only freed by the cycle collector.
+            gc.collect()
+        self._memory_floor = total * 5 // 4 if total > self.max_memory else 0
+
+
+    def _evict_reader(self, path):
+        """Drop the reader of ``path``, turning its pages back into PageRef objects, and return whether it could be."""
+        reader = self.readers[path]
+        refs = {}
+        for i, page in enumerate(self.pages):
+            if not isinstance(page, PageRef) and page.pdf is reader:
+                spec = self._page_spec(page)
+                if spec is None:
+                    return False
+                refs[i] = PageRef(*spec)
+        if any(not isinstance(page, PageRef) and page.pdf is reader for page in self.pages_original):
+            return False
+
+        for i, ref in refs.items():
+            self.pages[i] = ref
+        # The reader is not closed, as an operation in progress may still use its pages.
+        del self.readers[path]
+        del self._reader_stats[path]
+        if self.reader is reader:
             self.reader = None
+        self.profiler.count("readers_evicted")
+        self.profiler.count("pages_evicted", len(refs))
+        return True
 
 
-    def get_pdf_num_pages(self, path):
-        """Get number of pages of specified pdf path."""
-        self.reader = PdfReader(path)
-        return self.reader.get_num_pages()
-            
+    def _get_num_pages(self, path, password=None):
+        info = self.source_infos.get(path)
+        if info is not None and info.ok and password is None:
+            return info.num_pages
+        return self._get_reader(path, password).get_num_pages()
+
+
+    @profiled
+    def get_pdf_num_pages(self, path, password=None):
+        """
+        Get number of pages of specified pdf path.
+
+        Args:
+            path: A path of a pdf.
+            password: The password of an encrypted pdf. Defaults to None.
+                It is remembered for the file like the one given to ``add_pdf``.
+
+        Raises:
+            WrongPasswordError: If ``password`` does not open the pdf.
+        """
+        return self._get_num_pages(path, password)
+
+
+    @profiled
+    def ingest(self, paths, max_workers=None, progress=None, cancel=None):
+        """
+        Parse and validate pdfs concurrently so their pages can be added without parsing.
+
+        Sources that read successfully are remembered in ``source_infos``, after
+        which ``add_pdf`` and ``add_pdfs`` only append references to their pages.
+
+        Args:
+            paths: A list of paths of pdfs.
+            max_workers: Maximum number of processes. Defaults to None.
+                If None, one process per CPU is used.
+            progress: A callable taking ``(done, total)`` called after each file. Defaults to None.
+            cancel: A CancelToken object checked after each file. Defaults to None.
+
+        Returns:
+            A list of SourceInfo objects in the same order as ``paths``.
+            Files that failed to read have their ``error`` set.
+        """
+        infos = inspect_pdfs(paths, max_workers, progress, cancel)
+        for info in infos:
+            self._remember_source(info)
+        self.profiler.count("files", len(infos))
+        self.profiler.count("bytes_read", sum(info.size or 0 for info in infos))
+        self.profiler.count("xref_repairs", sum(info.xref_repaired for info in infos))
+        self.profiler.count("xref_restores", sum(info.xref_restored for info in infos))
+        return infos
+
+
+    def prefetch(self, paths, max_workers=None):
+        """
+        Start parsing and validating pdfs in the background and return immediately.
+
+        Work overlaps with whatever the caller does meanwhile (e.g. prompting the
+        user), and each source is remembered in ``source_infos`` once it is waited for.
+
+        Args:
+            paths: A list of paths of pdfs.
+            max_workers: Maximum number of processes. Defaults to None.
+                If None, one process per CPU is used.
+
+        Returns:
+            A Prefetch object whose ``result``/``results`` wait for the SourceInfo objects.
+        """
+        return Prefetch(paths, max_workers, on_result=self._remember_source)
+
 
-    def add_pdf(self, path, indices=None):
+    def _remember_source(self, info):
+        if info.ok:
+            self.source_infos[info.path] = info
+
+
+    def get_page(self, index):
+        """Return the PageObject at specified index of ``pages``, parsing it on first use."""
+        page = self.pages[index]
+        if isinstance(page, PageRef):
+            ref, page = page, copy_page(self._load_page(page))
+            setattr(page, "path", ref.path)
+            setattr(page, "source_index", ref.source_index)
+            self.pages[index] = page
+            self._limit_memory(keep=page.path)
+        elif getattr(page, "path", None) in self.readers:
+            self.readers[page.path] = self.readers.pop(page.path)
+        return page
+
+
+    def _load_page(self, ref):
+        """Return the source PageObject that ``ref`` refers to, with its overrides applied. It must not be changed."""
+        return open_page(self._get_reader(ref.path), ref.source_index, ref.overrides)
+
+
+    @profiled
+    def add_pdf(self, path, indices=None, progress=None, cancel=None, password=None):
         """
         Append specified pdf pages to ``pages`` and ``pages_original``.
         
@@ -70,25 +320,53 @@ class PdfManager:
             path: A path to read pdf from.
             indices: A list of indices of pages to add. Defaults to None. 
                 If None, all pages in pdf will be added.
-        
+            progress: A callable taking ``(done, total)`` called after each page. Defaults to None.
+            cancel: A CancelToken object checked between pages. Defaults to None.
+                If cancelled, no pages are added.
+            password: The password of an encrypted pdf. Defaults to None.
+                It is remembered for the file by the process, so later sessions
+                and worker processes open it without being given it again.
+
+        Raises:
+            WrongPasswordError: If ``password`` does not open the pdf.
+            FileNotDecryptedError: If the pdf needs a password and none was given or remembered.
         """
-        self._append_pdf_pages(self.pages, path, indices)
-        self._append_pdf_pages(self.pages_original, path, indices)
-    
+        self._add_sources([(path, indices, password)], progress, cancel)
 
-    def _append_pdf_pages(self, pages_list, path, indices=None):
-        self.reader = PdfReader(path)
-            
-        if indices is None:
-            reader_pages = self.reader.pages
-        else:
-            reader_pages = [self.reader.pages[i] for i in indices]
 
-        for page in reader_pages:
-            setattr(page, "path", path)
-            pages_list.append(page)
+    @profiled
+    def add_pdfs(self, sources, progress=None, cancel=None):
+        """
+        Append pages of several pdfs to ``pages`` and ``pages_original``.
+
+        Either every page is added or, if cancelled, none are.
 
+        Args:
+            sources: A list of ``(path, indices)`` or ``(path, indices, password)`` tuples as taken by ``add_pdf``.
+            progress: A callable taking ``(done, total)`` called after each page. Defaults to None.
+            cancel: A CancelToken object checked between pages. Defaults to None.
+        """
+        self._add_sources(sources, progress, cancel)
 
+
+    def _add_sources(self, sources, progress=None, cancel=None):
+        selection = []
+        for path, indices, *password in sources:
+            num_pages = self._get_num_pages(path, *password)
+            if indices is None:
+                indices = range(num_pages)
+            elif any(i < 0 or i >= num_pages for i in indices):
+                raise IndexError(f"page index out of range for '{path}'")
+            selection += [(path, i) for i in indices]
+
+        refs = [PageRef(path, i) for path, i in track(selection, progress, cancel)]
+
+        self.pages_original += refs
+        self.pages += refs
+        self.profiler.count("pages", len(refs))
+
+
+    @profiled
     def pop_pages(self, indices=None):
         """Pop pages at specified indices."""
         if indices is None:
@@ -102,6 +380,7 @@ class PdfManager:
                 self.pages.pop(i)
 
 
+    @profiled
     def rearrange_pages(self, order):
         """Return ``pages`` after rearranging based on specified order."""
         assert len(self.pages) == len(order)
@@ -114,22 +393,31 @@ class PdfManager:
 
     def reset_page(self, index):
         """Resets state of specified page to when it was initially added."""
-        self.pages[index] = self.pages_original[index]
+        original = self.pages_original[index]
+        if not isinstance(original, PageRef):
+            original = copy_page(original)
+        self.pages[index] = original
     
 
     def get_page_dims(self, index):
         """Return dimension of specified page in the format: (width, height)."""
-        box = self.pages[index].mediabox
+        page = self.get_page(index)
+        box = page.mediabox
+        if "/UserUnit" in page:
+            return box.width * page.user_unit, box.height * page.user_unit
         return box.width, box.height
 
 
-    def preview(self, indices=None):
+    @profiled
+    def preview(self, indices=None, progress=None, cancel=None):
         """
         Open pdf of specified pages in default pdf viewer program.
 
         Args:
             indices: A list of indices of pages to preview. Defaults to None. 
                 If None, all pages will be previewed.
+            progress: A callable taking ``(done, total)`` called after each page. Defaults to None.
+            cancel: A CancelToken object checked between pages. Defaults to None.
         
         Returns:
             The tempfile object used create the preview pdf.
@@ -141,28 +429,520 @@ class PdfManager:
             indices = range(len(self.pages))
 
         with PdfWriter() as writer:
-            for i in indices:
-                writer.add_page(self.pages[i])
+            for i in track(indices, progress, cancel):
+                writer.add_page(self.get_page(i))
+            set_version(writer)
             
+            self.preview_file.seek(0)
+            self.preview_file.truncate()
             writer.write(self.preview_file)
+            self.preview_file.flush()
+            self.profiler.count("pages", len(indices))
+            self.profiler.count("bytes_written", self.preview_file.tell())
             os.startfile(self.preview_file.name)
 
         return self.preview_file
 
 
-    def save_as(self, new_file):
+    @profiled
+    def save_as(self, new_file, progress=None, cancel=None, skip_duplicates=False, linearize=False,
+                incremental=False, max_workers=None):
         """
         Combine ``pages`` and save as new file.
 
+        Paths are written to a temporary file that replaces ``new_file`` only
+        once writing succeeds, so a cancelled or failed save leaves no partial file.
+        Outlines, named destinations and internal links of the source pdfs are
+        remapped onto the saved pages; see ``outline.Navigation``. With a ``cache``,
+        a path is copied from an earlier save of the same pages and options instead.
+
         Args:
-            new_file: A path to write new pdf file to.
+            new_file: A path or writable stream to write new pdf file to.
+            progress: A callable taking ``(done, total)`` called after each page. Defaults to None.
+            cancel: A CancelToken object checked between pages. Defaults to None.
+            skip_duplicates: Whether to write pages identical to an earlier page only once.
+                Defaults to False. See ``find_duplicates``.
+            linearize: Whether to write a linearized ("fast web view") pdf whose first
+                page can be shown before the whole file is downloaded. Defaults to False.
+            incremental: Whether to append only the edits to the bytes of the source pdf,
+                so saving takes time proportional to the edit rather than the document.
+                Defaults to False. Every page must come from the same source, at most once.
+                Saving to the source's own path appends to it in place.
+            max_workers: Maximum number of processes used to serialize documents of
+                more than ``SHARD_PAGES`` pages. Defaults to None.
+                If None, one process per CPU is used. The output does not depend on it.
+
+        Raises:
+            OperationCanceled: If ``cancel`` is cancelled before all pages are written.
+            ValueError: If ``incremental`` is set and the pages cannot be saved incrementally.
         """
-        with PdfWriter() as writer:
-            for page in self.pages:
-                writer.add_page(page)
-            writer.write(new_file)
+        indices = range(len(self.pages))
+        if skip_duplicates:
+            duplicates = set(self.duplicate_indices())
+            indices = [i for i in indices if i not in duplicates]
+
+        if incremental:
+            self._save_incremental(new_file, indices, progress, cancel)
+            return
+
+        key = None
+        if self.cache is not None and isinstance(new_file, (str, bytes, os.PathLike)):
+            key = self._result_key(indices, "save_as", linearize)
+            cached = self.cache.get(key)
+            if cached is not None:
+                _write_atomic(lambda stream: _copy_file(cached[0], stream), new_file, cancel)
+                self.profiler.count("cache_hits")
+                self.profiler.count("bytes_written", _written_size(new_file))
+                return
+            self.profiler.count("cache_misses")
+
+        navigation = self._navigation(indices)
+        linked = self._linked_pages(indices, navigation)
+
+        if len(indices) > SHARD_PAGES and not linearize:
+            shards = self._shards(indices, max_workers, linked)
+            _write_atomic(lambda stream: write_sharded(shards, stream, max_workers, progress, cancel,
+                                                       self.readers, navigation), new_file, cancel)
+            self.profiler.count("shards", len(shards))
+        else:
+            with PdfWriter() as writer:
+                for i in track(indices, progress, cancel):
+                    writer.add_page(linked[i] if i in linked else self.get_page(i))
+                if navigation is not None:
+                    navigation.write(writer.root_object, writer._add_object,
+                                     [page.indirect_reference for page in writer.pages])
+                set_version(writer)
+                write = write_linearized if linearize else PdfWriter.write
+                _write_atomic(lambda stream: write(writer, stream), new_file, cancel)
+
+        if key is not None:
+            self.cache.put(key, [new_file])
+        self.profiler.count("pages", len(indices))
+        self.profiler.count("bytes_written", _written_size(new_file))
+
+
+    def _result_key(self, indices, *options):
+        """
+        Return the ``cache`` key of writing the pages at ``indices`` with ``options``.
+
+        Source pages are described by the digest of their source file and the
+        entries changed since they were read; other pages by their value.
+        """
+        parts = [repr(options).encode()]
+        memo = {}
+        # With ``cache.verify`` each digest hashes the whole file, so each source is hashed once per key.
+        digests = {}
+
+        def digest(path):
+            if path not in digests:
+                digests[path] = self.cache.source_digest(path).encode()
+            return digests[path]
+
+        for i in indices:
+            page = self.pages[i]
+            spec = self._page_spec(page)
+            if spec is not None:
+                path, source_index, overrides = spec
+                part = b"S%s %d" % (digest(path), source_index)
+                for key in sorted(overrides or {}):
+                    part += b" " + _serialize(NameObject(key)) + b" " + _serialize(overrides[key])
+            else:
+                source = _page_source(page)
+                origin = digest(source[0]) if source is not None else b""
+                part = b"P%s %s" % (origin, value_digest(self.get_page(i), memo))
+            parts.append(part)
+        return self.cache.key(parts)
+
+
+    def _navigation(self, indices):
+        """Return the Navigation of the sources of the pages at ``indices``, or None if they have none to keep."""
+        entries = []
+        readers = {}
+        for i in indices:
+            page = self.pages[i]
+            source = _page_source(page)
+            if source is None:
+                entries.append(None)
+                continue
+
+            path, source_index = source
+            if isinstance(page, PageRef):
+                if path not in readers:
+                    readers[path] = self._get_reader(path)
+                reader = readers[path]
+                page = open_page(reader, source_index, page.overrides)
+            else:
+                reader = page.pdf
+            entries.append((path, reader, source_index, page))
+
+        navigation = Navigation(entries)
+        self.profiler.count("links_remapped", len(navigation.annots))
+        return navigation if navigation else None
+
+
+    def _linked_pages(self, indices, navigation):
+        """Return copies of the pages whose links ``navigation`` remapped, keyed by their index in ``pages``."""
+        linked = {}
+        if navigation is not None:
+            for position, annots in navigation.annots.items():
+                page = copy_page(self.get_page(indices[position]))
+                if annots:
+                    page[NameObject("/Annots")] = annots
+                else:
+                    del page["/Annots"]
+                linked[indices[position]] = page
+        return linked
+
+
+    def _shards(self, indices, max_workers=None, linked=None):
+        """
+        Split the pages at ``indices`` into shards of ``SHARD_PAGES`` pages for ``write_sharded``.
+
+        Shards of source pages edited only in their own entries (e.g. boxes) are
+        described by page specs, so worker processes can read them from their
+        sources. Other shards, or all of them with a single worker, hold pages.
+        Spec'd pages are opened the same way in either case, so the output is identical.
+        Pages in ``linked``, a dict of pages keyed by index, replace those of ``pages``.
+        """
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        linked = linked or {}
+        specs = [None if i in linked else self._page_spec(self.pages[i]) for i in indices]
+
+        shards = []
+        for start in range(0, len(indices), SHARD_PAGES):
+            shard = specs[start:start+SHARD_PAGES]
+            if max_workers <= 1 or None in shard:
+                shard = self._spec_pages(indices[start:start+SHARD_PAGES], shard, linked)
+            shards.append(shard)
+        return shards
+
+
+    def _spec_pages(self, indices, specs, linked=None):
+        """Return the pages at ``indices``, opening those with a spec the way worker processes do."""
+        linked = linked or {}
+        return [open_page(self._get_reader(spec[0]), *spec[1:]) if spec is not None
+                else linked[i] if i in linked else self.get_page(i)
+                for i, spec in zip(indices, specs)]
+
+
+    def _page_spec(self, page):
+        """Return ``(path, source_index, overrides)`` of ``page`` as taken by ``write_shard``, or None."""
+        source = _page_source(page)
+        if source is None or source[0] in self._increments:
+            return None
+        if isinstance(page, PageRef):
+            return source + (page.overrides,)
+
+        path = source[0]
+        stat = os.stat(path)
+        if page.pdf is not self.readers.get(path) or self._reader_stats[path] != (stat.st_mtime_ns, stat.st_size):
+            return None
+        overrides = _page_overrides(page, page.indirect_reference.get_object())
+        if overrides is None:
+            return None
+        return source + (overrides or None,)
+
+
+    def _save_incremental(self, new_file, indices, progress=None, cancel=None):
+        paths = {(_page_source(self.pages[i]) or (None,))[0] for i in indices}
+        if len(paths) != 1 or None in paths:
+            raise ValueError("incremental saves need every page to come from one source pdf")
+        path = paths.pop()
+        reader = self._get_reader(path)
+
+        # Once pages are removed or moved, the source's outline and links point at the wrong pages.
+        navigation = linked = None
+        if [_page_source(self.pages[i])[1] for i in indices] != list(range(len(reader.pages))):
+            navigation = self._navigation(indices) or Navigation([])
+            linked = self._linked_pages(indices, navigation)
+
+        pages = []
+        for i in track(indices, progress, cancel):
+            page = self.pages[i]
+            if linked and i in linked:
+                page = linked[i]
+            pages.append(self._load_page(page) if isinstance(page, PageRef) else page)
+
+        previous = self._increments.get(path, (None, None))
+        in_place = (isinstance(new_file, (str, bytes, os.PathLike)) and os.path.exists(new_file)
+                    and os.path.samefile(new_file, path))
+        if in_place:
+            with open(path, "r+b") as file:
+                end = file.seek(0, os.SEEK_END)
+                try:
+                    increment = write_increment(reader, pages, file, *previous, navigation)
+                    if cancel is not None:
+                        cancel.raise_if_cancelled()
+                except BaseException:
+                    file.truncate(end)
+                    raise
+            # The pooled reader still describes the pages of this session, so it stays valid.
+            stat = os.stat(path)
+            self._reader_stats[path] = (stat.st_mtime_ns, stat.st_size)
+            self._increments[path] = increment
+            written = stat.st_size - end
+        else:
+            def write(stream):
+                with open(path, "rb") as source:
+                    shutil.copyfileobj(source, stream)
+                write_increment(reader, pages, stream, *previous, navigation)
+            _write_atomic(write, new_file, cancel)
+            written = _written_size(new_file)
+
+        self.profiler.count("pages", len(pages))
+        self.profiler.count("bytes_written", written)
     
 
+    @profiled
+    def split_to(self, spec, output_dir, max_bytes=None, prefix="part_", max_workers=None,
+                 progress=None, cancel=None):
+        """
+        Split ``pages`` into several pdfs, written concurrently on a process pool.
+
+        Groups of source pages are written by worker processes, which parse each
+        source once however many pdfs use it; other groups are written in this
+        process meanwhile. Files are numbered in page order and only appear in
+        ``output_dir`` once every group is written.
+
+        Args:
+            spec: How to group pages into pdfs. One of:
+                "source": one pdf per source pdf, in order of first appearance.
+                An int N: one pdf per N pages.
+                A list of lists of indices of ``pages``: one pdf per list.
+                None: one pdf of all pages, e.g. to split only by ``max_bytes``.
+            output_dir: A path to the directory to write to. Created if missing.
+            max_bytes: Maximum size of each pdf in bytes, estimated while pages are
+                added. Groups that would be larger are split further. Defaults to None.
+            prefix: Start of the file names, e.g. "part_" gives ``part_001.pdf``. Defaults to "part_".
+            max_workers: Maximum number of processes. Defaults to None.
+                If None, one process per CPU is used.
+            progress: A callable taking ``(done, total)`` called after each group
+                with the number of pages written. Defaults to None.
+            cancel: A CancelToken object checked between groups. Defaults to None.
+
+        Returns:
+            A list of paths of the pdfs written.
+
+        Raises:
+            ValueError: If ``spec`` is not one of the above.
+            IndexError: If ``spec`` lists an index out of range.
+            OperationCanceled: If ``cancel`` is cancelled before all pdfs are written.
+                No pdf is left behind.
+        """
+        groups = self._split_groups(spec)
+        os.makedirs(output_dir, exist_ok=True)
+        total = sum(len(group) for group in groups)
+
+        key = cached = None
+        if self.cache is not None:
+            key = self._result_key(range(len(self.pages)), "split_to", groups, max_bytes)
+            cached = self.cache.get(key)
+        if cached is not None:
+            temporary = _copy_temporary(cached, output_dir)
+            self.profiler.count("cache_hits")
+            if progress is not None:
+                progress(total, total)
+        else:
+            temporary = self._write_groups(groups, output_dir, max_bytes, max_workers, progress, cancel)
+            if key is not None:
+                self.profiler.count("cache_misses")
+
+        width = max(3, len(str(len(temporary))))
+        outputs = []
+        for n, path in enumerate(temporary, 1):
+            outputs.append(os.path.join(output_dir, f"{prefix}{n:0{width}}.pdf"))
+            os.replace(path, outputs[-1])
+
+        if key is not None and cached is None:
+            self.cache.put(key, outputs)
+        self.profiler.count("pages", total)
+        self.profiler.count("files", len(outputs))
+        self.profiler.count("bytes_written", sum(os.path.getsize(path) for path in outputs))
+        return outputs
+
+
+    def _write_groups(self, groups, output_dir, max_bytes=None, max_workers=None, progress=None, cancel=None):
+        """Write ``groups`` of ``split_to`` to temporary files in ``output_dir`` and return their paths in order."""
+        specs = [[self._page_spec(self.pages[i]) for i in group] for group in groups]
+        remote = [j for j, group in enumerate(specs) if None not in group]
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        max_workers = min(max_workers, len(remote))
+
+        results = [None] * len(groups)
+        total, done = sum(len(group) for group in groups), 0
+        executor = ProcessPoolExecutor(max_workers=max_workers, **worker_options()) if max_workers > 1 else None
+        futures = {}
+        try:
+            if executor is not None:
+                futures = {executor.submit(write_source_parts, specs[j], output_dir, max_bytes): j for j in remote}
+            for j in set(range(len(groups))) - set(futures.values()):
+                if cancel is not None:
+                    cancel.raise_if_cancelled()
+                results[j] = write_parts(self._spec_pages(groups[j], specs[j]), output_dir, max_bytes)
+                done += len(groups[j])
+                if progress is not None:
+                    progress(done, total)
+
+            pending = set(futures)
+            while pending:
+                if cancel is not None:
+                    cancel.raise_if_cancelled()
+                finished, pending = wait(pending, timeout=Prefetch.POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    results[futures[future]] = future.result()
+                    done += len(groups[futures[future]])
+                    if progress is not None:
+                        progress(done, total)
+        except BaseException:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+                for future, j in futures.items():
+                    if not future.cancelled() and future.exception() is None:
+                        results[j] = future.result()
+            for path in [path for paths in results if paths for path in paths]:
+                os.unlink(path)
+            raise
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        return [path for paths in results for path in paths]
+
+
+    def _split_groups(self, spec):
+        """Return lists of indices of ``pages`` that make up each pdf of ``split_to``."""
+        num_pages = len(self.pages)
+        if spec is None:
+            return [list(range(num_pages))] if num_pages else []
+        if isinstance(spec, str) and spec == "source":
+            groups = {}
+            for i, page in enumerate(self.pages):
+                groups.setdefault(page.path, []).append(i)
+            return list(groups.values())
+        if isinstance(spec, int) and not isinstance(spec, bool):
+            if spec <= 0:
+                raise ValueError("number of pages per pdf must be positive")
+            return [list(range(start, min(start + spec, num_pages))) for start in range(0, num_pages, spec)]
+        if isinstance(spec, (list, tuple)):
+            groups = [list(group) for group in spec if len(group)]
+            if any(i < 0 or i >= num_pages for group in groups for i in group):
+                raise IndexError("page index out of range")
+            return groups
+        raise ValueError(f"invalid split spec: {spec!r}")
+
+
+    @profiled
+    def fingerprints(self, max_workers=None):
+        """
+        Return a fingerprint of each page of ``pages``.
+
+        Pages that look identical (same decoded content, same resources by value,
+        same visible size and rotation) share a fingerprint, even across source
+        files. Unedited pages are hashed per source on a process pool and cached,
+        so repeated calls only hash pages whose content was edited.
+
+        Args:
+            max_workers: Maximum number of processes. Defaults to None.
+                If None, one process per CPU is used.
+
+        Returns:
+            A list of hex strings in the same order as ``pages``.
+        """
+        jobs = {}
+        for page in self.pages:
+            source = _page_source(page)
+            if source is not None and source not in self._fingerprints:
+                jobs.setdefault(source[0], set()).add(source[1])
+
+        for path, digests in fingerprint_sources(jobs, max_workers).items():
+            for i, digest in digests.items():
+                self._fingerprints[(path, i)] = digest
+        self.profiler.count("pages_hashed", sum(len(indices) for indices in jobs.values()))
+
+        memo = {}
+        fingerprints = []
+        for page in self.pages:
+            source = _page_source(page)
+            if isinstance(page, PageRef) and page.overrides:
+                page = self._load_page(page)
+            if source is None:
+                content, geometry = content_digest(page, memo), geometry_digest(page)
+            else:
+                content, geometry = self._fingerprints[source]
+                if not isinstance(page, PageRef):
+                    geometry = geometry_digest(page)
+                    if not _same_content(page, self._load_page(PageRef(*source))):
+                        content = content_digest(page, memo)
+            fingerprints.append(page_fingerprint(content, geometry))
+        return fingerprints
+
+
+    def find_duplicates(self, max_workers=None):
+        """
+        Return groups of indices of ``pages`` that are identical to each other.
+
+        Each group is sorted and has at least 2 indices; groups are sorted by their first index.
+        """
+        groups = {}
+        for i, fingerprint in enumerate(self.fingerprints(max_workers)):
+            groups.setdefault(fingerprint, []).append(i)
+        return [group for group in groups.values() if len(group) > 1]
+
+
+    def duplicate_indices(self, max_workers=None):
+        """Return indices of ``pages`` that are identical to an earlier page, ready for ``pop_pages``."""
+        return sorted(i for group in self.find_duplicates(max_workers) for i in group[1:])
+
+
+    def remove_duplicates(self, max_workers=None):
+        """Pop pages identical to an earlier page and return their former indices."""
+        indices = self.duplicate_indices(max_workers)
+        self.pop_pages(indices)
+        return indices
+
+
+    @profiled
+    def find_blank_pages(self, max_workers=None):
+        """
+        Return indices of blank pages of ``pages``, ready for ``pop_pages``.
+
+        Pages are first judged from their structure alone: no content, or no
+        marks other than images that compress too well to hold much. Only the
+        images of pages left ambiguous are decoded, on a process pool, and
+        judged blank if nearly all of their samples are white.
+
+        Args:
+            max_workers: Maximum number of processes. Defaults to None.
+                If None, one process per CPU is used.
+        """
+        blank = []
+        jobs = {}
+        for i, page in enumerate(self.pages):
+            source = _page_source(page)
+            if isinstance(page, PageRef):
+                page = self._load_page(page)
+
+            verdict, images = classify_page(page)
+            if verdict == BLANK:
+                blank.append(i)
+            elif verdict == AMBIGUOUS:
+                if source is not None and _same_resources(page, self._load_page(PageRef(*source))):
+                    jobs.setdefault(source[0], []).append((i, source[1]))
+                elif page_is_blank(page, images):
+                    blank.append(i)
+
+        results = check_sources({path: {j for _, j in pages} for path, pages in jobs.items()}, max_workers)
+        for path, pages in jobs.items():
+            blank += [i for i, j in pages if results[(path, j)]]
+
+        self.profiler.count("pages", len(self.pages))
+        self.profiler.count("pages_decoded", sum(len(pages) for pages in jobs.values()))
+        return sorted(blank)
+
+
+    @profiled
     def crop(self, index, margin):
         """
         Crop specified page by given margin.
@@ -170,7 +950,8 @@ class PdfManager:
         Args:
             index: The position of page in ``pages`` to crop from.
             margin: A tuple of values to crop each side by in the format:
-                (left, bottom, right, top).
+                (left, bottom, right, top). Values are in the units of
+                ``get_page_dims``, so /UserUnit is taken into account.
 
         Returns:
             A tuple that contains the additive inverse of each value in ``margin``.
@@ -181,17 +962,51 @@ class PdfManager:
         """
         assert len(margin) == 4
 
-        box = self.pages[index].mediabox
+        page = self.get_page(index)
+        box = page.mediabox
+        unit = page.user_unit
 
-        box.left += margin[LEFT]
-        box.bottom += margin[BOTTOM]
-        box.right -= margin[RIGHT]
-        box.top -= margin[TOP]
+        box.left += margin[LEFT] / unit
+        box.bottom += margin[BOTTOM] / unit
+        box.right -= margin[RIGHT] / unit
+        box.top -= margin[TOP] / unit
+        self.profiler.count("pages")
 
         return -margin[0], -margin[1], -margin[2], -margin[3]
 
 
-    def scale_to(self, index, target):
+    @profiled
+    def rotate(self, indices, degrees):
+        """
+        Rotate specified pages clockwise by given degrees.
+
+        Only the /Rotate entry of each page changes, so content streams are
+        left as they are and saving costs no more than for an untouched page.
+
+        Args:
+            indices: A list of positions of pages in ``pages`` to rotate.
+            degrees: A multiple of 90. Negative values rotate counterclockwise.
+
+        Returns:
+            The additive inverse of ``degrees``.
+            Passing the return value as ``degrees`` argument will undo the initial rotation.
+
+        Raises:
+            ValueError: If ``degrees`` is not a multiple of 90.
+        """
+        if degrees % 90:
+            raise ValueError("pages can only be rotated by multiples of 90 degrees")
+
+        for index in indices:
+            page = self.get_page(index)
+            page.rotation = (page.rotation + degrees) % 360
+        self.profiler.count("pages", len(indices))
+
+        return -degrees
+
+
+    @profiled
+    def scale_to(self, index, target, box_only=False):
         """
         Scale specified page to given target.
 
@@ -202,6 +1017,9 @@ class PdfManager:
                 
                 If width is None, X axis will automatically scale to keep aspect ratio.
                 If height is None, Y axis will automatically scale to keep aspect ratio.
+            box_only: Whether to scale through /UserUnit instead of rewriting
+                the content streams. Defaults to False. Content is scaled
+                uniformly to fit ``target`` and centered on a page of that size.
 
         Returns:
             A tuple of page dimensions prior to scaling.
@@ -214,17 +1032,366 @@ class PdfManager:
         """
         assert len(target) == 2
 
-        page = self.pages[index]
+        page = self.get_page(index)
         init_dims = self.get_page_dims(index)
 
-        if target[0] is None:
+        if not box_only:
+            # Scaling rewrites the content stream and moves annotations in place, and both belong to the shared source.
+            self._own_contents(page)
+            if "/Annots" in page:
+                self._own_annotations(page)
+
+        if box_only:
+            _scale_units(page, init_dims, target)
+        elif target[0] is None:
             factor = target[1] / init_dims[1]
             page.scale_by(factor)
         elif target[1] is None:
             factor = target[0] / init_dims[0]
             page.scale_by(factor)
         else:
-            page.scale_to(*target)
+            # pypdf scales the raw boxes, whose units are /UserUnit long.
+            page.scale_to(target[0] / page.user_unit, target[1] / page.user_unit)
+
+        self.profiler.count("pages")
 
         return init_dims
-    
\ No newline at end of file
+
+
+    def _edit_writer(self):
+        """Return the PdfWriter that hosts objects owned by single pages, creating it on first use."""
+        if self._edit_doc is None:
+            self._edit_doc = PdfWriter()
+            self._sheet_docs.append(self._edit_doc)
+        return self._edit_doc
+
+
+    def _own_contents(self, page):
+        """Replace the content streams of ``page`` with one stream that only it uses."""
+        contents = page.get_contents()
+        if contents is None:
+            return
+        content = DecodedStreamObject()
+        content.set_data(contents.get_data())
+        page[NameObject("/Contents")] = self._edit_writer()._add_object(content)
+
+
+    def _own_annotations(self, page):
+        """Replace the annotations of ``page`` with copies that only it uses."""
+        self._edit_writer()
+        annots = ArrayObject()
+        for reference in page["/Annots"]:
+            annot = DictionaryObject(reference.get_object())
+            if "/Rect" in annot:
+                annot[NameObject("/Rect")] = ArrayObject(annot["/Rect"])
+            annots.append(self._edit_doc._add_object(annot))
+        page[NameObject("/Annots")] = annots
+
+
+    @profiled
+    def stamp(self, path, indices=None, source_index=0, under=False, progress=None, cancel=None):
+        """
+        Draw a page of another pdf, e.g. a "CONFIDENTIAL" watermark, on specified pages.
+
+        The stamp becomes one form XObject that every page draws by reference
+        with a short operator stream, so its content is stored once however many
+        pages show it. It is scaled uniformly to fit each page, upright and centered.
+
+        Args:
+            path: A path to the pdf of the stamp.
+            indices: A list of positions of pages in ``pages`` to stamp. Defaults to None.
+                If None, all pages are stamped.
+            source_index: The index of the stamp's page in its pdf. Defaults to 0.
+            under: Whether to draw the stamp beneath page content. Defaults to False.
+            progress: A callable taking ``(done, total)`` called after each page. Defaults to None.
+            cancel: A CancelToken object checked between pages. Defaults to None.
+                If cancelled, ``pages`` is left unchanged.
+        """
+        stamp_page = self._get_reader(path).pages[source_index]
+        doc = PdfWriter()
+        stamper = Stamper(doc)
+        xobject = doc._add_object(page_to_xobject(stamp_page))
+        self._draw_pages(doc, indices, lambda page, i: stamper.stamp(page, stamp_page, xobject, under),
+                         progress, cancel)
+
+
+    @profiled
+    def label(self, text, indices=None, start=1, position=(36, 36), font_size=10, progress=None, cancel=None):
+        """
+        Write a line of text, e.g. a header or Bates number, on specified pages.
+
+        Every page uses one shared font, and pages showing the same text share
+        one operator stream, so labelling adds a few bytes per page.
+
+        Args:
+            text: The text to write. Replacement fields are filled with a number
+                counting up from ``start`` over the labelled pages, so "ABC{:06}"
+                writes the Bates numbers ABC000001, ABC000002, ...
+            indices: A list of positions of pages in ``pages`` to label. Defaults to None.
+                If None, all pages are labelled.
+            start: The number of the first labelled page. Defaults to 1.
+            position: A tuple of the start of the text's baseline in the format: (x, y),
+                measured from the lower-left corner of each page as shown.
+            font_size: Size of the text. Defaults to 10.
+            progress: A callable taking ``(done, total)`` called after each page. Defaults to None.
+            cancel: A CancelToken object checked between pages. Defaults to None.
+                If cancelled, ``pages`` is left unchanged.
+        """
+        doc = PdfWriter()
+        stamper = Stamper(doc)
+        self._draw_pages(doc, indices, lambda page, i: stamper.text(page, text.format(start + i), position,
+                                                                    font_size), progress, cancel)
+
+
+    def _draw_pages(self, doc, indices, draw, progress=None, cancel=None):
+        """Replace the pages at ``indices`` with copies passed to ``draw`` along with their count."""
+        if indices is None:
+            indices = range(len(self.pages))
+        indices = list(dict.fromkeys(indices))
+
+        drawn = []
+        for i, index in enumerate(track(indices, progress, cancel)):
+            page = copy_page(self.get_page(index))
+            draw(page, i)
+            drawn.append(page)
+
+        for index, page in zip(indices, drawn):
+            self.pages[index] = page
+        self._sheet_docs.append(doc)
+        self.profiler.count("pages", len(drawn))
+
+
+    @profiled
+    def impose(self, rows=1, cols=2, sheet_size=None, margin=(0, 0, 0, 0), gap=0,
+               booklet=False, progress=None, cancel=None):
+        """
+        Replace ``pages`` with sheets that each show several pages.
+
+        Every page is turned into one form XObject that sheets draw by reference,
+        so a page's content is stored once no matter how many sheets show it.
+        Pages are scaled uniformly to fit their cell and keep their rotation upright.
+
+        Args:
+            rows: Number of rows of pages on each sheet. Defaults to 1.
+            cols: Number of columns of pages on each sheet. Defaults to 2.
+            sheet_size: A tuple of sheet dimensions in the format: (width, height).
+                Defaults to None. If None, sheets are the size of the first page,
+                or two first pages side by side for a booklet.
+            margin: A tuple of blank space around each sheet's grid in the format:
+                (left, bottom, right, top).
+            gap: Blank space between neighbouring pages on a sheet.
+            booklet: Whether to lay pages out 1x2 in saddle-stitch order. Defaults to False.
+                If True, ``rows`` and ``cols`` are ignored.
+            progress: A callable taking ``(done, total)`` called after each sheet. Defaults to None.
+            cancel: A CancelToken object checked between sheets. Defaults to None.
+                If cancelled, ``pages`` is left unchanged.
+
+        Returns:
+            The new ``pages``.
+        """
+        if not self.pages:
+            return self.pages
+
+        if booklet:
+            rows, cols = 1, 2
+            slots = [i for side in booklet_order(len(self.pages)) for i in side]
+        else:
+            slots = list(range(len(self.pages)))
+
+        if sheet_size is None:
+            box = visible_box(self.get_page(0))
+            sheet_size = (box.width*2, box.height) if booklet else (box.width, box.height)
+
+        cells = grid_cells(sheet_size, rows, cols, margin, gap)
+        doc = PdfWriter()
+        xobjects = {}
+
+        def xobject_reference(page):
+            if id(page) not in xobjects:
+                xobjects[id(page)] = doc._add_object(page_to_xobject(page))
+            return xobjects[id(page)]
+
+        sheets = []
+        starts = range(0, len(slots), len(cells))
+        for start in track(starts, progress, cancel):
+            pages = [self.get_page(i) if i is not None else None for i in slots[start:start+len(cells)]]
+            placements = [(xobject_reference(page), placement(page, cell))
+                          for page, cell in zip(pages, cells) if page is not None]
+            sheet = make_sheet(doc, sheet_size, placements)
+            setattr(sheet, "path", IMPOSED_PATH)
+            setattr(sheet, "source_index", len(sheets))
+            sheets.append(sheet)
+
+        self._sheet_docs.append(doc)
+        self.pages = sheets
+        self.pages_original = list(sheets)
+        self.profiler.count("pages", len(slots))
+        self.profiler.count("sheets", len(sheets))
+        return self.pages
+
+
+class PageRef:
+    """
+    Reference to a page of a source pdf that has not been parsed yet, or was evicted.
+
+    Attributes:
+        path: The path of the source pdf.
+        source_index: The index of the page within the source pdf.
+        overrides: A dict of page entries that replace those of the source page,
+            e.g. boxes edited before the page was evicted, or None.
+    """
+
+    def __init__(self, path, source_index, overrides=None):
+        self.path = path
+        self.source_index = source_index
+        self.overrides = overrides
+
+    def __repr__(self):
+        if self.overrides:
+            return f"PageRef({self.path!r}, {self.source_index}, {self.overrides!r})"
+        return f"PageRef({self.path!r}, {self.source_index})"
+
+
+def _page_source(page):
+    """Return ``(path, source_index)`` of a page read from a source pdf, or None for generated pages."""
+    if isinstance(page, PageRef) or isinstance(page.pdf, PdfReader):
+        return page.path, page.source_index
+    return None
+
+
+def _same_content(page, original, keys=("/Contents", "/Resources", "/Annots")):
+    """Whether ``page`` still draws with the content, resources and annotations of ``original``."""
+    def raw(page, key):
+        return page.raw_get(key) if key in page else None
+    return all(raw(page, key) is raw(original, key) for key in keys)
+
+
+def _same_resources(page, original):
+    """Whether ``page`` still uses the resources of ``original``."""
+    return _same_content(page, original, keys=("/Resources",))
+
+
+def _page_overrides(page, original):
+    """Return the entries of ``page`` that differ from ``original``, or None if any of them refers to other objects."""
+    if any(key not in page for key in original):
+        return None
+    overrides = {}
+    for key in page:
+        value = page.raw_get(key)
+        if key in original and (value is original.raw_get(key) or value == original.raw_get(key)):
+            continue
+        if _has_references(value):
+            return None
+        overrides[key] = value
+    return overrides
+
+
+def _serialize(obj):
+    stream = BytesIO()
+    obj.write_to_stream(stream)
+    return stream.getvalue()
+
+
+def _has_references(obj):
+    if isinstance(obj, (IndirectObject, StreamObject)):
+        return True
+    if isinstance(obj, dict):
+        return any(_has_references(value) for value in obj.values())
+    if isinstance(obj, list):
+        return any(_has_references(item) for item in obj)
+    return False
+
+
+def _scale_units(page, dims, target):
+    """Scale ``page`` from ``dims`` to ``target`` by its /UserUnit, growing its boxes along the looser axis."""
+    factor = min(size / dim for size, dim in zip(target, dims) if size is not None)
+    unit = page.user_unit * factor
+    page[NameObject("/UserUnit")] = FloatObject(unit)
+
+    boxes = [page.mediabox]
+    if "/CropBox" in page:
+        boxes.append(page.cropbox)
+    for box in boxes:
+        if target[0] is not None:
+            grow = (target[0] / unit - float(box.width)) / 2
+            box.left -= grow
+            box.right += grow
+        if target[1] is not None:
+            grow = (target[1] / unit - float(box.height)) / 2
+            box.bottom -= grow
+            box.top += grow
+
+
+def copy_page(page):
+    """
+    Return a shallow copy of ``page`` that can be edited independently.
+
+    The copy shares content streams and resources with ``page`` but owns its
+    page boxes, so crops and scales of one copy never leak into another.
+    """
+    new_page = PageObject(page.pdf, page.indirect_reference)
+    new_page.update(page)
+    for key in BOX_KEYS:
+        if key in new_page:
+            new_page[NameObject(key)] = RectangleObject(new_page[key].get_object())
+    for attr in ("path", "source_index"):
+        if hasattr(page, attr):
+            setattr(new_page, attr, getattr(page, attr))
+    return new_page
+
+
+def _write_atomic(write, new_file, cancel=None):
+    """
+    Write a pdf to ``new_file``, via a temporary file if ``new_file`` is a path.
+
+    Args:
+        write: A callable that writes the pdf to the binary stream it is given.
+        new_file: A path or writable stream.
+        cancel: A CancelToken object checked before the file is replaced. Defaults to None.
+    """
+    if not isinstance(new_file, (str, bytes, os.PathLike)):
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        write(new_file)
+        return
+
+    directory = os.path.dirname(os.path.abspath(new_file))
+    fd, temp_path = tempfile.mkstemp(suffix='.pdf', dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as temp_file:
+            write(temp_file)
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        os.replace(temp_path, new_file)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def _copy_file(path, stream):
+    with open(path, "rb") as file:
+        shutil.copyfileobj(file, stream)
+
+
+def _copy_temporary(paths, directory):
+    """Copy the files at ``paths`` to new temporary files in ``directory`` and return their paths."""
+    copies = []
+    try:
+        for path in paths:
+            fd, copy = tempfile.mkstemp(suffix=".pdf", dir=directory)
+            copies.append(copy)
+            with os.fdopen(fd, "wb") as file:
+                _copy_file(path, file)
+    except BaseException:
+        for copy in copies:
+            os.unlink(copy)
+        raise
+    return copies
+
+
+def _written_size(file):
+    """Return the size of a written file given its path or stream."""
+    if isinstance(file, (str, bytes, os.PathLike)):
+        return os.path.getsize(file)
+    return file.tell()
+
@@ -2,15 +2,18 @@ import tkinter as tk
 from tkinter import filedialog
 from app import App, Page, Action, Loop, OFFSET
 from pdf import PdfManager
-import os, sys
+from progress import CancelToken, OperationCanceled
+from pypdf.errors import WrongPasswordError
+import contextlib, getpass, os, signal, sys
 
 YES_RESPONSES = ["Y", "YES"]
 NO_RESPONSES = ["N", "NO"]
 PDF_FILETYPE = ("PDF Files", '*.pdf')
+BOOKLET_RESPONSES = ["B", "BOOKLET"]
 
 class PdfEditor:
-    def __init__(self):
-        self.manager = PdfManager()
+    def __init__(self, max_memory=None):
+        self.manager = PdfManager(max_memory=max_memory)
         self.setup_app()
 
     
@@ -20,6 +23,7 @@ class PdfEditor:
 
     def __exit__(self, *exc):
         self.manager.close()
+        self.manager.profiler.close()
         self.start_page = None
         self.edit_page = None
         self.app = None
@@ -43,6 +47,10 @@ class PdfEditor:
             label="Scale Page",
             func=self.scale_page)
         
+        rotate_action = Action(
+            label="Rotate Pages",
+            func=self.rotate_pages)
+        
         reset_action = Action(
             label="Reset Page",
             func=self.reset_page)
@@ -50,6 +58,14 @@ class PdfEditor:
         remove_action = Action(
             label="Remove Pages",
             func=self.remove_pages)
+
+        remove_blank_action = Action(
+            label="Remove Blank Pages",
+            func=self.remove_blank_pages)
+
+        impose_action = Action(
+            label="Impose Pages",
+            func=self.impose_pages)
         
         preview_action = Action(
             label="Preview PDF",
@@ -68,8 +84,11 @@ class PdfEditor:
             add_action,
             crop_action,
             scale_action,
+            rotate_action,
             reset_action,
             remove_action,
+            remove_blank_action,
+            impose_action,
             preview_action,
             save_action,
             exit_action
@@ -133,7 +152,7 @@ class PdfEditor:
         """
         custom_pages_prompt = "Choose which pages to add? (Y/N)"
         custom_pages = self.prompt_yes_no(custom_pages_prompt)
-        pagerange_indices = None
+        pagerange_loop = None
 
         # TODO: Refocus back to terminal after adding files.
         paths = filedialog.askopenfilenames(filetypes=[PDF_FILETYPE])
@@ -147,29 +166,89 @@ class PdfEditor:
             pagerange_loop.set_wrong_range_msgs(before=failure_msg, after=wrong_range_msg)
             pagerange_loop.set_convert_fail_msgs(before=failure_msg)
 
-        for path in paths:
-            if custom_pages:
-                pdf_num_pages = self.manager.get_pdf_num_pages(path)
-                pagerange_prompt = ("CUSTOMIZING PAGES TO ADD FROM\n"
-                    f"'{path}'\n"
-                    f"\tTotal pages: {pdf_num_pages}\n\n"
+        if not paths:
+            print("ADD FILES CANCELED.\n")
+            return
+
+        # Read every file in the background while the user is answering prompts.
+        with self.manager.prefetch(paths) as prefetch:
+            sources = self._prompt_sources(prefetch, custom_pages, pagerange_loop)
+            try:
+                with cancel_on_interrupt() as cancel:
+                    infos = prefetch.results(print_progress("READING FILES", "files"), cancel)
+            except OperationCanceled:
+                print("\nADD FILES ABORTED. NO PAGES WERE ADDED.\n")
+                return
 
-                    "To select all pages enter an empty input or \"all\".\n"
-                    "Example: \"1-4, 6, 10-12\"\n")
-                pagerange_loop.set_prompt(pagerange_prompt)
-                pagerange_loop.set_expected_range(OFFSET, pdf_num_pages+OFFSET)
+        # Passwords are asked for before anything is added, so encrypted files keep their place.
+        for i, info in enumerate(infos):
+            if not info.ok:
+                encrypted = info.error.startswith("FileNotDecryptedError")
+                sources[i] = self._unlock_source(info.path, custom_pages, pagerange_loop) if encrypted else None
 
-                pagerange = pagerange_loop.run()
+        self.manager.add_pdfs([source for source in sources if source is not None])
 
-                if pagerange is not None:
-                    pagerange_indices = [page-OFFSET for page in pagerange]
-                else:
-                    pagerange_indices = None
+        for source, info in zip(sources, infos):
+            if source is not None:
+                print(f"SUCCESSFULLY ADDED PAGES FROM '{path_to_filename(info.path)}'.\n")
+            else:
+                print(f"FAILED TO READ '{path_to_filename(info.path)}'.\n\t{info.error}\n")
 
-            self.manager.add_pdf(path, pagerange_indices)
-            print(f"SUCCESSFULLY ADDED PAGES FROM '{path_to_filename(path)}'.\n")
-        if not paths:
-            print("ADD FILES CANCELED.\n")
+
+    def _unlock_source(self, path, custom_pages, pagerange_loop=None):
+        """
+        Prompt for the password of the encrypted pdf at ``path`` [and its pages].
+
+        Returns:
+            A ``(path, indices, password)`` tuple, or None if the user skipped the file.
+        """
+        password = getpass.getpass(f"PASSWORD OF '{path_to_filename(path)}' (EMPTY TO SKIP): ")
+        while password:
+            try:
+                num_pages = self.manager.get_pdf_num_pages(path, password)
+                break
+            except WrongPasswordError:
+                password = getpass.getpass("WRONG PASSWORD. TRY AGAIN (EMPTY TO SKIP): ")
+        else:
+            return None
+
+        indices = self._prompt_pagerange(path, num_pages, pagerange_loop) if custom_pages else None
+        return path, indices, password
+
+
+    def _prompt_sources(self, prefetch, custom_pages, pagerange_loop=None):
+        """Return a ``(path, indices)`` tuple per prefetched file, prompting for page ranges if ``custom_pages``."""
+        sources = []
+        for i, path in enumerate(prefetch.paths):
+            if not custom_pages:
+                sources.append((path, None))
+                continue
+
+            info = prefetch.result(i)
+            if not info.ok:
+                sources.append((path, None))
+                continue
+
+            sources.append((path, self._prompt_pagerange(path, info.num_pages, pagerange_loop)))
+        return sources
+
+
+    def _prompt_pagerange(self, path, num_pages, pagerange_loop):
+        """Prompt for the pages to add of the pdf at ``path``. Return their indices, or None for all of them."""
+        pagerange_prompt = ("CUSTOMIZING PAGES TO ADD FROM\n"
+            f"'{path}'\n"
+            f"\tTotal pages: {num_pages}\n\n"
+
+            "To select all pages enter an empty input or \"all\".\n"
+            "Example: \"1-4, 6, 10-12\"\n")
+        pagerange_loop.set_prompt(pagerange_prompt)
+        pagerange_loop.set_expected_range(OFFSET, num_pages+OFFSET)
+
+        pagerange = pagerange_loop.run()
+
+        if pagerange is not None:
+            return [page-OFFSET for page in pagerange]
+        return None
 
 
     def remove_pages(self):
@@ -212,6 +291,34 @@ class PdfEditor:
             print(f"REMOVE CANCELED.\n")
 
 
+    def remove_blank_pages(self):
+        if not self.manager.pages:
+            print("There are no pages to remove.")
+            return
+
+        print("LOOKING FOR BLANK PAGES...\n")
+        blank_indices = self.manager.find_blank_pages()
+        if not blank_indices:
+            print("NO BLANK PAGES FOUND.\n")
+            return
+
+        pagerange = [i+OFFSET for i in blank_indices]
+        confirmation_prompt = (f"FOUND {len(blank_indices)} BLANK PAGES"
+            f"{self.get_pages_as_list_tui(blank_indices)}\n\n"
+
+            "Are you sure you want to remove these pages. (Y/N)\n"
+            "\"Y\" to REMOVE.\n"
+            "\"N\" to CANCEL.")
+        self._prompt_preview(pagerange)
+        confirm = self.prompt_yes_no(confirmation_prompt)
+
+        if confirm:
+            self.manager.pop_pages(blank_indices)
+            print(f"PAGES {strip_ends(pagerange)} REMOVED.\n")
+        else:
+            print(f"REMOVE CANCELED.\n")
+
+
     def crop_page(self):
         if not self.manager.pages:
             print("There are no pages to crop.")
@@ -222,7 +329,7 @@ class PdfEditor:
         
         crop_prompt = (f"CROPPING PAGE {page_num}.\n"
             "\tInformation: "
-            f"'{path_to_filename(page.path)}' (pg.{page.page_number+OFFSET})\n"
+            f"'{path_to_filename(page.path)}' (pg.{page.source_index+OFFSET})\n"
             "\tCurrent Dimensions: "
             f"{self.manager.get_page_dims(page_index)}\n\n"
 
@@ -248,7 +355,7 @@ class PdfEditor:
         
         scale_prompt = (f"SCALING PAGE {page_num}.\n"
             "\tInformation: "
-            f"'{path_to_filename(page.path)}' (pg.{page.page_number+OFFSET})\n"
+            f"'{path_to_filename(page.path)}' (pg.{page.source_index+OFFSET})\n"
             "\tCurrent Dimensions: "
             f"{self.manager.get_page_dims(page_index)}\n\n"
 
@@ -258,13 +365,50 @@ class PdfEditor:
         
         scale_loop = Loop(prompt=scale_prompt, convert=str_to_dims)
         scale_dims = scale_loop.run()
-        self.manager.scale_to(page_index, scale_dims)
+
+        box_only_prompt = ("Scale without rewriting page content? (Y/N)\n"
+            "\"Y\" to scale the page size only (fast, content keeps its aspect ratio).\n"
+            "\"N\" to stretch the content to fit.")
+        box_only = self.prompt_yes_no(box_only_prompt)
+        self.manager.scale_to(page_index, scale_dims, box_only=box_only)
 
         # TODO: Include a check to see if page was scaled to appropriate size before printing.
         print(f"SUCCESSFULLY SCALED PAGE {page_num}.\n"
             f"\tNew Dimensions: {self.manager.get_page_dims(page_index)}\n")
 
 
+    def rotate_pages(self):
+        if not self.manager.pages:
+            print("There are no pages to rotate.")
+            return
+
+        pagerange_prompt = (f"Select pages to rotate.\n Example: \"1-4, 6, 10-12\", \"all\"")
+        pagerange_loop = PageRangeLoop(prompt=pagerange_prompt, convert=str_to_pagerange)
+
+        failure_msg = f"{self.edit_page.details}\n\nFAILED TO ROTATE PAGES."
+        wrong_range_msg = "Selected page[s] are out of range."
+        pagerange_loop.set_wrong_range_msgs(before=failure_msg, after=wrong_range_msg)
+        pagerange_loop.set_convert_fail_msgs(before=failure_msg)
+        pagerange_loop.set_expected_range(OFFSET, len(self.manager.pages)+OFFSET)
+
+        print(f"Current Pages:{self.get_pages_as_list_tui()}\n")
+        pagerange = pagerange_loop.run()
+
+        if pagerange is not None:
+            pagerange_indices = sorted(set(page-OFFSET for page in pagerange))
+        else:
+            pagerange_indices = range(len(self.manager.pages))
+
+        rotate_prompt = ("Enter the degrees to rotate pages clockwise by.\n"
+            "Note: Negative values rotate counterclockwise.\n"
+            "Examples: \"90\", \"-90\", \"180\"")
+        rotate_loop = Loop(prompt=rotate_prompt, convert=str_to_degrees)
+        degrees = rotate_loop.run()
+        self.manager.rotate(pagerange_indices, degrees)
+
+        print(f"SUCCESSFULLY ROTATED PAGES {strip_ends([i+OFFSET for i in pagerange_indices])}.\n")
+
+
     def reset_page(self):
         if not self.manager.pages:
             print("There are no pages to reset.")
@@ -275,7 +419,7 @@ class PdfEditor:
 
         confirmation_prompt = (f"RESETTING PAGE {page_num}.\n"
             "\tInformation: "
-            f"'{path_to_filename(page.path)}' (pg.{page.page_number+OFFSET})\n\n"
+            f"'{path_to_filename(page.path)}' (pg.{page.source_index+OFFSET})\n\n"
 
             "Are you sure you want to reset all changes done to this page. (Y/N)\n"
             "\"Y\" to RESET.\n"
@@ -291,15 +435,57 @@ class PdfEditor:
             print(f"RESET CANCELED.\n")
 
 
+    def impose_pages(self):
+        if not self.manager.pages:
+            print("There are no pages to impose.")
+            return
+
+        layout_prompt = ("IMPOSING PAGES ONTO SHEETS.\n"
+            "Enter the number of pages per sheet (\"rows, columns\") or \"booklet\".\n"
+            "Examples: \"1, 2\" (2-up), \"2, 2\" (4-up), \"booklet\"")
+        layout_loop = Loop(prompt=layout_prompt, convert=str_to_layout)
+        layout = layout_loop.run()
+
+        confirmation_prompt = ("Imposing replaces the current pages with sheets and cannot be reset.\n\n"
+            "Are you sure you want to impose these pages. (Y/N)\n"
+            "\"Y\" to IMPOSE.\n"
+            "\"N\" to CANCEL.")
+        if not self.prompt_yes_no(confirmation_prompt):
+            print("IMPOSE CANCELED.\n")
+            return
+
+        try:
+            with cancel_on_interrupt() as cancel:
+                if layout is None:
+                    self.manager.impose(booklet=True, progress=print_progress("IMPOSING", "sheets"), cancel=cancel)
+                else:
+                    self.manager.impose(*layout, progress=print_progress("IMPOSING", "sheets"), cancel=cancel)
+        except OperationCanceled:
+            print("\nIMPOSE ABORTED.\n")
+            return
+
+        print(f"SUCCESSFULLY IMPOSED PAGES ONTO {len(self.manager.pages)} SHEETS.\n")
+
+
     def preview_pdf(self):
-        self.manager.preview()
+        try:
+            with cancel_on_interrupt() as cancel:
+                self.manager.preview(progress=print_progress("PREPARING PREVIEW"), cancel=cancel)
+        except OperationCanceled:
+            print("\nPREVIEW ABORTED.\n")
+            return
         print(f"PREVIEW OPENED.\n")
 
 
     def save_as(self):
         path = filedialog.asksaveasfilename(filetypes=[PDF_FILETYPE], defaultextension='.pdf')
         if path:
-            self.manager.save_as(path)
+            try:
+                with cancel_on_interrupt() as cancel:
+                    self.manager.save_as(path, print_progress("SAVING"), cancel)
+            except OperationCanceled:
+                print("\nSAVE ABORTED. NO FILE WAS WRITTEN.\n")
+                return
 
             open_ans = self.prompt_yes_no("Open created PDF? (Y/N)")
             if open_ans:
@@ -366,7 +552,13 @@ class PdfEditor:
         if not preview_page:
             return
         
-        self.manager.preview(preview_indices)
+        try:
+            with cancel_on_interrupt() as cancel:
+                self.manager.preview(preview_indices, print_progress("PREPARING PREVIEW"), cancel)
+        except OperationCanceled:
+            print("\nPREVIEW ABORTED.\n")
+            return
+
         if pages is None:
             print(f"PREVIEW OPENED.\n\n")
         else:
@@ -382,7 +574,7 @@ class PdfEditor:
         tui = ""
         for i, page in enumerate(self.manager.pages):
             tui += (f"\t[{i+OFFSET}] '{path_to_filename(page.path)}'"
-                    f" (pg.{page.page_number+OFFSET})\n")
+                    f" (pg.{page.source_index+OFFSET})\n")
         return tui
     
 
@@ -395,7 +587,7 @@ class PdfEditor:
         for i in pagerange:
             page = self.manager.pages[i]
             tui += (f"\n{i+OFFSET}. ['{path_to_filename(page.path)}'"
-                    f" (pg.{page.page_number+OFFSET})]")
+                    f" (pg.{page.source_index+OFFSET})]")
             
         return tui
     
@@ -412,6 +604,31 @@ class PageRangeLoop(Loop):
         return True
 
 
+@contextlib.contextmanager
+def cancel_on_interrupt():
+    """Yield a CancelToken that is cancelled, instead of raising KeyboardInterrupt, on Ctrl+C."""
+    cancel = CancelToken()
+    try:
+        previous_handler = signal.signal(signal.SIGINT, lambda *args: cancel.cancel())
+    except ValueError:
+        # Signal handlers can only be set from the main thread.
+        previous_handler = None
+
+    try:
+        yield cancel
+    finally:
+        if previous_handler is not None:
+            signal.signal(signal.SIGINT, previous_handler)
+
+
+def print_progress(label, unit="pages"):
+    """Return a progress callback that prints ``label`` with a count of ``unit`` on a single line."""
+    def _print_progress(done, total):
+        end = "\n" if done == total else ""
+        print(f"\r{label}... {done}/{total} {unit} (Ctrl+C to abort)", end=end, flush=True)
+    return _print_progress
+
+
 def str_to_pagerange(string):
     """Convert string to list. If ``string`` argument is 'all' or '' return None."""
     if not string or string.lower() == "all":
@@ -457,6 +674,28 @@ def str_to_dims(string):
     return dims
     
 
+def str_to_degrees(string):
+    """Convert string to int. Raise ValueError if it is not a multiple of 90."""
+    degrees = int(string.strip())
+
+    if degrees % 90:
+        raise ValueError
+
+    return degrees
+
+
+def str_to_layout(string):
+    """Convert string to tuple of (rows, columns). If ``string`` argument is 'booklet' or 'b' return None."""
+    if string.strip().upper() in BOOKLET_RESPONSES:
+        return None
+
+    layout = str_to_dims(string)
+    if None in layout or min(layout) < 1:
+        raise ValueError
+
+    return layout
+
+
 def path_to_filename(path):
     """Get filename from specified path."""
     return path.split("/")[-1]
@@ -0,0 +1,332 @@
+from itertools import chain
+
+# Operations the planner rewrites. Any other operation runs as given, after the edits before it.
+PLANNED = {"add_pdf", "add_pdfs", "pop_pages", "rearrange_pages", "reset_page", "crop", "rotate", "scale_to"}
+# Unplanned operations that keep the number of pages, so what follows them can be planned ahead.
+KEEPS_PAGE_COUNT = {"save_as", "split_to", "preview", "stamp", "label", "fingerprints", "find_duplicates",
+                    "duplicate_indices", "find_blank_pages", "get_page_dims", "get_pdf_num_pages", "prefetch"}
+
+
+class Operation:
+    """A call of a PdfManager method, e.g. ``Operation("crop", 0, (10, 10, 10, 10))``."""
+
+    def __init__(self, name, *args, **kwargs):
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+
+    def __repr__(self):
+        args = chain(map(repr, self.args), (f"{key}={value!r}" for key, value in self.kwargs.items()))
+        return f"{self.name}({', '.join(args)})"
+
+    def __eq__(self, other):
+        return (isinstance(other, Operation)
+                and (self.name, self.args, self.kwargs) == (other.name, other.args, other.kwargs))
+
+
+class Planner:
+    """
+    Runs a list of PdfManager operations as the fewest calls that leave the same pages.
+
+    Operations up to each unplanned one (e.g. ``save_as``) form a segment,
+    planned against the pages the manager has when the segment starts: edits
+    of pages removed later are dropped, pages added and removed again are
+    never added, crops and rotations of a page are summed, a scale to a full
+    (width, height) supersedes the content scales just before it, and all
+    rearranges become one final permutation.
+
+    Planned operations do not call the ``progress`` or ``cancel`` they are given.
+
+    Attributes:
+        manager: The PdfManager object to run operations on.
+        operations: A list of Operation objects in the order they were requested.
+    """
+
+    def __init__(self, manager, operations):
+        """
+        Args:
+            manager: A PdfManager object.
+            operations: A list of Operation objects, or tuples in the format: (name, *args).
+        """
+        self.manager = manager
+        self.operations = [op if isinstance(op, Operation) else Operation(*op) for op in operations]
+
+
+    def run(self):
+        """
+        Run the plan of ``operations``.
+
+        Returns:
+            A list with the return value of each unplanned operation and None for planned ones.
+
+        Raises:
+            IndexError: If an operation refers to a page out of range. Nothing of its segment has run.
+            ValueError: If a rotation is not a multiple of 90 degrees. Nothing of its segment has run.
+        """
+        results = []
+        for operations, barrier in self._segments():
+            segment = _Segment(len(self.manager.pages), self.manager._get_num_pages)
+            for op in operations:
+                segment.apply(op)
+            for step in segment.finish()[0]:
+                getattr(self.manager, step.name)(*step.args, **step.kwargs)
+            results += [None] * len(operations)
+            if barrier is not None:
+                results.append(getattr(self.manager, barrier.name)(*barrier.args, **barrier.kwargs))
+        return results
+
+
+    def explain(self):
+        """
+        Return a description of the plan of ``operations`` without running it.
+
+        Segments after an unplanned operation that may change the number of
+        pages (e.g. ``impose``) are only planned once they are reached.
+        """
+        lines = []
+        num_pages = len(self.manager.pages)
+        for operations, barrier in self._segments():
+            if num_pages is None:
+                lines += [f"{op}: planned when reached" for op in operations]
+            elif operations:
+                segment = _Segment(num_pages, self.manager._get_num_pages)
+                for op in operations:
+                    segment.apply(op)
+                steps, notes = segment.finish()
+                lines.append(f"{len(operations)} operation(s) planned as {len(steps)}:")
+                lines += [f"  run {step}" for step in steps]
+                lines += [f"  {op}: {note}" for op, note in notes]
+                num_pages = len(segment.slots)
+
+            if barrier is not None:
+                lines.append(f"run {barrier}")
+                if barrier.name not in KEEPS_PAGE_COUNT:
+                    num_pages = None
+        return "\n".join(lines)
+
+
+    def _segments(self):
+        """Yield ``(operations, barrier)`` tuples of planned operations and the unplanned one after them, or None."""
+        segment = []
+        for op in self.operations:
+            if op.name in PLANNED:
+                segment.append(op)
+            else:
+                yield segment, op
+                segment = []
+        if segment:
+            yield segment, None
+
+
+class _Page:
+    """A page moved around by a segment, with the edits it still needs."""
+
+    def __init__(self, position=None, source=None, added_by=None):
+        self.position = position
+        self.source = source
+        self.added_by = added_by
+        self.reset = None
+        # Lists in the format: ["crop", margin, ops] or ["scale", target, box_only, ops].
+        self.edits = []
+        self.rotation = 0
+        self.rotated_by = []
+
+
+    def edit_ops(self):
+        return [op for edit in self.edits for op in edit[-1]] + self.rotated_by + [self.reset] * bool(self.reset)
+
+
+class _Segment:
+    """
+    Simulates planned operations on stand-ins of pages and plans the calls with the same outcome.
+
+    Attributes:
+        slots: A list of the _Page objects in their current order.
+    """
+
+    def __init__(self, num_pages, get_num_pages):
+        """
+        Args:
+            num_pages: Number of pages the manager has when the segment starts.
+            get_num_pages: A callable returning the number of pages of a source pdf given its path
+                and, for an encrypted one, its password.
+        """
+        self.initial = [_Page(position=i) for i in range(num_pages)]
+        self.slots = list(self.initial)
+        self.added = []
+        self.pops = []
+        self.rearranges = []
+        self.notes = []
+        self._get_num_pages = get_num_pages
+
+
+    def apply(self, op):
+        """Apply the planned Operation object ``op``, raising what the manager would."""
+        getattr(self, f"_{op.name}")(op, *op.args, **op.kwargs)
+
+
+    def _add_pdf(self, op, path, indices=None, progress=None, cancel=None, password=None):
+        self._add_pdfs(op, [(path, indices, password)])
+
+
+    def _add_pdfs(self, op, sources, progress=None, cancel=None):
+        selection = []
+        for path, indices, *password in sources:
+            num_pages = self._get_num_pages(path, *password)
+            if indices is None:
+                indices = range(num_pages)
+            elif any(i < 0 or i >= num_pages for i in indices):
+                raise IndexError(f"page index out of range for '{path}'")
+            selection += [(path, i) for i in indices]
+        pages = [_Page(source=source, added_by=op) for source in selection]
+        self.added += pages
+        self.slots += pages
+
+
+    def _pop_pages(self, op, indices=None):
+        indices = set(indices or ())
+        removed = [page for i, page in enumerate(self.slots) if i in indices]
+        self.slots = [page for i, page in enumerate(self.slots) if i not in indices]
+        self.pops.append((op, removed))
+
+
+    def _rearrange_pages(self, op, order):
+        assert len(self.slots) == len(order)
+        assert len(set(order)) == len(order)
+        self.slots = [self.slots[i] for i in order]
+        self.rearranges.append(op)
+
+
+    def _reset_page(self, op, index):
+        page = self.slots[index]
+        self.notes += [(earlier, _dropped(earlier, "page is reset later")) for earlier in page.edit_ops()]
+        page.edits, page.rotation, page.rotated_by, page.reset = [], 0, [], None
+        if page.position is None:
+            self.notes.append((op, "dropped, page was added with no edits"))
+        else:
+            page.reset = op
+
+
+    def _crop(self, op, index, margin):
+        assert len(margin) == 4
+        page = self.slots[index]
+        if page.edits and page.edits[-1][0] == "crop":
+            page.edits[-1][1] = [total + value for total, value in zip(page.edits[-1][1], margin)]
+            page.edits[-1][-1].append(op)
+        else:
+            page.edits.append(["crop", list(margin), [op]])
+
+
+    def _rotate(self, op, indices, degrees):
+        if degrees % 90:
+            raise ValueError("pages can only be rotated by multiples of 90 degrees")
+        # /Rotate is independent of the boxes and content, so rotations commute with every other edit.
+        for index in indices:
+            page = self.slots[index]
+            page.rotation += degrees
+            page.rotated_by.append(op)
+
+
+    def _scale_to(self, op, index, target, box_only=False):
+        assert len(target) == 2
+        page = self.slots[index]
+        if not box_only and None not in target:
+            # Content scales compose, so only the last one's full target matters.
+            while page.edits and page.edits[-1][0] == "scale" and not page.edits[-1][2]:
+                self.notes.append((page.edits.pop()[-1][0], "superseded by a later scale"))
+        page.edits.append(["scale", tuple(target), box_only, [op]])
+
+
+    def finish(self):
+        """
+        Return the plan of the operations applied so far.
+
+        Returns:
+            A tuple in the format: (steps, notes). ``steps`` is a list of Operation
+            objects to run instead; ``notes`` lists ``(operation, note)`` tuples
+            saying why operations were dropped or merged.
+        """
+        notes = list(self.notes)
+        kept = {id(page) for page in self.slots}
+        steps = []
+
+        removed = [page.position for page in self.initial if id(page) not in kept]
+        if removed:
+            steps.append(Operation("pop_pages", removed))
+        for op, pages in self.pops:
+            if not pages:
+                notes.append((op, "dropped, removes no pages"))
+            elif all(page.position is None for page in pages):
+                notes.append((op, "dropped, its pages are never added"))
+            elif sum(any(page.position is not None for page in pages) for _, pages in self.pops) > 1:
+                notes.append((op, "merged into one pop"))
+        for page in self.initial + self.added:
+            if id(page) not in kept:
+                notes += [(op, _dropped(op, "page is removed later")) for op in page.edit_ops()]
+
+        adds = {}
+        for page in self.added:
+            adds.setdefault(id(page.added_by), (page.added_by, []))[1].append(page)
+        for op, pages in adds.values():
+            dropped = [page.source[1] for page in pages if id(page) not in kept]
+            if len(dropped) == len(pages):
+                notes.append((op, "dropped, every page is removed later"))
+            elif dropped:
+                notes.append((op, f"pages {dropped} not added, they are removed later"))
+        # Added pages can be added in any order, so they are added in the order they end up in.
+        final = {id(page): i for i, page in enumerate(self.slots)}
+        survivors = sorted((page for page in self.added if id(page) in kept), key=lambda page: final[id(page)])
+        sources = []
+        for page in survivors:
+            if sources and sources[-1][0] == page.source[0]:
+                sources[-1][1].append(page.source[1])
+            else:
+                sources.append((page.source[0], [page.source[1]]))
+        if len(sources) == 1:
+            steps.append(Operation("add_pdf", *sources[0]))
+        elif sources:
+            steps.append(Operation("add_pdfs", sources))
+
+        base = [page for page in self.initial if id(page) in kept] + survivors
+        positions = {id(page): i for i, page in enumerate(base)}
+        order = [positions[id(page)] for page in self.slots]
+        if order != list(range(len(order))):
+            steps.append(Operation("rearrange_pages", order))
+            if len(self.rearranges) > 1:
+                notes += [(op, "merged into one final rearrange") for op in self.rearranges]
+        elif survivors != [page for page in self.added if id(page) in kept]:
+            notes += [(op, "merged into the order pages are added in") for op in self.rearranges]
+        else:
+            notes += [(op, "dropped, rearranges cancel out") for op in self.rearranges]
+
+        rotations = {}
+        for i, page in enumerate(self.slots):
+            if page.reset is not None:
+                steps.append(Operation("reset_page", i))
+            for edit in page.edits:
+                ops = edit[-1]
+                if edit[0] == "scale":
+                    steps.append(Operation("scale_to", i, *edit[1:3]) if edit[2] else Operation("scale_to", i, edit[1]))
+                elif not any(edit[1]):
+                    notes += [(op, "dropped, crops cancel out") for op in ops]
+                else:
+                    steps.append(Operation("crop", i, tuple(edit[1])))
+                    if len(ops) > 1:
+                        notes += [(op, f"merged into one crop of page {i}") for op in ops]
+            if page.rotation % 360:
+                rotations.setdefault(page.rotation % 360, []).append(i)
+                if len(page.rotated_by) > 1:
+                    notes += [(op, f"merged into one rotation of page {i}") for op in page.rotated_by]
+            else:
+                notes += [(op, _dropped(op, f"rotations of page {i} cancel out")) for op in page.rotated_by]
+        steps += [Operation("rotate", indices, degrees) for degrees, indices in sorted(rotations.items())]
+
+        unique = {}
+        for op, note in notes:
+            unique.setdefault((id(op), note), (op, note))
+        return steps, list(unique.values())
+
+
+def _dropped(op, reason):
+    """Return a note of ``op`` left out for one page, which only drops it if it edits no other pages."""
+    return f"{'skipped on a page' if op.name == 'rotate' else 'dropped'}, {reason}"
@@ -0,0 +1,308 @@
+import os, threading, weakref
+from concurrent.futures import ProcessPoolExecutor
+from pypdf.generic import IndirectObject, StreamObject
+from xref_cache import XrefCache, XrefReader
+
+# Bytes of decrypted stream data a SourcePool keeps, so sources parsed again are not decrypted again.
+DECRYPTED_BYTES = 256 * 1024 * 1024
+
+_passwords = {}
+
+
+class SharedReader(XrefReader):
+    """
+    XrefReader that several threads can read at once.
+
+    Objects already parsed are returned without locking; parsing an object
+    reads the source's one buffer, so it happens under a lock. Pages are
+    listed up front, so nothing else is filled in lazily. Objects of a shared
+    reader must never be changed; edits go to copies (see ``pdf.copy_page``).
+    """
+
+    def __init__(self, path, password=None, decrypted=None, source=None, xrefs=None):
+        """
+        Args:
+            path: A path to a pdf file.
+            password: The password of an encrypted pdf. Defaults to None.
+            decrypted: A StreamCache object of decrypted streams to reuse and fill. Defaults to None.
+            source: The key that identifies the file's version in ``decrypted``. Defaults to None.
+            xrefs: An XrefCache object of rebuilt cross-reference tables. Defaults to None.
+        """
+        # Reading the encryption dictionary already goes through ``get_object``.
+        self._lock = threading.RLock()
+        super().__init__(path, password=password, xrefs=xrefs)
+        if self._encryption is not None and decrypted is not None:
+            self._encryption = _CachedDecryption(self._encryption, decrypted, source)
+        with self._lock:
+            len(self.pages)
+
+
+    @property
+    def pdf_header(self):
+        # Reading the header seeks the source's one buffer.
+        with self._lock:
+            return super().pdf_header
+
+
+    def get_object(self, indirect_reference):
+        if not isinstance(indirect_reference, int):
+            obj = self.resolved_objects.get((indirect_reference.generation, indirect_reference.idnum))
+            if obj is not None:
+                return obj
+        with self._lock:
+            return super().get_object(indirect_reference)
+
+
+class StreamCache:
+    """
+    Decrypted stream data up to ``max_bytes``, least recently used dropped first. Thread-safe.
+
+    Entries are keyed by ``(path, mtime_ns, size, idnum, generation)``.
+    """
+
+    def __init__(self, max_bytes=DECRYPTED_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data = {}
+        self._lock = threading.Lock()
+
+
+    def get(self, key):
+        with self._lock:
+            data = self._data.pop(key, None)
+            if data is not None:
+                self._data[key] = data
+            return data
+
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self.size -= len(self._data.pop(key, b""))
+            self._data[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                self.size -= len(self._data.pop(next(iter(self._data))))
+
+
+    def __contains__(self, key):
+        return key in self._data
+
+
+class _CachedDecryption:
+    """Encryption of a SharedReader that takes decrypted stream data from a StreamCache, and fills it."""
+
+    def __init__(self, encryption, decrypted, source):
+        self._encryption = encryption
+        self._decrypted = decrypted
+        self._source = source
+
+
+    def __getattr__(self, name):
+        return getattr(self._encryption, name)
+
+
+    def decrypt_object(self, obj, idnum, generation):
+        if not isinstance(obj, StreamObject):
+            return self._encryption.decrypt_object(obj, idnum, generation)
+
+        key = self._source + (idnum, generation)
+        data = self._decrypted.get(key)
+        if data is None:
+            obj = self._encryption.decrypt_object(obj, idnum, generation)
+            self._decrypted.put(key, obj._data)
+            return obj
+        # Only the stream's dictionary is left to decrypt.
+        crypt_filter = self._encryption._make_crypt_filter(idnum, generation)
+        for name, value in obj.items():
+            obj[name] = crypt_filter.decrypt_object(value)
+        obj._data = data
+        return obj
+
+
+class SourcePool:
+    """
+    Parsed source pdfs shared by every PdfManager of a process, one per file version.
+
+    A source is parsed once however many sessions use it, and is freed once
+    none of them does. Sources are keyed by absolute path, modification time
+    and size, so a file changed on disk is parsed again. Thread-safe.
+
+    Encrypted sources are opened with the password they were first opened
+    with (see ``remember_password``), and their decrypted streams are kept in
+    ``decrypted`` beyond the readers, so previews and saves that parse a
+    source again never decrypt the same stream twice. Damaged sources take
+    their cross-reference tables from ``xrefs`` once they have been rebuilt.
+
+    Attributes:
+        decrypted: A StreamCache object of decrypted stream data.
+        xrefs: An XrefCache object of rebuilt cross-reference tables.
+    """
+
+    def __init__(self, max_decrypted_bytes=DECRYPTED_BYTES, xrefs=None):
+        """
+        Args:
+            max_decrypted_bytes: Maximum bytes of decrypted stream data to keep. Defaults to 256 MiB.
+            xrefs: An XrefCache object. Defaults to None.
+                If None, tables are cached in the default directory, where worker processes find them too.
+        """
+        self._lock = threading.Lock()
+        self._readers = weakref.WeakValueDictionary()
+        self._parsing = {}
+        self.decrypted = StreamCache(max_decrypted_bytes)
+        self.xrefs = xrefs or XrefCache()
+
+
+    def get(self, path, stat=None, password=None):
+        """
+        Return the shared reader of ``path``.
+
+        Args:
+            path: A path to a pdf file.
+            stat: An ``os.stat_result`` of ``path``. Defaults to None.
+                If None, ``path`` is stat'ed.
+            password: The password of an encrypted pdf. Defaults to None.
+                If None, the password remembered for ``path`` is used, if any.
+                A password that opens the file is remembered for it.
+
+        Returns:
+            A tuple in the format: (reader, parsed), where ``parsed`` is whether
+            the file had to be parsed for this call.
+
+        Raises:
+            WrongPasswordError: If ``password`` does not open the pdf.
+            FileNotDecryptedError: If the pdf needs a password and none was given or remembered.
+        """
+        stat = stat or os.stat(path)
+        if password is None:
+            password = password_for(path)
+        source = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        key = source + (password,)
+        with self._lock:
+            reader = self._readers.get(key)
+            if reader is not None:
+                return reader, False
+            lock = self._parsing.setdefault(key, threading.Lock())
+
+        # Threads asking for the same file wait for one parse instead of each parsing it.
+        try:
+            with lock:
+                reader = self._readers.get(key)
+                parsed = reader is None
+                if parsed:
+                    reader = SharedReader(path, password, self.decrypted, source, self.xrefs)
+                    self._readers[key] = reader
+        finally:
+            with self._lock:
+                self._parsing.pop(key, None)
+        if password is not None and reader.is_encrypted:
+            remember_password(path, password)
+        return reader, parsed
+
+
+    def decrypt_streams(self, path, max_workers=None):
+        """
+        Decrypt the streams of the encrypted pdf at ``path`` on a process pool, into ``decrypted``.
+
+        Objects are split into runs by their position in the file, so each
+        worker reads one part of it. Only streams estimated to fit in the
+        budget left are decrypted.
+
+        Args:
+            path: A path to a pdf file, opened with its remembered password.
+            max_workers: Maximum number of processes. Defaults to None.
+                If None, one process per CPU is used.
+
+        Returns:
+            The number of streams decrypted.
+        """
+        reader, _ = self.get(path)
+        if not reader.is_encrypted:
+            return 0
+        source = reader._encryption._source
+        size = os.path.getsize(path)
+
+        # An object takes about as many bytes as there are up to the next one.
+        offsets = sorted((offset, idnum, generation) for generation, entries in reader.xref.items()
+                         for idnum, offset in entries.items())
+        ends = [offset for offset, _, _ in offsets[1:]] + [size]
+        budget = self.decrypted.max_bytes - self.decrypted.size
+        numbers = []
+        for (offset, idnum, generation), end in zip(offsets, ends):
+            if (generation, idnum) in reader.resolved_objects or source + (idnum, generation) in self.decrypted:
+                continue
+            budget -= end - offset
+            if budget < 0:
+                break
+            numbers.append((idnum, generation))
+
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        chunk = max(1, -(-len(numbers) // max_workers))
+        chunks = [numbers[i:i+chunk] for i in range(0, len(numbers), chunk)]
+        password = password_for(path)
+        if max_workers <= 1 or len(chunks) <= 1:
+            results = [decrypt_objects(path, password, chunk) for chunk in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=len(chunks), **worker_options()) as executor:
+                results = list(executor.map(decrypt_objects, [path] * len(chunks), [password] * len(chunks), chunks))
+
+        count = 0
+        for result in results:
+            for (idnum, generation), data in result.items():
+                self.decrypted.put(source + (idnum, generation), data)
+                count += 1
+        return count
+
+
+def decrypt_objects(path, password, numbers):
+    """
+    Return the decrypted data of the streams among objects ``numbers`` of the pdf at ``path``.
+
+    Args:
+        path: A path to a pdf file.
+        password: The password of the pdf.
+        numbers: A list of ``(idnum, generation)`` tuples.
+
+    Returns:
+        A dict of bytes keyed by ``(idnum, generation)``. Objects that are not
+        streams or fail to parse are left out.
+    """
+    reader = XrefReader(path, password=password, xrefs=XrefCache())
+    data = {}
+    for idnum, generation in numbers:
+        try:
+            obj = reader.get_object(IndirectObject(idnum, generation, reader))
+        except Exception:
+            continue
+        if isinstance(obj, StreamObject):
+            data[(idnum, generation)] = obj._data
+    return data
+
+
+def remember_password(path, password):
+    """Remember ``password`` as the one that opens the pdf at ``path``, for every session and worker started later."""
+    _passwords[os.path.abspath(path)] = password
+
+
+def password_for(path):
+    """Return the password remembered for the pdf at ``path``, or None."""
+    return _passwords.get(os.path.abspath(path))
+
+
+def worker_options():
+    """Return ``ProcessPoolExecutor`` keyword arguments that give its workers the remembered passwords."""
+    return {"initializer": _remember_passwords, "initargs": (dict(_passwords),)}
+
+
+def _remember_passwords(passwords):
+    _passwords.update(passwords)
+
+
+_pool = SourcePool()
+
+
+def get_source_pool():
+    """Return the process-wide SourcePool."""
+    return _pool
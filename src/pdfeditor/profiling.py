@@ -0,0 +1,216 @@
+import cProfile, functools, json, os, threading, time, tracemalloc
+
+PROFILE_ENV_VAR = "PDFEDITOR_PROFILE"
+CPROFILE_SUFFIX = ".prof"
+
+class Profiler:
+    """
+    Opt-in collector of per-operation metrics.
+
+    Every operation records its wall time, tracemalloc peak and any counters
+    (pages touched, bytes read/written, reader cache hits/misses, etc...)
+    added while it runs. When disabled, ``operation`` and ``count`` return
+    immediately so instrumented code pays almost nothing.
+
+    Thread-safe: each thread nests its own operations and counters go to its
+    innermost one. tracemalloc peaks are process-wide, so while operations of
+    several threads overlap, each one's peak includes the others' memory.
+    cProfile only profiles the thread whose operation started it.
+
+    Attributes:
+        enabled: Whether metrics are being collected.
+        output_path: Path to export results to. Paths ending in ``.prof`` get a
+            cProfile dump, anything else gets JSON lines.
+        records: A list of dicts, one per finished operation.
+    """
+
+    def __init__(self, output_path=None, enabled=None):
+        """
+        Initializes Profiler object.
+
+        Args:
+            output_path: Path to export results to. Defaults to None.
+            enabled: Whether to collect metrics. Defaults to None.
+                If None, profiling is enabled when ``output_path`` is set.
+        """
+        self.output_path = output_path
+        self.enabled = bool(output_path) if enabled is None else enabled
+        self.records = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Records of the running operations of every thread, keyed by id.
+        self._running = {}
+        self._cprofile = None
+        self._cprofile_thread = None
+        self._started_tracemalloc = False
+
+        if self.enabled and self._wants_cprofile():
+            self._cprofile = cProfile.Profile()
+
+
+    @property
+    def _stack(self):
+        """The running operations of the current thread, innermost last."""
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+
+    def _wants_cprofile(self):
+        return self.output_path is not None and str(self.output_path).endswith(CPROFILE_SUFFIX)
+
+
+    def operation(self, name, **info):
+        """
+        Return a context manager that records metrics for operation ``name``.
+
+        Keyword arguments are stored in the record as-is.
+        """
+        if not self.enabled:
+            return _NULL_OPERATION
+        return _Operation(self, name, info)
+
+
+    def count(self, key, amount=1):
+        """Add ``amount`` to counter ``key`` of the innermost running operation."""
+        if not self.enabled or not self._stack:
+            return
+        record = self._stack[-1]
+        record[key] = record.get(key, 0) + amount
+
+
+    def summary(self):
+        """Return totals of every counter, keyed by operation name."""
+        totals = {}
+        for record in self.records:
+            op_totals = totals.setdefault(record["op"], {"calls": 0})
+            op_totals["calls"] += 1
+            for key, value in record.items():
+                if key in ("op", "depth") or not isinstance(value, (int, float)):
+                    continue
+                op_totals[key] = op_totals.get(key, 0) + value
+        return totals
+
+
+    def export(self, path=None):
+        """
+        Write collected metrics to ``path`` (defaults to ``output_path``).
+
+        Returns:
+            The path written to, or None if there was nothing to write.
+        """
+        path = path or self.output_path
+        if not self.enabled or path is None:
+            return None
+
+        if str(path).endswith(CPROFILE_SUFFIX):
+            if self._cprofile is None:
+                return None
+            self._cprofile.dump_stats(path)
+        else:
+            with open(path, "w") as file:
+                for record in self.records:
+                    file.write(json.dumps(record, default=str) + "\n")
+        return path
+
+
+    def close(self):
+        """Export metrics and stop tracing memory."""
+        self.export()
+        if self._started_tracemalloc and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._started_tracemalloc = False
+
+
+    def _start(self, record):
+        stack = self._stack
+        with self._lock:
+            if not self._running and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            if self._cprofile is not None and self._cprofile_thread is None:
+                self._cprofile_thread = threading.get_ident()
+                self._cprofile.enable()
+            # Resetting the peak would lose it for every running operation, so they keep it first.
+            peak = tracemalloc.get_traced_memory()[1]
+            for running in self._running.values():
+                running["_child_peak"] = max(running["_child_peak"], peak)
+            tracemalloc.reset_peak()
+            record["depth"] = len(stack)
+            record["_child_peak"] = 0
+            record["_start"] = time.perf_counter()
+            stack.append(record)
+            self._running[id(record)] = record
+
+
+    def _finish(self, record, error):
+        stack = self._stack
+        with self._lock:
+            record["wall_time"] = time.perf_counter() - record.pop("_start")
+            peak = max(tracemalloc.get_traced_memory()[1], record.pop("_child_peak"))
+            record["tracemalloc_peak"] = peak
+            if error is not None:
+                record["error"] = type(error).__name__
+
+            stack.pop()
+            del self._running[id(record)]
+            if stack:
+                parent = stack[-1]
+                parent["_child_peak"] = max(parent["_child_peak"], peak)
+            elif self._cprofile_thread == threading.get_ident():
+                self._cprofile.disable()
+                self._cprofile_thread = None
+            self.records.append(record)
+
+
+class _Operation:
+    def __init__(self, profiler, name, info):
+        self.profiler = profiler
+        self.record = {"op": name, **info}
+
+    def __enter__(self):
+        self.profiler._start(self.record)
+        return self.record
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler._finish(self.record, exc)
+
+
+class _NullOperation:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_OPERATION = _NullOperation()
+_profiler = None
+
+
+def get_profiler():
+    """Return the process-wide profiler, configured from ``PDFEDITOR_PROFILE`` on first use."""
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler(os.environ.get(PROFILE_ENV_VAR) or None)
+    return _profiler
+
+
+def set_profiler(profiler):
+    """Replace the process-wide profiler and return the previous one."""
+    global _profiler
+    previous, _profiler = _profiler, profiler
+    return previous
+
+
+def profiled(func):
+    """Decorate a method of an object with a ``profiler`` attribute to record it as an operation."""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        profiler = self.profiler
+        if not profiler.enabled:
+            return func(self, *args, **kwargs)
+        with profiler.operation(func.__name__):
+            return func(self, *args, **kwargs)
+    return wrapper
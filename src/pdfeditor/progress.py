@@ -0,0 +1,56 @@
+import threading
+
+class OperationCanceled(Exception):
+    """Raised by a long operation when its CancelToken has been cancelled."""
+
+
+class CancelToken:
+    """
+    Flag used to cooperatively cancel a long operation.
+
+    Operations check the token between pages, so cancelling from another
+    thread (or a signal handler) stops the operation at the next page.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise OperationCanceled
+
+
+def track(items, progress=None, cancel=None, total=None):
+    """
+    Yield each of ``items``, checking ``cancel`` before and reporting ``progress`` after each one.
+
+    Args:
+        items: An iterable of work items, e.g. pages.
+        progress: A callable taking ``(done, total)``. Defaults to None.
+        cancel: A CancelToken object. Defaults to None.
+        total: Number of items. Defaults to None.
+            If None, ``len(items)`` is used.
+
+    Raises:
+        OperationCanceled: If ``cancel`` is cancelled before the next item.
+    """
+    if progress is None and cancel is None:
+        yield from items
+        return
+
+    if total is None:
+        total = len(items)
+
+    for done, item in enumerate(items, 1):
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        yield item
+        if progress is not None:
+            progress(done, total)
@@ -0,0 +1,159 @@
+import hashlib, json, os, shutil, tempfile
+import pypdf
+
+# Changed whenever the same job may be written differently, so older entries are never used.
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+SOURCES = "sources.json"
+
+
+class ResultCache:
+    """
+    Directory of written pdfs keyed by the job that wrote them.
+
+    Keys combine digests of the source files' bytes with a canonical description
+    of the job, so a repeated job finds its result however its sources were
+    named or touched. Each entry is a directory of the output files and a
+    manifest of their sizes and digests, written last, so entries that were
+    never finished are never found. Once entries take more than ``max_bytes``,
+    the least recently used are removed.
+
+    Attributes:
+        directory: Path of the cache directory.
+        max_bytes: Maximum total size of cached files in bytes, or None for no limit.
+        verify: Whether hits are checked against their manifest and source files
+            are always re-hashed, rather than trusting their size and modification time.
+    """
+
+    def __init__(self, directory, max_bytes=1 << 30, verify=False):
+        """
+        Args:
+            directory: Path of the cache directory. Created if missing.
+            max_bytes: Maximum total size of cached files in bytes. Defaults to 1 GiB.
+                If None, entries are never removed.
+            verify: Whether to check every hit. Defaults to False.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.verify = verify
+        try:
+            with open(os.path.join(directory, SOURCES)) as file:
+                self._sources = json.load(file)
+        except (FileNotFoundError, ValueError):
+            self._sources = {}
+
+
+    def source_digest(self, path):
+        """Return a digest of the bytes of the file at ``path``, hashed again only once it changes on disk."""
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        entry = self._sources.get(key)
+        if self.verify or entry is None or entry[:2] != stamp:
+            digest = _file_digest(path)
+            if entry != stamp + [digest]:
+                self._sources[key] = stamp + [digest]
+                self._save_sources()
+            return digest
+        return entry[2]
+
+
+    def key(self, parts):
+        """Return the key of a job described by ``parts``, an iterable of bytes objects."""
+        digest = hashlib.blake2b(digest_size=20)
+        for part in [b"%d %s" % (FORMAT_VERSION, pypdf.__version__.encode()), *parts]:
+            # Each part is prefixed by its length, so no two lists of parts hash alike.
+            digest.update(b"%d:" % len(part))
+            digest.update(part)
+        return digest.hexdigest()
+
+
+    def get(self, key):
+        """
+        Return the files cached under ``key``.
+
+        Returns:
+            A list of paths of the cached files in the order they were put,
+            or None if there is no entry or it fails verification.
+        """
+        entry = os.path.join(self.directory, key)
+        files = _read_manifest(entry)
+        if files is None:
+            return None
+        paths = [os.path.join(entry, f"{n}.pdf") for n in range(len(files))]
+        if self.verify and not all(os.path.isfile(path) and _file_digest(path) == info["digest"]
+                                   for path, info in zip(paths, files)):
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+        # The manifest's modification time is when the entry was last used.
+        os.utime(os.path.join(entry, MANIFEST))
+        return paths
+
+
+    def put(self, key, paths):
+        """Cache copies of the files at ``paths`` under ``key``, then remove entries beyond ``max_bytes``."""
+        temp = tempfile.mkdtemp(prefix=".", dir=self.directory)
+        try:
+            files = []
+            for n, path in enumerate(paths):
+                target = os.path.join(temp, f"{n}.pdf")
+                shutil.copyfile(path, target)
+                files.append({"size": os.path.getsize(target), "digest": _file_digest(target)})
+            with open(os.path.join(temp, MANIFEST), "w") as file:
+                json.dump({"files": files}, file)
+            entry = os.path.join(self.directory, key)
+            shutil.rmtree(entry, ignore_errors=True)
+            os.rename(temp, entry)
+        except BaseException:
+            shutil.rmtree(temp, ignore_errors=True)
+            raise
+        self.evict()
+
+
+    def evict(self):
+        """Remove the least recently used entries until cached files take at most ``max_bytes``."""
+        if self.max_bytes is None:
+            return
+        entries = []
+        for name in os.listdir(self.directory):
+            entry = os.path.join(self.directory, name)
+            files = _read_manifest(entry)
+            if files is not None:
+                used = os.stat(os.path.join(entry, MANIFEST)).st_mtime_ns
+                entries.append((used, sum(info["size"] for info in files), entry))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+
+    def _save_sources(self):
+        fd, temp_path = tempfile.mkstemp(suffix=".json", dir=self.directory)
+        try:
+            with os.fdopen(fd, "w") as file:
+                json.dump(self._sources, file)
+            os.replace(temp_path, os.path.join(self.directory, SOURCES))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+def _read_manifest(entry):
+    """Return the list of file infos in the manifest of ``entry``, or None if it has none."""
+    try:
+        with open(os.path.join(entry, MANIFEST)) as file:
+            return json.load(file)["files"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _file_digest(path):
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
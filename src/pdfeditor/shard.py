@@ -0,0 +1,334 @@
+import os, re, threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pypdf import PageObject, PdfWriter
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+from pool import get_source_pool, worker_options
+
+# Pages per shard. Shards never depend on the number of workers, so neither does the output.
+SHARD_PAGES = 256
+# Shard-local targets of references to the objects the coordinator writes itself.
+INFO, PAGES, ROOT = (-1, -2, -3)
+# Lowest version written, and the version that introduced /UserUnit.
+BASE_VERSION = "1.3"
+USER_UNIT_VERSION = "1.6"
+
+_readers = {}
+_readers_lock = threading.Lock()
+
+
+def serialize_shard(pages, paths=None):
+    """
+    Serialize ``pages`` and every object they use, without final object numbers.
+
+    Args:
+        pages: A list of PageObject objects.
+        paths: A dict of source paths keyed by ``id`` of the PdfReader objects
+            the pages were read from. Defaults to None.
+
+    Returns:
+        A tuple in the format: (objects, page_objects). ``objects`` is a list of
+        ``(body, references, origin)`` tuples, where ``references`` lists the
+        ``(position, target)`` of each object number left out of ``body``; a
+        target is the index of an object in ``objects`` or one of ``INFO``,
+        ``PAGES`` and ``ROOT``. ``origin`` is the ``(path, idnum)`` of the source
+        object a non-page object was copied from, or None. ``page_objects`` lists
+        the indices of the page objects.
+    """
+    paths = paths or {}
+    writer = PdfWriter()
+    for page in pages:
+        writer.add_page(page)
+
+    special = {
+        writer._info.indirect_reference.idnum: INFO,
+        writer.root_object.raw_get("/Pages").idnum: PAGES,
+        writer.root_object.indirect_reference.idnum: ROOT,
+    }
+    numbers = {}
+    for idnum, obj in enumerate(writer._objects, 1):
+        if obj is not None and idnum not in special:
+            numbers[idnum] = len(numbers)
+    numbers.update(special)
+
+    page_numbers = {page.indirect_reference.idnum for page in writer.pages}
+    origins = {}
+    for reader_id, translated in writer._id_translated.items():
+        if reader_id in paths:
+            origins.update({new: (paths[reader_id], old) for old, new in translated.items()
+                            if new not in page_numbers})
+
+    objects = []
+    for idnum in numbers:
+        if numbers[idnum] < 0:
+            continue
+        body, references = BytesIO(), []
+        _write_object(writer._objects[idnum - 1], body, references, numbers)
+        objects.append((body.getvalue(), references, origins.get(idnum)))
+    page_objects = [numbers[page.indirect_reference.idnum] for page in writer.pages]
+    writer.close()
+    return objects, page_objects
+
+
+def write_shard(specs):
+    """
+    Run ``serialize_shard`` on pages read from their source pdfs.
+
+    Sources are parsed once per process and reused by later shards.
+
+    Args:
+        specs: A list of tuples in the format: (path, source_index, overrides).
+            ``overrides`` is a dict of page entries that replace those of the
+            source page, or None.
+    """
+    pages = [open_page(source_reader(path), source_index, overrides) for path, source_index, overrides in specs]
+    return serialize_shard(pages, {id(source_reader(path)): path for path, _, _ in specs})
+
+
+def open_page(reader, source_index, overrides=None):
+    """Return the page of ``reader`` at ``source_index``, with ``overrides`` replacing its entries."""
+    page = reader.pages[source_index]
+    if overrides:
+        original, page = page, PageObject(reader, page.indirect_reference)
+        page.update(original)
+        page.update(overrides)
+    return page
+
+
+def source_reader(path):
+    """Return the shared reader of ``path`` from the process-wide SourcePool, kept while the file is unchanged."""
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _readers_lock:
+        if path not in _readers or _readers[path][0] != key:
+            _readers[path] = (key, get_source_pool().get(path, stat)[0])
+        return _readers[path][1]
+
+
+def pdf_version(pages, versions=()):
+    """
+    Return the version a pdf of ``pages`` must declare, e.g. ``"1.6"``.
+
+    Args:
+        pages: Page dictionaries, or dicts of some of their entries such as the overrides of page specs.
+        versions: Versions of the pdfs the pages were read from. Defaults to none.
+    """
+    version = max([BASE_VERSION, *versions])
+    if version < USER_UNIT_VERSION and any("/UserUnit" in page for page in pages):
+        version = USER_UNIT_VERSION
+    return version
+
+
+def source_version(path):
+    """Return the version in the header of the pdf at ``path``."""
+    with open(path, "rb") as file:
+        match = re.search(rb"%PDF-(\d\.\d)", file.read(1024))
+    return match.group(1).decode() if match else BASE_VERSION
+
+
+def set_version(writer):
+    """Raise the header of ``writer``, already at least that of its sources, to the version its pages need."""
+    writer.pdf_header = f"%PDF-{pdf_version(writer.pages, [writer.pdf_header[5:]])}"
+
+
+def write_sharded(shards, stream, max_workers=None, progress=None, cancel=None, readers=None, navigation=None):
+    """
+    Write a pdf of the pages of ``shards``, serializing shards concurrently on a process pool.
+
+    Shards of page specs are serialized by ``write_shard`` on the pool while
+    shards of PageObject objects are serialized in this process. The results
+    are numbered and written in shard order as they arrive, followed by the
+    page tree, catalog and cross-reference table. Objects of a source used by
+    several shards (e.g. fonts) are written once, by the first shard using them.
+
+    Args:
+        shards: A list of shards, each a list of either only PageObject objects
+            or only page specs as taken by ``write_shard``.
+        stream: A writable binary stream.
+        max_workers: Maximum number of processes. Defaults to None.
+            If None, one process per CPU is used.
+        progress: A callable taking ``(done, total)`` called after each shard with
+            the number of pages written. Defaults to None.
+        cancel: A CancelToken object checked between shards. Defaults to None.
+        readers: A dict of the PdfReader objects that pages of PageObject shards
+            were read from keyed by path. Defaults to None.
+        navigation: A Navigation object whose outline and named destinations
+            are written along with the catalog. Defaults to None.
+
+    Raises:
+        OperationCanceled: If ``cancel`` is cancelled before all shards are written.
+    """
+    paths = {id(reader): path for path, reader in (readers or {}).items()}
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    remote = [i for i, shard in enumerate(shards) if all(isinstance(page, tuple) for page in shard)]
+    max_workers = min(max_workers, len(remote))
+    total = sum(len(shard) for shard in shards)
+
+    pages = [page for shard in shards for page in shard]
+    versions = {id(reader): reader.pdf_header[5:] for reader in (readers or {}).values()}
+    versions.update({path: source_version(path) for path, _, _ in (page for page in pages if isinstance(page, tuple))})
+    version = pdf_version([page[2] or {} if isinstance(page, tuple) else page for page in pages],
+                          versions.values())
+
+    start = stream.tell()
+    stream.write(b"%%PDF-%s\n%%\xE2\xE3\xCF\xD3\n" % version.encode())
+    offsets = [0, 0, 0]
+    written = {}
+    kids = []
+    done = 0
+
+    executor = ProcessPoolExecutor(max_workers=max_workers, **worker_options()) if max_workers > 1 else None
+    pending = deque()
+    submitted = iter(remote)
+    remote = set(remote)
+    try:
+        def submit_next():
+            i = next(submitted, None)
+            if i is not None:
+                pending.append((i, executor.submit(write_shard, shards[i])))
+
+        if executor is not None:
+            for _ in range(2 * max_workers):
+                submit_next()
+
+        for i, shard in enumerate(shards):
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            if pending and pending[0][0] == i:
+                result = pending.popleft()[1].result()
+                submit_next()
+            elif i in remote and executor is None:
+                result = write_shard(shard)
+            else:
+                result = serialize_shard(shard, paths)
+
+            objects, page_objects = result
+            numbers = []
+            for body, references, origin in objects:
+                if origin not in written:
+                    offsets.append(None)
+                    if origin is not None:
+                        written[origin] = len(offsets)
+                numbers.append(written.get(origin, len(offsets)))
+            for (body, references, origin), num in zip(objects, numbers):
+                if offsets[num - 1] is None:
+                    offsets[num - 1] = stream.tell() - start
+                    stream.write(f"{num} 0 obj\n".encode())
+                    stream.write(_number_references(body, references, numbers))
+                    stream.write(b"\nendobj\n")
+            kids += [numbers[page] for page in page_objects]
+
+            done += len(shard)
+            if progress is not None:
+                progress(done, total)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    entries = BytesIO()
+    if navigation is not None:
+        added = []
+
+        def add(obj):
+            offsets.append(None)
+            added.append((len(offsets), obj))
+            return IndirectObject(len(offsets), 0, None)
+
+        catalog_entries = DictionaryObject()
+        navigation.write(catalog_entries, add, [IndirectObject(kid, 0, None) for kid in kids])
+        for num, obj in added:
+            offsets[num - 1] = stream.tell() - start
+            stream.write(b"%d 0 obj\n" % num)
+            obj.write_to_stream(stream)
+            stream.write(b"\nendobj\n")
+        for key, value in catalog_entries.items():
+            key.write_to_stream(entries)
+            entries.write(b" ")
+            value.write_to_stream(entries)
+            entries.write(b"\n")
+
+    catalog = {
+        -INFO: b"<<\n/Producer (pypdf)\n>>",
+        -PAGES: b"<<\n/Type /Pages\n/Count %d\n/Kids [%s ]\n>>" % (
+            len(kids), b"".join(b" %d 0 R" % kid for kid in kids)),
+        -ROOT: b"<<\n/Type /Catalog\n/Pages %d 0 R\n%s>>" % (-PAGES, entries.getvalue()),
+    }
+    for num in sorted(catalog):
+        offsets[num - 1] = stream.tell() - start
+        stream.write(b"%d 0 obj\n%s\nendobj\n" % (num, catalog[num]))
+
+    xref_offset = stream.tell() - start
+    stream.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(offsets) + 1))
+    stream.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+    stream.write(b"trailer\n<<\n/Size %d\n/Root %d 0 R\n/Info %d 0 R\n>>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(offsets) + 1, -ROOT, -INFO, xref_offset))
+
+
+def _number_references(body, references, numbers):
+    """Return ``body`` with the final object number inserted at each of ``references``."""
+    pieces = []
+    previous = 0
+    for position, target in references:
+        pieces.append(body[previous:position])
+        pieces.append(b"%d" % (numbers[target] if target >= 0 else -target))
+        previous = position
+    pieces.append(body[previous:])
+    return b"".join(pieces)
+
+
+def _write_object(obj, stream, references, numbers):
+    """Write ``obj`` like its ``write_to_stream`` does, recording where object numbers belong."""
+    kind = _kinds.get(type(obj))
+    if kind is None:
+        kind = _kind(type(obj))
+    if kind is IndirectObject:
+        target = numbers.get(obj.idnum)
+        if target is None:
+            # A reference to a missing object means null.
+            stream.write(b"null")
+            return
+        references.append((stream.tell(), target))
+        stream.write(b" 0 R")
+    elif kind is StreamObject:
+        _write_dictionary(obj, stream, references, numbers, b"/Length %d\n" % len(obj._data))
+        stream.write(b"\nstream\n")
+        stream.write(obj._data)
+        stream.write(b"\nendstream")
+    elif kind is DictionaryObject:
+        _write_dictionary(obj, stream, references, numbers)
+    elif kind is ArrayObject:
+        stream.write(b"[")
+        for item in obj:
+            stream.write(b" ")
+            _write_object(item, stream, references, numbers)
+        stream.write(b" ]")
+    else:
+        obj.write_to_stream(stream)
+
+
+def _write_dictionary(obj, stream, references, numbers, length=b""):
+    stream.write(b"<<\n")
+    for key, value in obj.items():
+        if key == "/Length" and length or len(key) > 2 and key[1] == "%" and key[-1] == "%":
+            continue
+        key.write_to_stream(stream)
+        stream.write(b" ")
+        _write_object(value, stream, references, numbers)
+        stream.write(b"\n")
+    stream.write(length + b">>")
+
+
+# isinstance checks against pypdf's classes are slow, so each type's kind is looked up once.
+_kinds = {}
+
+
+def _kind(cls):
+    for kind in (IndirectObject, StreamObject, DictionaryObject, ArrayObject):
+        if issubclass(cls, kind):
+            break
+    else:
+        kind = False
+    _kinds[cls] = kind
+    return kind
@@ -0,0 +1,108 @@
+import os, tempfile
+from pypdf import PdfWriter
+from shard import open_page, set_version, source_reader
+
+# Bytes a pdf needs besides its objects: header, catalog, page tree, trailer.
+BASE_SIZE = 300
+# Bytes each object needs besides its body: "n 0 obj"/"endobj" and its xref entry.
+OBJECT_OVERHEAD = 40
+
+
+class _ByteCounter:
+    """Writable stream that only counts what is written to it."""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.size
+
+
+def write_parts(pages, directory, max_bytes=None):
+    """
+    Write ``pages`` to new pdfs in ``directory``, starting another pdf when one would exceed ``max_bytes``.
+
+    The size of each pdf is estimated while pages are added, from the objects
+    each page brings in. A page that would overflow a pdf is taken back out
+    and starts the next one; a page that alone exceeds ``max_bytes`` gets a
+    pdf of its own.
+
+    Args:
+        pages: A list of PageObject objects.
+        directory: The directory to write to.
+        max_bytes: Maximum size of each pdf in bytes. Defaults to None.
+            If None, all pages go to one pdf.
+
+    Returns:
+        A list of paths of the temporary files written, in page order.
+    """
+    paths = []
+    writer = PdfWriter()
+    try:
+        size = BASE_SIZE
+        for page in pages:
+            if max_bytes is None:
+                writer.add_page(page)
+                continue
+
+            count = len(writer._objects)
+            added = _added_size(writer, page)
+            if size + added > max_bytes and len(writer.pages) > 1:
+                # Objects the page brought in are used by nothing else yet.
+                writer.remove_page(len(writer.pages) - 1)
+                writer._objects[count:] = [None] * (len(writer._objects) - count)
+                paths.append(_write_temporary(writer, directory))
+                writer.close()
+                writer, size = PdfWriter(), BASE_SIZE
+                added = _added_size(writer, page)
+            size += added
+        paths.append(_write_temporary(writer, directory))
+    except BaseException:
+        for path in paths:
+            os.unlink(path)
+        raise
+    finally:
+        writer.close()
+    return paths
+
+
+def _write_temporary(writer, directory):
+    set_version(writer)
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            writer.write(file)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+
+def write_source_parts(specs, directory, max_bytes=None):
+    """
+    Run ``write_parts`` on pages read from their source pdfs.
+
+    Sources are parsed once per process and reused by later calls.
+
+    Args:
+        specs: A list of page specs as taken by ``shard.write_shard``.
+    """
+    pages = [open_page(source_reader(path), source_index, overrides) for path, source_index, overrides in specs]
+    return write_parts(pages, directory, max_bytes)
+
+
+def _added_size(writer, page):
+    """Add ``page`` to ``writer`` and return the estimated size in bytes of the objects it brought in."""
+    count = len(writer._objects)
+    writer.add_page(page)
+    counter = _ByteCounter()
+    for obj in writer._objects[count:]:
+        if obj is not None:
+            obj.write_to_stream(counter)
+            counter.size += OBJECT_OVERHEAD
+    # The page tree grows by one reference.
+    return counter.size + 10
@@ -0,0 +1,168 @@
+from itertools import count
+from pypdf import Transformation
+from pypdf.generic import (ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject, IndirectObject,
+                           NameObject, StreamObject)
+from impose import ROTATION_MATRICES, placement, visible_box
+
+# Prefix of the resource names stamps are drawn by, e.g. /Stamp0.
+RESOURCE_PREFIX = "/Stamp"
+
+
+def display_matrix(page):
+    """
+    Return the ``cm`` matrix that maps upright coordinates of ``page``'s visible box onto the page.
+
+    Upright coordinates start at the lower-left corner of the page as a viewer
+    shows it, after /Rotate is applied.
+
+    Returns:
+        A tuple in the format: (ctm, shown), where ``shown`` is the upright
+        size of the visible box in the format: (width, height).
+    """
+    box = visible_box(page)
+    width, height = float(box.width), float(box.height)
+    rotation = page.get("/Rotate", 0) % 360
+    shown = (height, width) if rotation in (90, 270) else (width, height)
+
+    ctm = (Transformation(ROTATION_MATRICES[-rotation % 360](*shown))
+        .translate(float(box.left), float(box.bottom)))
+    return ctm.ctm, shown
+
+
+class Stamper:
+    """
+    Draws stamps and text onto pages, adding each distinct object to ``doc`` once.
+
+    A page only gains references to shared operator streams around its content
+    and a resource entry naming what they draw. Pages of the same geometry draw
+    a stamp with the same stream, and pages sharing resources share the
+    extended resources, so stamping costs about the same however many pages get it.
+    """
+
+    def __init__(self, doc):
+        """
+        Args:
+            doc: A PdfWriter object that owns the new objects.
+        """
+        self.doc = doc
+        self._streams = {}
+        self._resources = {}
+        self._geometries = {}
+        self._font = None
+
+
+    def stamp(self, page, stamp, xobject, under=False):
+        """
+        Draw ``stamp`` on ``page``, scaled uniformly to fit its visible box, upright and centered.
+
+        Args:
+            page: The PageObject object to draw on. Its /Contents and /Resources are replaced.
+            stamp: The PageObject object of the stamp.
+            xobject: A reference to the form XObject of ``stamp`` in ``doc``,
+                as returned by ``impose.page_to_xobject``.
+            under: Whether to draw beneath the page's content. Defaults to False.
+        """
+        geometry = self._geometry(page)
+        if xobject.idnum not in geometry:
+            display, shown = geometry["display"]
+            ctm = Transformation(placement(stamp, (0, 0, *shown))).transform(Transformation(display)).ctm
+            geometry[xobject.idnum] = _matrix(ctm)
+        name = self._add_resource(page, "/XObject", xobject)
+        self._draw(page, f"q {geometry[xobject.idnum]} cm {name} Do Q".encode(), under)
+
+
+    def text(self, page, text, position=(36, 36), font_size=10):
+        """
+        Write a line of ``text`` on ``page`` in Helvetica, which every pdf viewer has.
+
+        Args:
+            page: The PageObject object to draw on. Its /Contents and /Resources are replaced.
+            text: The text to write. Characters outside of Windows-1252 are written as "?".
+            position: A tuple of the start of the text's baseline in the format: (x, y),
+                measured from the lower-left corner of the page as shown.
+            font_size: Size of the text. Defaults to 10.
+        """
+        display = self._geometry(page)["matrix"]
+        name = self._add_resource(page, "/Font", self._font_reference())
+        string = text.encode("cp1252", "replace").hex().upper()
+        self._draw(page, (f"q {display} cm BT {name} {FloatObject(font_size)} Tf "
+                          f"{FloatObject(position[0])} {FloatObject(position[1])} Td <{string}> Tj ET Q").encode())
+
+
+    def _geometry(self, page):
+        """Return a dict of what is drawn the same way on every page shaped like ``page``."""
+        key = (tuple(page.mediabox), tuple(page.cropbox) if "/CropBox" in page else None, page.get("/Rotate", 0))
+        if key not in self._geometries:
+            display = display_matrix(page)
+            self._geometries[key] = {"display": display, "matrix": _matrix(display[0])}
+        return self._geometries[key]
+
+
+    def _draw(self, page, operators, under=False):
+        """Add ``operators``, which leave the graphics state as they found it, to the content of ``page``."""
+        contents = self._content_references(page)
+        if under:
+            contents = [self._stream(operators)] + contents
+        else:
+            # The page's content may leave its graphics state changed, so it is wrapped in q/Q.
+            contents = [self._stream(b"q")] + contents + [self._stream(b"Q " + operators)]
+        page[NameObject("/Contents")] = ArrayObject(contents)
+
+
+    def _content_references(self, page):
+        if "/Contents" not in page:
+            return []
+        contents = page.raw_get("/Contents")
+        resolved = contents.get_object()
+        items = list(resolved) if isinstance(resolved, ArrayObject) else [contents]
+        # Content rewritten by e.g. ``PageObject.scale_by`` is held directly by the page.
+        return [self.doc._add_object(item) if isinstance(item, StreamObject) else item for item in items]
+
+
+    def _stream(self, data):
+        """Return a reference to a content stream of ``data``, added to ``doc`` the first time it is used."""
+        if data not in self._streams:
+            stream = DecodedStreamObject()
+            stream.set_data(data)
+            self._streams[data] = self.doc._add_object(stream)
+        return self._streams[data]
+
+
+    def _add_resource(self, page, category, reference):
+        """Give ``page`` resources that name ``reference`` under ``category`` and return the name."""
+        original = page.raw_get("/Resources") if "/Resources" in page else None
+        if isinstance(original, IndirectObject):
+            key = (id(original.pdf), original.idnum, category, reference.idnum)
+        else:
+            key = (id(original), category, reference.idnum)
+
+        if key not in self._resources:
+            resources = DictionaryObject(original.get_object()) if original is not None else DictionaryObject()
+            entries = resources.get(category)
+            entries = DictionaryObject(entries.get_object()) if entries is not None else DictionaryObject()
+            name = next(f"{RESOURCE_PREFIX}{i}" for i in count() if f"{RESOURCE_PREFIX}{i}" not in entries)
+            entries[NameObject(name)] = reference
+            resources[NameObject(category)] = entries
+            if isinstance(original, IndirectObject):
+                resources = self.doc._add_object(resources)
+            # ``original`` is kept alive so the id in ``key`` is never reused.
+            self._resources[key] = (original, resources, name)
+
+        _, resources, name = self._resources[key]
+        page[NameObject("/Resources")] = resources
+        return name
+
+
+    def _font_reference(self):
+        if self._font is None:
+            self._font = self.doc._add_object(DictionaryObject({
+                NameObject("/Type"): NameObject("/Font"),
+                NameObject("/Subtype"): NameObject("/Type1"),
+                NameObject("/BaseFont"): NameObject("/Helvetica"),
+                NameObject("/Encoding"): NameObject("/WinAnsiEncoding"),
+            }))
+        return self._font
+
+
+def _matrix(ctm):
+    return " ".join(f"{FloatObject(value)}" for value in ctm)
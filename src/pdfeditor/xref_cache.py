@@ -0,0 +1,149 @@
+import hashlib, json, os, tempfile
+from io import BytesIO
+import pypdf
+from pypdf import PdfReader
+from pypdf.generic import read_object
+
+# Bytes at each end of a file that its fingerprint covers, along with its size.
+SAMPLE_BYTES = 1 << 16
+DEFAULT_DIRECTORY = os.path.join(tempfile.gettempdir(), "pdfeditor-xrefs")
+
+
+class XrefCache:
+    """
+    Directory of the cross-reference tables pypdf rebuilt for damaged pdfs.
+
+    pypdf rebuilds a broken table by scanning and parsing the whole file, on
+    every open. Rebuilt tables are stored here, one JSON file per damaged pdf,
+    keyed by a fingerprint of its size and the bytes at both of its ends, so
+    a copy or a rename of the file finds its table too. Entries are checked
+    against the file before they are used (see ``SharedReader``), so a stale
+    entry only costs a rebuild.
+
+    Attributes:
+        directory: Path of the cache directory, created once an entry is written.
+    """
+
+    def __init__(self, directory=DEFAULT_DIRECTORY):
+        """
+        Args:
+            directory: Path of the cache directory. Defaults to ``pdfeditor-xrefs`` in the temporary directory.
+        """
+        self.directory = directory
+
+
+    @staticmethod
+    def fingerprint(data):
+        """Return the fingerprint of a pdf given a bytes-like object of its whole contents."""
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(b"%d %s\n" % (len(data), pypdf.__version__.encode()))
+        digest.update(data[:SAMPLE_BYTES])
+        digest.update(data[-SAMPLE_BYTES:])
+        return digest.hexdigest()
+
+
+    def get(self, key):
+        """Return the entry stored under ``key``, or None."""
+        try:
+            with open(os.path.join(self.directory, f"{key}.json")) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+
+    def put(self, key, entry):
+        """Store ``entry``, a JSON-serializable dict, under ``key``."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix=".json", dir=self.directory)
+        try:
+            with os.fdopen(fd, "w") as file:
+                json.dump(entry, file)
+            os.replace(temp_path, os.path.join(self.directory, f"{key}.json"))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+class XrefReader(PdfReader):
+    """
+    PdfReader that takes the tables of damaged pdfs from an XrefCache instead of rebuilding them.
+
+    Tables it has to rebuild are stored for later opens. A stored table is
+    only used if every object it lists is found where it says, which costs
+    as much as pypdf's own check of a healthy table.
+
+    Attributes:
+        xrefs: The XrefCache object used, or None.
+        xref_repaired: Whether the table was rebuilt by scanning the file.
+        xref_restored: Whether the table was taken from ``xrefs``.
+    """
+
+    def __init__(self, stream, strict=False, password=None, xrefs=None):
+        """
+        Args:
+            stream: A path or a binary stream of a pdf, as taken by ``PdfReader``.
+            strict: Whether problems are errors rather than warnings. Defaults to False.
+            password: The password of an encrypted pdf. Defaults to None.
+            xrefs: An XrefCache object. Defaults to None.
+                If None, tables are rebuilt on every open like ``PdfReader`` does.
+        """
+        self.xrefs = xrefs
+        self.xref_repaired = False
+        self.xref_restored = False
+        super().__init__(stream, strict, password)
+
+
+    def read(self, stream):
+        key = None
+        if self.xrefs is not None and hasattr(stream, "getbuffer"):
+            with stream.getbuffer() as data:
+                key = self.xrefs.fingerprint(data)
+            entry = self.xrefs.get(key)
+            if entry is not None and self._restore_xref(stream, entry):
+                self.xref_restored = True
+                return
+
+        super().read(stream)
+        if self.xref_repaired and key is not None:
+            self.xrefs.put(key, self._xref_entry())
+
+
+    def _rebuild_xref_table(self, stream):
+        self.xref_repaired = True
+        super()._rebuild_xref_table(stream)
+
+
+    def _xref_entry(self):
+        """Return the current table and trailer as an XrefCache entry."""
+        trailer = BytesIO()
+        self.trailer.write_to_stream(trailer)
+        return {
+            "startxref": self._startxref,
+            "xref": [[generation, idnum, offset] for generation, entries in self.xref.items()
+                     for idnum, offset in entries.items()],
+            "objstm": [[idnum, *location] for idnum, location in self.xref_objStm.items()],
+            "free": [[generation, idnum] for generation, entries in self.xref_free_entry.items()
+                     for idnum, free in entries.items() if free],
+            "trailer": trailer.getvalue().decode("latin-1"),
+        }
+
+
+    def _restore_xref(self, stream, entry):
+        """Use the table of ``entry`` if every object it lists is found where it says. Return whether it was used."""
+        xref = {}
+        try:
+            for generation, idnum, offset in entry["xref"]:
+                stream.seek(offset)
+                if self.read_object_header(stream) != (idnum, generation):
+                    return False
+                xref.setdefault(generation, {})[idnum] = offset
+            self.xref = xref
+            self.xref_objStm = {idnum: (number, index) for idnum, number, index in entry["objstm"]}
+            self.xref_free_entry = {}
+            for generation, idnum in entry["free"]:
+                self.xref_free_entry.setdefault(generation, {})[idnum] = True
+            self.trailer = read_object(BytesIO(entry["trailer"].encode("latin-1")), self)
+            self._startxref = entry["startxref"]
+        except Exception:
+            return False
+        return True
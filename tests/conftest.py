@@ -0,0 +1,20 @@
+import pytest
+from pypdf import PdfWriter
+
+
+@pytest.fixture
+def blank_writer():
+    """Return a function that makes a PdfWriter of ``count`` blank pages 200 high and 100, 101, ... wide."""
+    def make(count):
+        writer = PdfWriter()
+        for i in range(count):
+            writer.add_blank_page(100 + i, 200)
+        return writer
+    return make
+
+
+@pytest.fixture
+def sample_pdf(tmp_path, blank_writer):
+    path = str(tmp_path / "sample.pdf")
+    blank_writer(4).write(path)
+    return path
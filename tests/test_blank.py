@@ -0,0 +1,70 @@
+import random, zlib
+import pytest
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, EncodedStreamObject, NameObject, NumberObject
+from blank import AMBIGUOUS, BLANK, NOT_BLANK, check_sources, classify_page, content_operators, page_is_blank
+
+def draw(writer, page, content, xobjects=None):
+    stream = DecodedStreamObject()
+    stream.set_data(content)
+    page[NameObject("/Contents")] = writer._add_object(stream)
+    if xobjects:
+        page[NameObject("/Resources")] = DictionaryObject({NameObject("/XObject"): DictionaryObject(
+            {NameObject(name): writer._add_object(xobject) for name, xobject in xobjects.items()})})
+    return page
+
+def gray_image(pixels, width=100):
+    image = EncodedStreamObject()
+    image._data = zlib.compress(pixels)
+    image.update({NameObject("/Type"): NameObject("/XObject"), NameObject("/Subtype"): NameObject("/Image"),
+                  NameObject("/Width"): NumberObject(width), NameObject("/Height"): NumberObject(len(pixels)//width),
+                  NameObject("/ColorSpace"): NameObject("/DeviceGray"),
+                  NameObject("/BitsPerComponent"): NumberObject(8),
+                  NameObject("/Filter"): NameObject("/FlateDecode")})
+    return image
+
+@pytest.fixture
+def writer():
+    return PdfWriter()
+
+@pytest.fixture
+def white_scan(writer):
+    pixels = bytearray(b"\xff" * 10000)
+    pixels[:20] = b"\x00" * 20
+    return draw(writer, writer.add_blank_page(100, 100), b"q 100 0 0 100 0 0 cm /Im0 Do Q",
+                {"/Im0": gray_image(bytes(pixels))})
+
+@pytest.fixture
+def dark_scan(writer):
+    pixels = random.Random(0).randbytes(10000)
+    return draw(writer, writer.add_blank_page(100, 100), b"q 100 0 0 100 0 0 cm /Im0 Do Q",
+                {"/Im0": gray_image(pixels)})
+
+
+def test_content_operators_ignore_strings_and_names():
+    assert content_operators(b"q /Tj gs (Tj) Tj Q") == [b"q", b"gs", b"Tj", b"Q"]
+
+
+def test_classify_structure(writer):
+    assert classify_page(writer.add_blank_page(100, 100)) == (BLANK, [])
+    assert classify_page(draw(writer, writer.add_blank_page(100, 100), b"q 1 0 0 1 0 0 cm Q")) == (BLANK, [])
+    text = draw(writer, writer.add_blank_page(100, 100), b"BT /F1 12 Tf (Hi) Tj ET")
+    assert classify_page(text) == (NOT_BLANK, [])
+
+
+def test_classify_image_pages(white_scan, dark_scan):
+    assert classify_page(white_scan) == (AMBIGUOUS, ["/Im0"])
+    assert classify_page(dark_scan) == (NOT_BLANK, [])
+
+
+def test_page_is_blank_decodes_ambiguous(writer, white_scan):
+    assert page_is_blank(white_scan)
+    grey = draw(writer, writer.add_blank_page(100, 100), b"/Im0 Do", {"/Im0": gray_image(b"\x80" * 10000)})
+    assert classify_page(grey)[0] == AMBIGUOUS
+    assert not page_is_blank(grey)
+
+
+def test_check_sources(writer, white_scan, dark_scan, tmp_path):
+    path = str(tmp_path / "scan.pdf")
+    writer.write(path)
+    assert check_sources({path: [0, 1]}, max_workers=2) == {(path, 0): True, (path, 1): False}
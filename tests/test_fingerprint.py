@@ -0,0 +1,86 @@
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from pypdf import PdfWriter
+from pypdf.generic import ArrayObject, DecodedStreamObject, DictionaryObject, NameObject, RectangleObject
+import fingerprint
+from fingerprint import content_digest, fingerprint_sources, geometry_digest
+
+def text_page(writer, text, width=100):
+    page = writer.add_blank_page(width, 100)
+    content = DecodedStreamObject()
+    content.set_data(f"BT /F1 12 Tf 10 50 Td ({text}) Tj ET".encode())
+    font = DictionaryObject({NameObject("/Type"): NameObject("/Font"),
+                             NameObject("/Subtype"): NameObject("/Type1"),
+                             NameObject("/BaseFont"): NameObject("/Helvetica")})
+    page[NameObject("/Contents")] = writer._add_object(content)
+    page[NameObject("/Resources")] = DictionaryObject({
+        NameObject("/Font"): DictionaryObject({NameObject("/F1"): writer._add_object(font)})})
+    return page
+
+def annotate(writer, page, subtype):
+    annot = DictionaryObject({NameObject("/Type"): NameObject("/Annot"), NameObject("/Subtype"): NameObject(subtype),
+                              NameObject("/Rect"): RectangleObject([10, 10, 50, 50]),
+                              NameObject("/P"): page.indirect_reference})
+    page[NameObject("/Annots")] = ArrayObject([writer._add_object(annot)])
+    return page
+
+@pytest.fixture
+def packet_paths(tmp_path):
+    paths = []
+    for name, texts in (("a", ["Cover", "One"]), ("b", ["Cover", "Two"])):
+        writer = PdfWriter()
+        for text in texts:
+            text_page(writer, text)
+        path = str(tmp_path / f"{name}.pdf")
+        writer.write(path)
+        paths.append(path)
+    return paths
+
+
+def test_content_digest_by_value():
+    first, second = PdfWriter(), PdfWriter()
+    assert content_digest(text_page(first, "Cover")) == content_digest(text_page(second, "Cover"))
+    assert content_digest(text_page(first, "Cover")) != content_digest(text_page(first, "Back"))
+
+
+def test_content_digest_includes_annotations():
+    first, second = PdfWriter(), PdfWriter()
+    plain = text_page(first, "Cover")
+    noted = annotate(first, text_page(first, "Cover"), "/Text")
+    highlighted = annotate(first, text_page(first, "Cover"), "/Highlight")
+
+    assert len({content_digest(page) for page in (plain, noted, highlighted)}) == 3
+    assert content_digest(noted) == content_digest(annotate(second, text_page(second, "Cover"), "/Text"))
+
+
+def test_geometry_digest():
+    writer = PdfWriter()
+    assert geometry_digest(text_page(writer, "A")) != geometry_digest(text_page(writer, "A", width=200))
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_fingerprint_sources_across_files(packet_paths, max_workers):
+    results = fingerprint_sources({path: [0, 1] for path in packet_paths}, max_workers)
+    a, b = (results[path] for path in packet_paths)
+    assert a[0] == b[0]
+    assert a[1] != b[1]
+
+
+def test_fingerprint_sources_splits_large_sources(packet_paths, monkeypatch):
+    submitted = []
+
+    class Executor(ThreadPoolExecutor):
+        def __init__(self, max_workers, **kwargs):
+            super().__init__(max_workers)
+
+        def submit(self, fn, *args):
+            submitted.append(args)
+            return super().submit(fn, *args)
+
+    path = packet_paths[0]
+    serial = fingerprint_sources({path: [0, 1]}, max_workers=1)
+    assert fingerprint_sources({path: [0, 1]}, max_workers=2) == serial
+
+    monkeypatch.setattr(fingerprint, "ProcessPoolExecutor", Executor)
+    assert fingerprint_sources({path: [1, 0]}, max_workers=2) == serial
+    assert submitted == [(path, [0]), (path, [1])]
@@ -0,0 +1,36 @@
+import pytest
+from pypdf import PdfWriter
+from pypdf.generic import NameObject, NumberObject
+from impose import booklet_order, grid_cells, placement
+
+@pytest.fixture
+def blank_page():
+    return PdfWriter().add_blank_page(100, 200)
+
+
+def test_booklet_order_pads_to_multiple_of_4():
+    assert booklet_order(4) == [(3, 0), (1, 2)]
+    assert booklet_order(6) == [(None, 0), (1, None), (5, 2), (3, 4)]
+    assert booklet_order(0) == []
+
+
+def test_grid_cells():
+    cells = grid_cells((210, 110), 2, 2, margin=(5, 5, 5, 5), gap=0)
+    assert cells == [(5, 55, 100, 50), (105, 55, 100, 50),
+                     (5, 5, 100, 50), (105, 5, 100, 50)]
+
+
+def test_grid_cells_no_room():
+    with pytest.raises(ValueError):
+        grid_cells((100, 100), 1, 2, margin=(50, 0, 50, 0))
+
+
+def test_placement_fits_and_centers(blank_page):
+    assert placement(blank_page, (0, 0, 100, 100)) == (0.5, 0, 0, 0.5, 25, 0)
+
+
+def test_placement_rotated(blank_page):
+    blank_page[NameObject("/Rotate")] = NumberObject(90)
+    a, b, c, d, e, f = placement(blank_page, (0, 0, 200, 100))
+    # The page's top-left corner lands on the cell's top-right corner.
+    assert (a*0 + c*200 + e, b*0 + d*200 + f) == (200, 100)
@@ -0,0 +1,52 @@
+import io
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import ArrayObject, DictionaryObject, NameObject, NumberObject, RectangleObject
+from incremental import write_increment
+
+
+def nested_pdf():
+    """Return a pdf whose two pages sit under an intermediate node that holds their media box."""
+    writer = PdfWriter()
+    tree = writer.root_object["/Pages"]
+    node = DictionaryObject({
+        NameObject("/Type"): NameObject("/Pages"),
+        NameObject("/Parent"): writer.root_object.raw_get("/Pages"),
+        NameObject("/Count"): NumberObject(2),
+        NameObject("/MediaBox"): RectangleObject([0, 0, 300, 400]),
+    })
+    node_reference = writer._add_object(node)
+    node[NameObject("/Kids")] = ArrayObject(
+        writer._add_object(DictionaryObject({
+            NameObject("/Type"): NameObject("/Page"),
+            NameObject("/Parent"): node_reference,
+            NameObject("/Resources"): DictionaryObject(),
+        }))
+        for _ in range(2))
+    tree[NameObject("/Kids")] = ArrayObject([node_reference])
+    tree[NameObject("/Count")] = NumberObject(2)
+
+    stream = io.BytesIO()
+    writer.write(stream)
+    return stream
+
+
+def test_moved_pages_keep_inherited_attributes():
+    stream = nested_pdf()
+    reader = PdfReader(stream)
+    write_increment(reader, [reader.pages[1]], stream)
+
+    pages = PdfReader(stream).pages
+    assert len(pages) == 1
+    assert pages[0].mediabox.width == 300
+
+
+def test_unedited_pages_are_not_rewritten(blank_writer):
+    stream = io.BytesIO()
+    blank_writer(3).write(stream)
+    size = stream.tell()
+
+    reader = PdfReader(stream)
+    write_increment(reader, list(reader.pages)[::-1], stream)
+    increment = stream.getvalue()[size:]
+    assert increment.count(b" obj\n") == 1
+    assert [page.mediabox.width for page in PdfReader(stream).pages] == [102, 101, 100]
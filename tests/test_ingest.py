@@ -0,0 +1,59 @@
+import pytest
+from pypdf import PdfWriter
+from ingest import Prefetch, inspect_pdf, inspect_pdfs
+from progress import CancelToken, OperationCanceled
+
+@pytest.fixture
+def pdf_paths(tmp_path):
+    paths = []
+    for num_pages in (1, 3, 2):
+        path = str(tmp_path / f"pages_{num_pages}.pdf")
+        writer = PdfWriter()
+        for _ in range(num_pages):
+            writer.add_blank_page(100, 100)
+        writer.write(path)
+        paths.append(path)
+    return paths
+
+@pytest.fixture
+def broken_path(tmp_path):
+    path = tmp_path / "broken.pdf"
+    path.write_bytes(b"not a pdf")
+    return str(path)
+
+
+def test_inspect_pdf(pdf_paths):
+    info = inspect_pdf(pdf_paths[1])
+    assert info.ok
+    assert info.num_pages == 3
+
+
+def test_inspect_pdf_reports_error(broken_path):
+    info = inspect_pdf(broken_path)
+    assert not info.ok
+    assert info.num_pages is None
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_inspect_pdfs_keeps_order(pdf_paths, broken_path, max_workers):
+    paths = [pdf_paths[0], broken_path, *pdf_paths[1:]]
+    infos = inspect_pdfs(paths, max_workers=max_workers)
+    assert [info.path for info in infos] == paths
+    assert [info.num_pages for info in infos] == [1, None, 3, 2]
+
+
+def test_inspect_pdfs_cancel(pdf_paths):
+    cancel = CancelToken()
+    cancel.cancel()
+    with pytest.raises(OperationCanceled):
+        inspect_pdfs(pdf_paths, max_workers=1, cancel=cancel)
+
+
+def test_prefetch_results_in_order(pdf_paths):
+    seen = []
+    with Prefetch(pdf_paths, max_workers=1, on_result=lambda info: seen.append(info.path)) as prefetch:
+        assert prefetch.result(1).num_pages == 3
+        infos = prefetch.results()
+
+    assert [info.num_pages for info in infos] == [1, 3, 2]
+    assert seen == [pdf_paths[1], pdf_paths[0], pdf_paths[2]]
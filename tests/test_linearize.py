@@ -0,0 +1,71 @@
+import io, re
+import pytest
+from pypdf import PdfReader
+from pypdf.generic import DecodedStreamObject, NameObject
+from linearize import _BitWriter, write_linearized
+
+@pytest.fixture
+def writer(blank_writer):
+    writer = blank_writer(3)
+    for i, page in enumerate(writer.pages):
+        content = DecodedStreamObject()
+        content.set_data(f"BT /F1 12 Tf 10 10 Td (page {i}) Tj ET".encode())
+        page[NameObject("/Contents")] = writer._add_object(content)
+    return writer
+
+
+def test_first_page_comes_first(writer):
+    stream = io.BytesIO()
+    write_linearized(writer, stream)
+    data = stream.getvalue()
+
+    linearized = re.search(rb"/Linearized 1 /L (\d+) +/H \[ \d+ +\d+ +\] /O (\d+) +/E (\d+) +/N (\d+)", data)
+    assert linearized is not None and linearized.start() < 1024
+    assert int(linearized[1]) == len(data)
+    assert int(linearized[4]) == 3
+
+    first_page = data.index(b"%d 0 obj" % int(linearized[2]))
+    assert first_page < int(linearized[3]) < data.index(b"(page 1)")
+
+    reader = PdfReader(stream)
+    assert [page.mediabox.width for page in reader.pages] == [100, 101, 102]
+    assert reader.pages[0].get_contents().get_data().endswith(b"(page 0) Tj ET")
+
+
+def test_xref_offsets_point_at_objects(writer):
+    stream = io.BytesIO()
+    write_linearized(writer, stream)
+    data = stream.getvalue()
+
+    for section in re.finditer(rb"xref\n(\d+) (\d+)\n((?:\d{10} \d{5} [nf] \n)+)", data):
+        first = int(section[1])
+        for num, entry in enumerate(section[3].splitlines(), first):
+            if entry.endswith(b"n "):
+                offset = int(entry[:10])
+                assert data.startswith(b"%d 0 obj" % num, offset)
+
+
+def test_bit_writer_pads_rows_to_bytes():
+    bits = _BitWriter()
+    bits.write(1, 16)
+    bits.write_rows([1, 0, 1], 2)
+    bits.write_rows([3], 9)
+    assert bytes(bits.data) == b"\x00\x01\x44\x01\x80"
+
+
+def test_outline_hint_table(writer):
+    writer.add_outline_item("Page 2", 1)
+    stream = io.BytesIO()
+    write_linearized(writer, stream)
+    data = stream.getvalue()
+
+    hint = re.search(rb"\d+ 0 obj\n<< /Length \d+ /S \d+ /O (\d+) >>\nstream\n", data)
+    hint_length = data.index(b"endobj\n", hint.end()) + len(b"endobj\n") - hint.start()
+    table = data[hint.end() + int(hint[1]):hint.end() + int(hint[1]) + 16]
+    first, offset, count, length = (int.from_bytes(table[i:i+4], "big") for i in range(0, 16, 4))
+
+    # Offsets in hint tables leave out the hint stream itself.
+    group = data[offset + hint_length:offset + hint_length + length]
+    assert group.startswith(b"%d 0 obj\n<<\n/First " % first)
+    assert group.count(b" 0 obj\n") == count == 3
+    assert group.endswith(b"endobj\n") and b"/Title (Page 2)" in group
@@ -0,0 +1,58 @@
+import pytest
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import ArrayObject, DictionaryObject, NameObject, TextStringObject
+from outline import Navigation
+
+@pytest.fixture
+def linked_pdf(tmp_path, blank_writer):
+    path = str(tmp_path / "linked.pdf")
+    writer = blank_writer(3)
+    chapter = writer.add_outline_item("Chapter", 0)
+    writer.add_outline_item("Page 2", 1, parent=chapter)
+    writer.add_outline_item("Page 3", 2, parent=chapter)
+    writer.add_named_destination("end", 2)
+    for page, dest in ((0, ArrayObject([writer.pages[2].indirect_reference, NameObject("/Fit")])),
+                       (1, TextStringObject("end"))):
+        annot = writer._add_object(DictionaryObject({
+            NameObject("/Type"): NameObject("/Annot"),
+            NameObject("/Subtype"): NameObject("/Link"),
+            NameObject("/Rect"): ArrayObject(),
+            NameObject("/Dest"): dest,
+        }))
+        writer.pages[page][NameObject("/Annots")] = ArrayObject([annot])
+    writer.write(path)
+    return path
+
+
+def entries(path, source_indices):
+    reader = PdfReader(path)
+    return [(path, reader, i, reader.pages[i]) for i in source_indices]
+
+
+def test_navigation_follows_pages(linked_pdf):
+    navigation = Navigation(entries(linked_pdf, [2, 0, 1]))
+
+    chapter, = navigation.outline
+    assert (chapter.title, chapter.target[0]) == ("Chapter", 1)
+    assert [(item.title, item.target[0]) for item in chapter.children] == [("Page 2", 2), ("Page 3", 0)]
+    assert navigation.destinations["end"][0] == 0
+
+    # Both links lead to the last page of the source, now the first, by name.
+    assert [annot.get_object()["/Dest"] for annot in navigation.annots[1]] == ["link0"]
+    assert [annot.get_object()["/Dest"] for annot in navigation.annots[2]] == ["end"]
+    assert navigation.destinations["link0"][0] == 0
+
+
+def test_navigation_drops_links_to_removed_pages(linked_pdf):
+    navigation = Navigation(entries(linked_pdf, [0, 1]))
+    assert list(navigation.annots[0]) == []
+    assert "end" not in navigation.destinations
+    assert [item.title for item in navigation.outline[0].children] == ["Page 2"]
+
+
+def test_navigation_of_pdf_without_any_is_empty(tmp_path):
+    path = str(tmp_path / "plain.pdf")
+    writer = PdfWriter()
+    writer.add_blank_page(100, 100)
+    writer.write(path)
+    assert not Navigation(entries(path, [0]))
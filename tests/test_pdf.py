@@ -1,5 +1,13 @@
+import os
 import pytest
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import ArrayObject, DecodedStreamObject, DictionaryObject, NameObject, RectangleObject
+import pdf
+import result_cache
 from pdf import PdfManager
+from profiling import Profiler
+from progress import CancelToken, OperationCanceled
+from result_cache import ResultCache
 
 @pytest.fixture
 def alphabet_4():
@@ -9,6 +17,11 @@ def alphabet_4():
 def alphabet_4_reverse():
     return ['d', 'c', 'b', 'a']
 
+@pytest.fixture
+def manager():
+    with PdfManager(profiler=Profiler(enabled=False)) as manager:
+        yield manager
+
 
 def test_reordered_reverse(alphabet_4, alphabet_4_reverse):
     reverse_order = range(len(alphabet_4))[::-1]
@@ -19,4 +32,437 @@ def test_reordered_reverse(alphabet_4, alphabet_4_reverse):
 
     assert manager.rearrange_pages(reverse_order) == alphabet_4_reverse
     assert manager.pages == alphabet_4_reverse
-    assert manager.pages_original == alphabet_4_reverse
\ No newline at end of file
+    assert manager.pages_original == alphabet_4_reverse
+
+
+def test_add_pdf_parses_source_once(sample_pdf):
+    profiler = Profiler(enabled=True)
+    with PdfManager(profiler=profiler) as manager:
+        assert manager.get_pdf_num_pages(sample_pdf) == 4
+        manager.add_pdf(sample_pdf, [0, 2])
+        manager.add_pdf(sample_pdf)
+
+    totals = profiler.summary()
+    assert totals["get_pdf_num_pages"]["reader_cache_misses"] == 1
+    assert totals["add_pdf"]["reader_cache_hits"] == 2
+    assert totals["add_pdf"]["pages"] == 6
+
+
+def test_copied_pages_edit_independently(manager, sample_pdf, tmp_path):
+    manager.add_pdf(sample_pdf, [0, 0])
+    manager.crop(0, (10, 0, 0, 0))
+
+    assert manager.get_page_dims(0) == (90, 200)
+    assert manager.get_page_dims(1) == (100, 200)
+
+    manager.reset_page(0)
+    assert manager.get_page_dims(0) == (100, 200)
+
+    output = str(tmp_path / "output.pdf")
+    manager.crop(1, (0, 0, 0, 50))
+    manager.save_as(output)
+    assert [p.mediabox.height for p in PdfReader(output).pages] == [200, 150]
+
+
+def test_rotate_only_sets_rotate(manager, sample_pdf, tmp_path):
+    manager.add_pdf(sample_pdf)
+    assert manager.rotate([0, 1], 90) == -90
+    manager.rotate([1], 180)
+    with pytest.raises(ValueError):
+        manager.rotate([0], 45)
+
+    output = str(tmp_path / "output.pdf")
+    manager.save_as(output)
+    assert [page.rotation for page in PdfReader(output).pages] == [90, 270, 0, 0]
+
+
+def test_scale_to_box_only(manager, sample_pdf, tmp_path):
+    manager.add_pdf(sample_pdf)
+    contents = manager.get_page(0).get("/Contents")
+    assert manager.scale_to(0, (None, 400), box_only=True) == (100, 200)
+    assert manager.get_page_dims(0) == (200, 400)
+    manager.scale_to(1, (404, 400), box_only=True)
+    assert manager.get_page_dims(1) == (404, 400)
+
+    output = str(tmp_path / "output.pdf")
+    manager.save_as(output)
+    pages = PdfReader(output).pages
+    assert [page.user_unit for page in pages] == [2, 2, 1, 1]
+    assert pages[1].mediabox == [-50.5, 0, 151.5, 200]
+    assert manager.get_page(0).get("/Contents") == contents
+
+
+def test_box_only_scale_then_content_scale(manager, sample_pdf):
+    manager.add_pdf(sample_pdf)
+    manager.scale_to(0, (None, 400), box_only=True)
+    assert manager.get_page_dims(0) == (200, 400)
+    undo = manager.scale_to(0, (300, 300))
+    assert undo == (200, 400)
+    assert manager.get_page_dims(0) == (300, 300)
+    manager.scale_to(0, undo)
+    assert manager.get_page_dims(0) == (200, 400)
+
+
+def test_crop_uses_user_units(manager, sample_pdf):
+    manager.add_pdf(sample_pdf)
+    manager.scale_to(0, (None, 400), box_only=True)
+    undo = manager.crop(0, (10, 0, 30, 0))
+    assert manager.get_page_dims(0) == (160, 400)
+    manager.crop(0, undo)
+    assert manager.get_page_dims(0) == (200, 400)
+
+
+@pytest.mark.parametrize("options", [{"shard_pages": 3}, {"linearize": True}, {"incremental": True}])
+def test_user_unit_raises_pdf_version(manager, sample_pdf, tmp_path, monkeypatch, options):
+    monkeypatch.setattr(pdf, "SHARD_PAGES", options.pop("shard_pages", 256))
+    manager.add_pdf(sample_pdf)
+    manager.scale_to(0, (None, 400), box_only=True)
+    output = str(tmp_path / "output.pdf")
+    manager.save_as(output, **options)
+
+    reader = PdfReader(output)
+    assert reader.pages[0].user_unit == 2
+    assert max(reader.pdf_header, "%PDF-" + reader.root_object.get("/Version", "")[1:]) == "%PDF-1.6"
+
+
+@pytest.mark.parametrize("scaled", [0, 1])
+def test_scaling_one_copy_keeps_the_other(manager, tmp_path, scaled):
+    source = str(tmp_path / "source.pdf")
+    writer = PdfWriter()
+    page = writer.add_blank_page(200, 200)
+    content = DecodedStreamObject()
+    content.set_data(b"0 0 m 10 10 l S")
+    page[NameObject("/Contents")] = writer._add_object(content)
+    writer.write(source)
+
+    manager.add_pdf(source)
+    manager.add_pdf(source)
+    manager.scale_to(scaled, (400, 400))
+    output = str(tmp_path / "output.pdf")
+    manager.save_as(output)
+    data = [page.get_contents().get_data() for page in PdfReader(output).pages]
+    assert data[1 - scaled] == b"0 0 m 10 10 l S"
+    assert b"2 0.0 0.0 2 0.0 0.0 cm" in data[scaled]
+
+
+def test_stamp_and_label(manager, sample_pdf, tmp_path):
+    manager.add_pdf(sample_pdf)
+    manager.label("CONFIDENTIAL")
+    output = str(tmp_path / "stamp.pdf")
+    manager.save_as(output)
+
+    manager.reset_page(0)
+    manager.stamp(output, indices=[0, 1])
+    manager.label("ABC{:04}", indices=[1, 3], start=7)
+    cancel = CancelToken()
+    with pytest.raises(OperationCanceled):
+        manager.label("X", progress=lambda done, total: cancel.cancel(), cancel=cancel)
+
+    manager.save_as(output)
+    pages = PdfReader(output).pages
+    texts = [page.extract_text() for page in pages]
+    assert [text.count("CONFIDENTIAL") for text in texts] == [1, 2, 1, 1]
+    assert ["ABC0007" in texts[1], "ABC0008" in texts[3], "X" in "".join(texts)] == [True, True, False]
+
+    manager.save_as(sample_pdf, incremental=True)
+    assert PdfReader(sample_pdf).pages[1].extract_text() == texts[1]
+
+
+@pytest.mark.parametrize("shard_pages", [3, 256])
+def test_save_as_merges_outlines(manager, sample_pdf, tmp_path, monkeypatch, shard_pages):
+    monkeypatch.setattr(pdf, "SHARD_PAGES", shard_pages)
+    source = str(tmp_path / "outlined.pdf")
+    writer = PdfWriter()
+    for i in range(2):
+        writer.add_blank_page(100, 200)
+    writer.add_outline_item("Second", 1)
+    writer.add_named_destination("second", 1)
+    writer.write(source)
+
+    manager.add_pdf(sample_pdf)
+    manager.add_pdf(source)
+    manager.rearrange_pages([5, 0, 1, 2, 3, 4])
+    output = str(tmp_path / "output.pdf")
+    manager.save_as(output, max_workers=1)
+
+    reader = PdfReader(output)
+    top = [item for item in reader.outline if not isinstance(item, list)]
+    assert [(item.title, reader.get_destination_page_number(item)) for item in top] == [
+        ("outlined", 0), ("sample", 1)]
+    assert reader.get_destination_page_number(reader.outline[1][0]) == 0
+    assert reader.get_destination_page_number(reader.named_destinations["second"]) == 0
+
+
+def test_save_as_reports_progress(manager, sample_pdf, tmp_path):
+    manager.add_pdf(sample_pdf)
+    calls = []
+    manager.save_as(str(tmp_path / "output.pdf"), progress=lambda *args: calls.append(args))
+    assert calls == [(1, 4), (2, 4), (3, 4), (4, 4)]
+
+
+def test_cancelled_save_as_leaves_no_file(manager, sample_pdf, tmp_path):
+    manager.add_pdf(sample_pdf)
+    cancel = CancelToken()
+
+    def cancel_after_two(done, total):
+        if done == 2:
+            cancel.cancel()
+
+    with pytest.raises(OperationCanceled):
+        manager.save_as(str(tmp_path / "output.pdf"), cancel_after_two, cancel)
+    assert list(tmp_path.iterdir()) == [tmp_path / "sample.pdf"]
+
+
+def test_cancelled_add_pdfs_adds_nothing(manager, sample_pdf):
+    manager.add_pdf(sample_pdf, [0])
+    cancel = CancelToken()
+
+    def cancel_after_three(done, total):
+        assert total == 8
+        if done == 3:
+            cancel.cancel()
+
+    with pytest.raises(OperationCanceled):
+        manager.add_pdfs([(sample_pdf, None), (sample_pdf, None)], cancel_after_three, cancel)
+    assert len(manager.pages) == len(manager.pages_original) == 1
+
+
+def test_ingest_adds_pages_without_parsing(manager, sample_pdf, tmp_path):
+    broken = tmp_path / "broken.pdf"
+    broken.write_bytes(b"not a pdf")
+
+    infos = manager.ingest([sample_pdf, str(broken)], max_workers=1)
+    assert [info.ok for info in infos] == [True, False]
+
+    manager.add_pdfs([(sample_pdf, [3, 1])])
+    assert manager.readers == {}
+    assert [page.source_index for page in manager.pages] == [3, 1]
+    assert manager.get_page_dims(0) == (103, 200)
+
+
+def test_prefetch_remembers_sources(manager, sample_pdf):
+    with manager.prefetch([sample_pdf], max_workers=1) as prefetch:
+        prefetch.results()
+
+    assert manager.source_infos[sample_pdf].num_pages == 4
+    assert manager.get_pdf_num_pages(sample_pdf) == 4
+    assert manager.readers == {}
+
+
+def test_impose_shares_page_content(manager, sample_pdf, tmp_path):
+    manager.add_pdf(sample_pdf)
+    manager.add_pdf(sample_pdf, [0])
+    sheets = manager.impose(rows=2, cols=2)
+
+    assert len(sheets) == len(manager.pages_original) == 2
+    assert manager.get_page_dims(0) == (100, 200)
+
+    output = str(tmp_path / "output.pdf")
+    manager.save_as(output)
+    reader = PdfReader(output)
+    xobjects = [set(page["/Resources"]["/XObject"].values()) for page in reader.pages]
+    assert [len(x) for x in xobjects] == [4, 1]
+
+
+def test_remove_duplicates(manager, sample_pdf, tmp_path):
+    manager.add_pdf(sample_pdf, [0, 1, 0, 2, 1])
+    manager.crop(1, (1, 0, 0, 0))
+
+    # Blank pages only differ by size: index 1 was cropped to the size of index 0.
+    assert manager.find_duplicates(max_workers=1) == [[0, 1, 2]]
+
+    output = str(tmp_path / "output.pdf")
+    manager.save_as(output, skip_duplicates=True)
+    assert len(PdfReader(output).pages) == 3
+
+    assert manager.remove_duplicates(max_workers=1) == [1, 2]
+    assert [page.source_index for page in manager.pages] == [0, 2, 1]
+
+
+def test_annotated_pages_are_not_duplicates(manager, tmp_path):
+    source = str(tmp_path / "annotated.pdf")
+    writer = PdfWriter()
+    for i in range(2):
+        page = writer.add_blank_page(100, 200)
+    annot = DictionaryObject({NameObject("/Type"): NameObject("/Annot"), NameObject("/Subtype"): NameObject("/Text"),
+                              NameObject("/Rect"): RectangleObject([10, 10, 50, 50])})
+    page[NameObject("/Annots")] = ArrayObject([writer._add_object(annot)])
+    writer.write(source)
+
+    manager.add_pdf(source, [0, 1, 1])
+    assert manager.find_duplicates(max_workers=1) == [[1, 2]]
+    assert manager.remove_duplicates(max_workers=1) == [2]
+
+
+def test_find_blank_pages(manager, sample_pdf):
+    manager.add_pdf(sample_pdf, [0, 1])
+    assert manager.find_blank_pages(max_workers=1) == [0, 1]
+    manager.pop_pages(manager.find_blank_pages(max_workers=1))
+    assert manager.pages == []
+
+
+def test_save_as_linearized(manager, sample_pdf, tmp_path):
+    manager.add_pdf(sample_pdf, [2, 0])
+    path = str(tmp_path / "output.pdf")
+    manager.save_as(path, linearize=True)
+
+    with open(path, "rb") as file:
+        assert b"/Linearized 1" in file.read(1024)
+    assert [page.mediabox.width for page in PdfReader(path).pages] == [102, 100]
+
+
+def test_save_as_incremental_appends_to_source(manager, sample_pdf, tmp_path):
+    with open(sample_pdf, "rb") as file:
+        original = file.read()
+    manager.add_pdf(sample_pdf)
+    manager.crop(1, (10, 0, 0, 0))
+    manager.pop_pages([0])
+
+    path = str(tmp_path / "output.pdf")
+    manager.save_as(path, incremental=True)
+    with open(path, "rb") as file:
+        assert file.read().startswith(original)
+    assert [page.mediabox.width for page in PdfReader(path).pages] == [91, 102, 103]
+
+    manager.save_as(sample_pdf, incremental=True)
+    manager.pop_pages([2])
+    manager.save_as(sample_pdf, incremental=True)
+    with open(sample_pdf, "rb") as file:
+        assert file.read().startswith(original)
+    assert [page.mediabox.width for page in PdfReader(sample_pdf).pages] == [91, 102]
+
+
+def test_save_as_incremental_remaps_navigation(manager, tmp_path, blank_writer):
+    source = str(tmp_path / "linked.pdf")
+    writer = blank_writer(3)
+    writer.add_outline_item("Last", 2)
+    writer.add_named_destination("end", 2)
+    annot = DictionaryObject({NameObject("/Type"): NameObject("/Annot"), NameObject("/Subtype"): NameObject("/Link"),
+                              NameObject("/Rect"): RectangleObject([0, 0, 10, 10]),
+                              NameObject("/Dest"): ArrayObject([writer.pages[2].indirect_reference, NameObject("/Fit")])})
+    writer.pages[0][NameObject("/Annots")] = ArrayObject([writer._add_object(annot)])
+    writer.write(source)
+
+    manager.add_pdf(source)
+    manager.pop_pages([1])
+    manager.rearrange_pages([1, 0])
+    output = str(tmp_path / "output.pdf")
+    manager.save_as(output, incremental=True)
+
+    reader = PdfReader(output)
+    assert [page.mediabox.width for page in reader.pages] == [102, 100]
+    assert [reader.get_destination_page_number(item) for item in reader.outline] == [0]
+    assert reader.get_destination_page_number(reader.named_destinations["end"]) == 0
+    link = reader.pages[1]["/Annots"][0].get_object()
+    assert reader.get_destination_page_number(reader.named_destinations[link["/Dest"]]) == 0
+
+
+def test_save_as_incremental_needs_one_source(manager, sample_pdf, tmp_path):
+    manager.add_pdf(sample_pdf, [0, 0])
+    with pytest.raises(ValueError):
+        manager.save_as(str(tmp_path / "output.pdf"), incremental=True)
+    assert not (tmp_path / "output.pdf").exists()
+
+
+def test_sharded_save_is_independent_of_workers(manager, sample_pdf, tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf, "SHARD_PAGES", 3)
+    manager.add_pdf(sample_pdf)
+    manager.add_pdf(sample_pdf)
+    manager.crop(1, (10, 0, 0, 0))
+
+    outputs = []
+    for max_workers in (1, 2):
+        path = tmp_path / f"output{max_workers}.pdf"
+        manager.save_as(str(path), max_workers=max_workers)
+        outputs.append(path.read_bytes())
+
+    assert outputs[0] == outputs[1]
+    widths = [page.mediabox.width for page in PdfReader(tmp_path / "output1.pdf").pages]
+    assert widths == [100, 91, 102, 103, 100, 101, 102, 103]
+
+
+def test_split_to(manager, sample_pdf, tmp_path):
+    manager.add_pdf(sample_pdf)
+    manager.crop(0, (10, 0, 0, 0))
+
+    outputs = manager.split_to(3, str(tmp_path / "parts"), max_workers=2)
+    assert [os.path.basename(path) for path in outputs] == ["part_001.pdf", "part_002.pdf"]
+    assert [[page.mediabox.width for page in PdfReader(path).pages] for path in outputs] == [[90, 101, 102], [103]]
+
+    outputs = manager.split_to([[3], [1, 0]], str(tmp_path / "ranges"), prefix="range_")
+    assert [len(PdfReader(path).pages) for path in outputs] == [1, 2]
+
+
+def test_cancelled_split_to_leaves_no_files(manager, sample_pdf, tmp_path):
+    manager.add_pdf(sample_pdf)
+    cancel = CancelToken()
+    with pytest.raises(OperationCanceled):
+        manager.split_to(1, str(tmp_path), max_workers=1, cancel=cancel,
+                         progress=lambda done, total: cancel.cancel())
+    assert os.listdir(tmp_path) == ["sample.pdf"]
+
+
+def test_repeated_saves_use_cache(sample_pdf, tmp_path):
+    profiler = Profiler(enabled=True)
+    cache = ResultCache(str(tmp_path / "cache"))
+    with PdfManager(profiler=profiler, cache=cache) as manager:
+        manager.add_pdf(sample_pdf, [2, 0])
+        manager.save_as(str(tmp_path / "first.pdf"))
+        manager.save_as(str(tmp_path / "second.pdf"))
+        manager.crop(0, (10, 0, 0, 0))
+        manager.save_as(str(tmp_path / "cropped.pdf"))
+        manager.split_to(1, str(tmp_path / "parts"))
+        outputs = manager.split_to([[0], [1]], str(tmp_path / "again"))
+
+    with open(tmp_path / "first.pdf", "rb") as first, open(tmp_path / "second.pdf", "rb") as second:
+        assert first.read() == second.read()
+    assert PdfReader(str(tmp_path / "cropped.pdf")).pages[0].mediabox.left == 10
+    assert [len(PdfReader(path).pages) for path in outputs] == [1, 1]
+    totals = profiler.summary()
+    assert totals["save_as"]["cache_hits"] == 1
+    assert totals["save_as"]["cache_misses"] == 2
+    assert totals["split_to"]["cache_hits"] == 1
+
+
+def test_cache_key_hashes_each_source_once(sample_pdf, tmp_path, monkeypatch):
+    hashed = []
+    file_digest = result_cache._file_digest
+    monkeypatch.setattr(result_cache, "_file_digest", lambda path: hashed.append(path) or file_digest(path))
+    with PdfManager(profiler=Profiler(enabled=False), cache=ResultCache(str(tmp_path / "cache"), verify=True)) as manager:
+        manager.add_pdf(sample_pdf)
+        manager.add_pdf(sample_pdf)
+        manager.crop(5, (10, 0, 0, 0))
+        manager._result_key(range(8))
+    assert hashed == [sample_pdf]
+
+
+def test_memory_ceiling_evicts_least_recently_used_source(sample_pdf, tmp_path):
+    other_pdf = str(tmp_path / "other.pdf")
+    writer = PdfWriter()
+    writer.add_blank_page(300, 300)
+    writer.write(other_pdf)
+
+    profiler = Profiler(enabled=True)
+    with PdfManager(profiler=profiler, max_memory=1) as manager:
+        manager.add_pdf(sample_pdf, [0, 1])
+        manager.add_pdf(other_pdf)
+        manager.crop(0, (10, 0, 0, 0))
+        manager.rotate([1], 90)
+        manager.get_page(2)
+
+        assert list(manager.readers) == [other_pdf]
+        assert isinstance(manager.pages[0], pdf.PageRef)
+        assert manager.get_page(0).mediabox.left == 10
+        assert manager.get_page(1).rotation == 90
+        assert list(manager.readers) == [sample_pdf]
+
+        manager.label("Page {}", [1])
+        manager.get_page(2)
+        # The labelled page's content refers to new objects, so its source must stay parsed.
+        assert list(manager.readers) == [sample_pdf, other_pdf]
+
+        manager.save_as(str(tmp_path / "out.pdf"))
+    reader = PdfReader(str(tmp_path / "out.pdf"))
+    assert [page.mediabox.left for page in reader.pages][0] == 10
+    assert reader.pages[1].rotation == 90
+    assert profiler.summary()["add_pdf"]["readers_evicted"] == 1
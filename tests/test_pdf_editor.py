@@ -62,4 +62,37 @@ def test_str_to_page_range_em_dash(em_dash_pr_str):
 
 def test_str_to_page_range_other_delimiters(other_delimiters_pr_str):
     with pytest.raises(ValueError):
-        str_to_pagerange(other_delimiters_pr_str)
\ No newline at end of file
+        str_to_pagerange(other_delimiters_pr_str)
+
+def test_str_to_layout():
+    assert str_to_layout("2, 2") == (2, 2)
+    assert str_to_layout(" booklet ") is None
+    assert str_to_layout("b") is None
+
+def test_str_to_layout_invalid():
+    for string in ("2", "_, 2", "0, 2", "2x2"):
+        with pytest.raises(ValueError):
+            str_to_layout(string)
+
+def test_str_to_degrees():
+    assert str_to_degrees(" -90 ") == -90
+    with pytest.raises(ValueError):
+        str_to_degrees("45")
+
+def test_add_files_keeps_encrypted_files_in_place(blank_writer, tmp_path, monkeypatch):
+    paths = [str(tmp_path / name) for name in ("a.pdf", "encrypted.pdf", "c.pdf")]
+    for path in paths:
+        writer = blank_writer(4)
+        if path == paths[1]:
+            writer.encrypt("secret", algorithm="RC4-128")
+        writer.write(path)
+
+    answers = iter(["Y", "2", "4", "3"])
+    passwords = iter(["wrong", "secret"])
+    monkeypatch.setattr(filedialog, "askopenfilenames", lambda **kwargs: paths)
+    monkeypatch.setattr("builtins.input", lambda prompt="": next(answers))
+    monkeypatch.setattr(getpass, "getpass", lambda prompt="": next(passwords))
+    with PdfEditor() as editor:
+        editor.add_files()
+        assert [(page.path, page.source_index) for page in editor.manager.pages] == [
+            (paths[0], 1), (paths[1], 2), (paths[2], 3)]
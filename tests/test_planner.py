@@ -0,0 +1,82 @@
+import pytest
+from pdf import PdfManager
+from planner import Operation, Planner
+from profiling import Profiler
+
+
+def page_state(manager):
+    return [(page.source_index, [round(float(v), 6) for v in page.mediabox], page.rotation)
+            for page in (manager.get_page(i) for i in range(len(manager.pages)))]
+
+
+def run_both(sample_pdf, operations):
+    with PdfManager(profiler=Profiler(enabled=False)) as direct, \
+         PdfManager(profiler=Profiler(enabled=False)) as planned:
+        for name, *args in operations:
+            getattr(direct, name)(*args)
+        planner = Planner(planned, operations)
+        planner.run()
+        return page_state(direct), page_state(planned), planner
+
+
+def test_plan_matches_running_every_operation(sample_pdf):
+    operations = [
+        ("add_pdf", sample_pdf),
+        ("crop", 0, (10, 0, 0, 0)),
+        ("crop", 0, (5, 5, 0, 0)),
+        ("rotate", [0, 1], 90),
+        ("scale_to", 1, (50, 100)),
+        ("scale_to", 1, (300, 400)),
+        ("rearrange_pages", [3, 2, 1, 0]),
+        ("rotate", [3], 270),
+        ("add_pdf", sample_pdf, [1, 2]),
+        ("crop", 4, (1, 1, 1, 1)),
+        ("pop_pages", [4, 1]),
+        ("rearrange_pages", [0, 2, 1, 3]),
+    ]
+    direct, planned, planner = run_both(sample_pdf, operations)
+    assert planned == direct
+
+    explanation = planner.explain()
+    assert "scale_to(1, (50, 100)): superseded by a later scale" in explanation
+    assert "crop(4, (1, 1, 1, 1)): dropped, page is removed later" in explanation
+    assert "rearrange_pages([3, 2, 1, 0]): merged into the order pages are added in" in explanation
+    assert "rotate([3], 270): skipped on a page, rotations of page 1 cancel out" in explanation
+    assert "run rearrange_pages" not in explanation
+
+
+def test_plan_merges_into_fewest_calls(sample_pdf):
+    with PdfManager(profiler=Profiler(enabled=False)) as manager:
+        manager.add_pdf(sample_pdf)
+        planner = Planner(manager, [
+            Operation("crop", 0, (10, 0, 0, 0)),
+            Operation("crop", 0, (-10, 0, 0, 0)),
+            Operation("rearrange_pages", [1, 0, 2, 3]),
+            Operation("rearrange_pages", [1, 0, 2, 3]),
+            Operation("add_pdf", sample_pdf, [0]),
+            Operation("pop_pages", [4]),
+            Operation("rotate", [1, 2], 90),
+            Operation("save_as", "unused.pdf"),
+            Operation("impose"),
+            Operation("crop", 0, (1, 1, 1, 1)),
+        ])
+        assert planner.explain().splitlines() == [
+            "7 operation(s) planned as 1:",
+            "  run rotate([1, 2], 90)",
+            "  pop_pages([4]): dropped, its pages are never added",
+            "  add_pdf('%s', [0]): dropped, every page is removed later" % sample_pdf,
+            "  rearrange_pages([1, 0, 2, 3]): dropped, rearranges cancel out",
+            "  rearrange_pages([1, 0, 2, 3]): dropped, rearranges cancel out",
+            "  crop(0, (10, 0, 0, 0)): dropped, crops cancel out",
+            "  crop(0, (-10, 0, 0, 0)): dropped, crops cancel out",
+            "run save_as('unused.pdf')",
+            "run impose()",
+            "crop(0, (1, 1, 1, 1)): planned when reached",
+        ]
+
+
+def test_plan_raises_before_running(sample_pdf):
+    with PdfManager(profiler=Profiler(enabled=False)) as manager:
+        with pytest.raises(IndexError):
+            Planner(manager, [("add_pdf", sample_pdf), ("crop", 9, (1, 1, 1, 1))]).run()
+        assert manager.pages == []
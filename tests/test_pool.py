@@ -0,0 +1,135 @@
+import gc, threading
+import pytest
+from pypdf import PdfReader, PdfWriter
+from pypdf.errors import FileNotDecryptedError, WrongPasswordError
+from pypdf.generic import ArrayObject, DecodedStreamObject, DictionaryObject, NameObject, RectangleObject
+from pdf import PdfManager
+from pool import SourcePool
+from profiling import Profiler
+
+
+@pytest.fixture
+def annotated_pdf(tmp_path):
+    path = str(tmp_path / "annotated.pdf")
+    writer = PdfWriter()
+    for i in range(20):
+        page = writer.add_blank_page(100, 200)
+        content = DecodedStreamObject()
+        content.set_data(b"0 0 m %d 10 l S\n" % i)
+        page[NameObject("/Contents")] = writer._add_object(content)
+        annot = DictionaryObject({NameObject("/Type"): NameObject("/Annot"), NameObject("/Subtype"): NameObject("/Square"),
+                                  NameObject("/Rect"): RectangleObject([10, 10, 50, 50])})
+        page[NameObject("/Annots")] = ArrayObject([writer._add_object(annot)])
+    writer.write(path)
+    return path
+
+
+@pytest.fixture
+def encrypted_pdf(annotated_pdf, tmp_path):
+    path = str(tmp_path / "encrypted.pdf")
+    writer = PdfWriter(clone_from=annotated_pdf)
+    writer.encrypt("secret", algorithm="RC4-128")
+    writer.write(path)
+    return path
+
+
+def test_sessions_share_one_parse(annotated_pdf, tmp_path):
+    sources = SourcePool()
+    profiler = Profiler(enabled=True)
+    with PdfManager(profiler=profiler, sources=sources) as first, \
+         PdfManager(profiler=profiler, sources=sources) as second:
+        first.add_pdf(annotated_pdf)
+        second.add_pdf(annotated_pdf)
+        assert first.readers[annotated_pdf] is second.readers[annotated_pdf]
+
+        first.scale_to(0, (200, 400))
+        first.crop(1, (10, 0, 0, 0))
+        assert second.get_page(0).mediabox.right == 100
+        assert second.get_page(0)["/Annots"][0].get_object()["/Rect"] == [10, 10, 50, 50]
+        assert second.get_page(1).mediabox.left == 0
+    assert profiler.summary()["add_pdf"]["bytes_read"] == profiler.summary()["add_pdf"]["shared_bytes"]
+
+
+def test_threads_edit_separate_sessions(annotated_pdf, tmp_path):
+    sources = SourcePool()
+    shared, _ = sources.get(annotated_pdf)
+    profiler = Profiler(enabled=True)
+    errors = []
+
+    def work(n):
+        try:
+            with PdfManager(profiler=profiler, sources=sources) as manager:
+                manager.add_pdf(annotated_pdf)
+                for i in range(n, 20, 4):
+                    manager.crop(i, (n, 0, 0, 0))
+                    manager.scale_to(i, (50, None))
+                manager.rotate([n], 90 * n)
+                manager.save_as(str(tmp_path / f"out{n}.pdf"))
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert profiler.summary()["save_as"]["calls"] == 4
+    assert all(record["depth"] == 0 for record in profiler.records if record["op"] == "save_as")
+
+    for n in range(4):
+        reader = PdfReader(str(tmp_path / f"out{n}.pdf"))
+        assert reader.pages[n].rotation == 90 * n % 360
+        widths = [round(float(page.mediabox.width), 3) for page in reader.pages]
+        assert widths == [50 if i % 4 == n else 100 for i in range(20)]
+    assert sources.get(annotated_pdf) == (shared, False)
+    assert all(page["/Annots"][0].get_object()["/Rect"] == [10, 10, 50, 50] for page in shared.pages)
+    assert all(page.mediabox == [0, 0, 100, 200] for page in shared.pages)
+
+
+def test_add_pdf_with_password(encrypted_pdf, tmp_path):
+    sources = SourcePool()
+    with PdfManager(sources=sources) as manager:
+        with pytest.raises(FileNotDecryptedError):
+            manager.add_pdf(encrypted_pdf)
+        with pytest.raises(WrongPasswordError):
+            manager.add_pdf(encrypted_pdf, password="wrong")
+        manager.add_pdf(encrypted_pdf, [2, 3], password="secret")
+        manager.save_as(str(tmp_path / "out.pdf"))
+
+    # The password is remembered, so later sessions open the file without it.
+    with PdfManager(sources=sources) as manager:
+        manager.add_pdf(encrypted_pdf)
+        assert len(manager.pages) == 20
+    reader = PdfReader(str(tmp_path / "out.pdf"))
+    assert not reader.is_encrypted
+    assert [page.get_contents().get_data() for page in reader.pages] == [b"0 0 m 2 10 l S\n", b"0 0 m 3 10 l S\n"]
+
+
+def test_decrypted_streams_are_reused(encrypted_pdf):
+    sources = SourcePool()
+    reader, _ = sources.get(encrypted_pdf, password="secret")
+    contents = reader.pages[0].raw_get("/Contents")
+    assert reader.pages[0].get_contents().get_data() == b"0 0 m 0 10 l S\n"
+    key = reader._encryption._source + (contents.idnum, contents.generation)
+    assert sources.decrypted.get(key) == b"0 0 m 0 10 l S\n"
+
+    # A source parsed again takes its streams from the cache instead of decrypting them.
+    sources.decrypted.put(key, b"0 0 m 99 10 l S\n")
+    del reader, contents
+    gc.collect()
+    reader, parsed = sources.get(encrypted_pdf)
+    assert parsed
+    assert reader.pages[0].get_contents().get_data() == b"0 0 m 99 10 l S\n"
+
+
+def test_decrypted_streams_stay_within_budget(encrypted_pdf):
+    sources = SourcePool(max_decrypted_bytes=100)
+    reader, _ = sources.get(encrypted_pdf, password="secret")
+    for page in reader.pages:
+        page.get_contents().get_data()
+    assert 0 < sources.decrypted.size <= 100
+
+    sources = SourcePool()
+    assert sources.decrypt_streams(encrypted_pdf, max_workers=1) >= 20
+    assert sources.decrypt_streams(encrypted_pdf, max_workers=1) == 0
@@ -0,0 +1,88 @@
+import json, threading
+import pytest
+from profiling import Profiler, profiled
+
+class Job:
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    @profiled
+    def run(self, pages):
+        self.profiler.count("pages", pages)
+        return pages
+
+@pytest.fixture
+def enabled_profiler():
+    profiler = Profiler(enabled=True)
+    yield profiler
+    profiler.close()
+
+
+def test_disabled_records_nothing():
+    profiler = Profiler()
+    assert not profiler.enabled
+    assert Job(profiler).run(3) == 3
+    assert profiler.records == []
+
+
+def test_records_operation_metrics(enabled_profiler):
+    Job(enabled_profiler).run(3)
+    record, = enabled_profiler.records
+    assert record["op"] == "run"
+    assert record["pages"] == 3
+    assert record["wall_time"] >= 0
+    assert record["tracemalloc_peak"] >= 0
+
+
+def test_nested_operations(enabled_profiler):
+    with enabled_profiler.operation("action", label="Save As"):
+        Job(enabled_profiler).run(2)
+
+    inner, outer = enabled_profiler.records
+    assert (inner["op"], inner["depth"]) == ("run", 1)
+    assert (outer["op"], outer["depth"], outer["label"]) == ("action", 0, "Save As")
+    assert outer["tracemalloc_peak"] >= inner["tracemalloc_peak"]
+
+
+def test_export_json_lines(enabled_profiler, tmp_path):
+    Job(enabled_profiler).run(1)
+    Job(enabled_profiler).run(2)
+    path = enabled_profiler.export(tmp_path / "metrics.jsonl")
+
+    with open(path) as file:
+        records = [json.loads(line) for line in file]
+    assert [r["pages"] for r in records] == [1, 2]
+
+
+def test_export_cprofile(tmp_path):
+    path = str(tmp_path / "job.prof")
+    profiler = Profiler(path)
+    Job(profiler).run(1)
+    profiler.close()
+
+    import pstats
+    assert pstats.Stats(path).total_calls > 0
+
+
+def test_threads_profile_separately(enabled_profiler):
+    errors = []
+
+    def work():
+        try:
+            for _ in range(50):
+                with enabled_profiler.operation("action"):
+                    Job(enabled_profiler).run(1)
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+    summary = enabled_profiler.summary()
+    assert summary["run"]["calls"] == summary["run"]["pages"] == 400
+    assert {record["depth"] for record in enabled_profiler.records if record["op"] == "run"} == {1}
+    assert {record["depth"] for record in enabled_profiler.records if record["op"] == "action"} == {0}
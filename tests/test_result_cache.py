@@ -0,0 +1,61 @@
+import os
+from result_cache import ResultCache
+
+
+def write_file(path, data):
+    with open(path, "wb") as file:
+        file.write(data)
+    return str(path)
+
+
+def test_put_and_get(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    output = write_file(tmp_path / "out.pdf", b"%PDF-1.3 output")
+    key = cache.key([b"job"])
+
+    assert cache.get(key) is None
+    cache.put(key, [output])
+    [cached] = cache.get(key)
+    with open(cached, "rb") as file:
+        assert file.read() == b"%PDF-1.3 output"
+    assert cache.key([b"jo", b"b"]) != key
+
+
+def test_source_digest_follows_content(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    source = write_file(tmp_path / "a.pdf", b"one")
+    copy = write_file(tmp_path / "b.pdf", b"one")
+    digest = cache.source_digest(source)
+
+    assert cache.source_digest(copy) == digest
+    assert ResultCache(cache.directory).source_digest(source) == digest
+    write_file(source, b"two")
+    os.utime(source, ns=(1, 1))
+    assert cache.source_digest(source) != digest
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=25)
+    output = write_file(tmp_path / "out.pdf", b"x" * 10)
+    for name in (b"a", b"b"):
+        cache.put(cache.key([name]), [output])
+    assert cache.get(cache.key([b"a"])) is not None
+    os.utime(os.path.join(cache.directory, cache.key([b"b"]), "manifest.json"), ns=(1, 1))
+
+    cache.put(cache.key([b"c"]), [output])
+    assert cache.get(cache.key([b"b"])) is None
+    assert cache.get(cache.key([b"a"])) is not None
+    assert cache.get(cache.key([b"c"])) is not None
+
+
+def test_verify_drops_corrupt_entries(tmp_path):
+    output = write_file(tmp_path / "out.pdf", b"output")
+    cache = ResultCache(str(tmp_path / "cache"), verify=True)
+    key = cache.key([b"job"])
+    cache.put(key, [output])
+    [cached] = cache.get(key)
+
+    write_file(cached, b"outpux")
+    assert ResultCache(cache.directory).get(key) is not None
+    assert cache.get(key) is None
+    assert not os.path.exists(os.path.dirname(cached))
@@ -0,0 +1,27 @@
+import io
+from pypdf import PdfReader
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+from shard import write_sharded
+
+
+def test_shards_share_source_objects(blank_writer):
+    writer = blank_writer(4)
+    font = writer._add_object(DictionaryObject({NameObject("/Type"): NameObject("/Font")}))
+    for i, page in enumerate(writer.pages):
+        content = DecodedStreamObject()
+        content.set_data(f"BT /F1 12 Tf (page {i}) Tj ET".encode())
+        page[NameObject("/Contents")] = writer._add_object(content)
+        page[NameObject("/Resources")] = DictionaryObject(
+            {NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})})
+    source = io.BytesIO()
+    writer.write(source)
+    reader = PdfReader(source)
+
+    stream = io.BytesIO()
+    write_sharded([reader.pages[:2], reader.pages[2:]], stream, readers={"source.pdf": reader})
+
+    assert stream.getvalue().count(b"/Type /Font") == 1
+    pages = PdfReader(stream).pages
+    assert [page.mediabox.width for page in pages] == [100, 101, 102, 103]
+    assert pages[3].get_contents().get_data() == b"BT /F1 12 Tf (page 3) Tj ET"
+    assert pages[3]["/Resources"]["/Font"]["/F1"] == pages[0]["/Resources"]["/Font"]["/F1"]
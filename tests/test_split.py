@@ -0,0 +1,27 @@
+import os
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import DecodedStreamObject, NameObject
+from split import write_parts
+
+
+def test_write_parts_stays_under_max_bytes(tmp_path):
+    writer = PdfWriter()
+    for i in range(10):
+        page = writer.add_blank_page(100, 200)
+        content = DecodedStreamObject()
+        content.set_data(b"0 0 m 10 10 l S\n" * 60)
+        page[NameObject("/Contents")] = writer._add_object(content)
+
+    paths = write_parts(list(writer.pages), str(tmp_path), max_bytes=4000)
+    assert len(paths) > 1
+    assert all(os.path.getsize(path) <= 4000 for path in paths)
+    assert sum(len(PdfReader(path).pages) for path in paths) == 10
+
+
+def test_write_parts_gives_oversized_page_its_own_pdf(tmp_path):
+    writer = PdfWriter()
+    for i in range(2):
+        writer.add_blank_page(100, 200)
+
+    paths = write_parts(list(writer.pages), str(tmp_path), max_bytes=10)
+    assert [len(PdfReader(path).pages) for path in paths] == [1, 1]
@@ -0,0 +1,39 @@
+import pytest
+from pypdf import PdfWriter
+from pypdf.generic import NameObject, NumberObject
+from impose import page_to_xobject
+from stamp import Stamper, display_matrix
+
+@pytest.fixture
+def doc():
+    doc = PdfWriter()
+    for _ in range(2):
+        doc.add_blank_page(100, 200)
+    return doc
+
+
+def test_display_matrix_rotated(doc):
+    page = doc.pages[0]
+    page[NameObject("/Rotate")] = NumberObject(90)
+    (a, b, c, d, e, f), shown = display_matrix(page)
+    assert shown == (200, 100)
+    # The top-left corner as shown is the page's bottom-left corner.
+    assert (a*0 + c*100 + e, b*0 + d*100 + f) == (0, 0)
+
+
+def test_stamper_shares_objects(doc):
+    stamp_page = PdfWriter().add_blank_page(50, 50)
+    stamper = Stamper(doc)
+    xobject = doc._add_object(page_to_xobject(stamp_page))
+    for page in doc.pages:
+        stamper.stamp(page, stamp_page, xobject)
+        stamper.text(page, "CONFIDENTIAL")
+
+    first, second = doc.pages
+    assert first["/Contents"] == second["/Contents"]
+    assert first["/Resources"]["/XObject"].raw_get("/Stamp0") == xobject
+    fonts = [page["/Resources"]["/Font"].raw_get("/Stamp0") for page in doc.pages]
+    assert fonts[0] == fonts[1]
+
+    stamper.text(second, "PAGE 2")
+    assert first["/Contents"][-1] != second["/Contents"][-1]
@@ -0,0 +1,65 @@
+import pytest
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, NameObject
+from pdf import PdfManager
+from pool import SourcePool
+from profiling import Profiler
+from xref_cache import XrefCache, XrefReader
+
+
+@pytest.fixture
+def damaged_pdf(tmp_path):
+    path = str(tmp_path / "damaged.pdf")
+    writer = PdfWriter()
+    for i in range(5):
+        page = writer.add_blank_page(100, 200)
+        content = DecodedStreamObject()
+        content.set_data(b"0 0 m %d 10 l S\n" % i)
+        page[NameObject("/Contents")] = writer._add_object(content)
+    writer.write(path)
+
+    # A comment after the header shifts every object, so none is where the table says.
+    with open(path, "rb") as file:
+        data = file.read()
+    header = data.index(b"\n") + 1
+    with open(path, "wb") as file:
+        file.write(data[:header] + b"%shifted\n" + data[header:])
+    return path
+
+
+def test_rebuilt_table_is_reused(damaged_pdf, tmp_path):
+    xrefs = XrefCache(str(tmp_path / "xrefs"))
+    first = XrefReader(damaged_pdf, xrefs=xrefs)
+    assert first.xref_repaired and not first.xref_restored
+
+    second = XrefReader(damaged_pdf, xrefs=xrefs)
+    assert second.xref_restored and not second.xref_repaired
+    assert second.xref == first.xref
+    assert [page.get_contents().get_data() for page in second.pages] == \
+           [b"0 0 m %d 10 l S\n" % i for i in range(5)]
+
+
+def test_stale_table_is_rebuilt(damaged_pdf, tmp_path):
+    xrefs = XrefCache(str(tmp_path / "xrefs"))
+    reader = XrefReader(damaged_pdf, xrefs=xrefs)
+    with open(damaged_pdf, "rb") as file:
+        key = xrefs.fingerprint(file.read())
+    entry = xrefs.get(key)
+    entry["xref"] = [[generation, idnum, offset + 1] for generation, idnum, offset in entry["xref"]]
+    xrefs.put(key, entry)
+
+    reader = XrefReader(damaged_pdf, xrefs=xrefs)
+    assert reader.xref_repaired and not reader.xref_restored
+    assert len(reader.pages) == 5
+
+
+def test_manager_counts_repairs(damaged_pdf, tmp_path):
+    xrefs = XrefCache(str(tmp_path / "xrefs"))
+    profiler = Profiler(enabled=True)
+    for _ in range(2):
+        with PdfManager(profiler=profiler, sources=SourcePool(xrefs=xrefs)) as manager:
+            manager.add_pdf(damaged_pdf)
+            manager.save_as(str(tmp_path / "out.pdf"))
+    summary = profiler.summary()["add_pdf"]
+    assert summary["xref_repairs"] == 1
+    assert summary["xref_restores"] == 1